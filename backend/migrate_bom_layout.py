@@ -0,0 +1,26 @@
+"""Move comprehensive BOM rows between the embedded and bom_lines layouts.
+
+Usage: python migrate_bom_layout.py [--to lines|embedded] [--batch-size N]
+
+Set BOM_STORAGE_LAYOUT to the same layout so new BOMs are created in it. The
+API serves both layouts while this runs. A BOM edited while it is being moved
+is skipped; run the command again to pick it up. Run one copy at a time.
+"""
+import argparse
+import asyncio
+
+from server import client, migrate_bom_layout
+
+async def main(layout, batch_size):
+    try:
+        moved, skipped = await migrate_bom_layout(layout, batch_size)
+        print(f"✅ {moved} BOMs moved to the {layout} layout, {skipped} skipped")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--to", dest="layout", choices=["lines", "embedded"], default="lines")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.layout, args.batch_size))
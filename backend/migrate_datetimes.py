@@ -0,0 +1,28 @@
+"""Convert legacy ISO-string created_at/updated_at values to BSON dates.
+
+Usage: python migrate_datetimes.py [--batch-size N] [collection ...]
+
+With no collection names every static collection and every dynamic_* master
+is migrated. The API keeps serving both representations while this runs, and
+the command can be interrupted and re-run; progress is checkpointed per
+collection in the migrations collection.
+"""
+import argparse
+import asyncio
+
+from server import client, datetime_migration_targets, migrate_datetime_fields
+
+async def main(collection_names, batch_size):
+    try:
+        for collection_name in collection_names or await datetime_migration_targets():
+            converted = await migrate_datetime_fields(collection_name, batch_size)
+            print(f"✅ {collection_name}: {converted} documents converted")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("collections", nargs="*")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.collections, args.batch_size))
@@ -1,28 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
 from fastapi import status as http_status
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pymongo import InsertOne, UpdateOne, ReplaceOne, DeleteMany, ReturnDocument
+from pymongo.errors import OperationFailure, BulkWriteError
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, create_model
+from typing import Any, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
 import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import numpy as np
+import pandas as pd
 import io
+import csv
+import tempfile
+import asyncio
+import multiprocessing
+import re
+import queue
+import hashlib
+import math
+import time
+import json
+import copy
+import base64
+import socket
+from email.utils import format_datetime, parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache, partial
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Security
@@ -30,6 +54,78 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('SECRET_KEY', 'garment-manufacturing-secret-key-change-in-production')
 ALGORITHM = "HS256"
+ACCESS_TOKEN_LIFETIME = timedelta(days=7)
+# When enabled, get_current_user trusts the signed id/username/role claims and
+# only consults the in-process revocation filter instead of loading the user.
+STATELESS_AUTH = os.environ.get('STATELESS_AUTH', 'true').lower() == 'true'
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '15'))
+# Each refresh re-reads this much before the previous one started, to catch
+# revocations stamped by other workers' clocks or inserted late
+REVOCATION_REFRESH_OVERLAP_SECONDS = float(os.environ.get('REVOCATION_REFRESH_OVERLAP_SECONDS', '60'))
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', '64'))
+
+# List pagination
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '200'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
+
+# Master data cache
+MASTER_CACHE_MAX_BYTES = int(os.environ.get('MASTER_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+MASTER_CACHE_CHANGE_STREAM = os.environ.get('MASTER_CACHE_CHANGE_STREAM', 'false').lower() == 'true'
+# Upper bound on an entry's age, for writes that bypass collection_changed
+MASTER_CACHE_TTL_SECONDS = float(os.environ.get('MASTER_CACHE_TTL_SECONDS', '300'))
+# How long a worker trusts its copy of another worker's collection version
+COLLECTION_VERSION_TTL_SECONDS = float(os.environ.get('COLLECTION_VERSION_TTL_SECONDS', '2'))
+COALESCE_GET_REQUESTS = os.environ.get('COALESCE_GET_REQUESTS', 'true').lower() == 'true'
+# Event loop lag sampling, off by default since it wakes the loop every
+# LOOP_MONITOR_INTERVAL; a tick later than LOOP_STALL_MS counts as a stall
+LOOP_MONITOR = os.environ.get('LOOP_MONITOR', 'false').lower() == 'true'
+LOOP_MONITOR_INTERVAL = float(os.environ.get('LOOP_MONITOR_INTERVAL', '0.05'))
+LOOP_STALL_MS = float(os.environ.get('LOOP_STALL_MS', '20'))
+
+# Bulk import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '1000'))
+# Leave unset only on a single host: jobs spooled to a local tempdir can't be taken over elsewhere
+IMPORT_SPOOL_DIR = os.environ.get('IMPORT_SPOOL_DIR') or None
+UPLOAD_READ_BYTES = 1024 * 1024
+# Parser processes per API worker, and parsed chunks buffered between them
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '2'))
+IMPORT_QUEUE_CHUNKS = int(os.environ.get('IMPORT_QUEUE_CHUNKS', '4'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+IMPORT_JOB_LEASE = timedelta(seconds=int(os.environ.get('IMPORT_JOB_LEASE_SECONDS', '60')))
+IMPORT_JOB_POLL_SECONDS = float(os.environ.get('IMPORT_JOB_POLL_SECONDS', '2'))
+# Inserted and updated rows a dry run reports in full
+IMPORT_PREVIEW_SAMPLES = int(os.environ.get('IMPORT_PREVIEW_SAMPLES', '20'))
+# Resumable uploads: staged under IMPORT_SPOOL_DIR, which every API worker must share
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(1024 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.environ.get('UPLOAD_CHUNK_MAX_BYTES', str(16 * 1024 * 1024)))
+# A chunk's lock is renewed while its bytes arrive; a body stalled for
+# UPLOAD_READ_TIMEOUT_SECONDS is dropped, which must be well inside the lock
+UPLOAD_CHUNK_LOCK = timedelta(seconds=int(os.environ.get('UPLOAD_CHUNK_LOCK_SECONDS', '60')))
+UPLOAD_READ_TIMEOUT_SECONDS = float(os.environ.get('UPLOAD_READ_TIMEOUT_SECONDS', '20'))
+UPLOAD_SESSION_TTL = timedelta(hours=float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24')))
+UPLOAD_CLEANUP_SECONDS = float(os.environ.get('UPLOAD_CLEANUP_SECONDS', '300'))
+# Columns identifying "the same fabric" when re-importing FABRIC MASTER DATA
+FABRIC_NATURAL_KEY = [name.strip() for name in os.environ.get(
+    'FABRIC_NATURAL_KEY', 'item_type,count_const,fabric_name,color').split(',') if name.strip()]
+
+# Fabric requirements: greige = ready × process-loss factor of the fabric's
+# item type, e.g. FABRIC_PROCESS_LOSS="DYED=1.08,GREIGE=1.0"
+FABRIC_PROCESS_LOSS_DEFAULT = float(os.environ.get('FABRIC_PROCESS_LOSS_DEFAULT', '1.05'))
+FABRIC_PROCESS_LOSS = {
+    item_type.strip().upper(): float(factor)
+    for item_type, factor in (pair.split('=', 1) for pair in os.environ.get('FABRIC_PROCESS_LOSS', '').split(',') if '=' in pair)
+}
+# Times a BOM patch is re-read and retried when other parts of the BOM were
+# written between its read and its write
+BOM_PATCH_RETRIES = int(os.environ.get('BOM_PATCH_RETRIES', '5'))
+# Where new comprehensive BOMs keep their rows: "embedded" in the BOM document
+# or "lines" in bom_lines (see BOM line storage). Existing BOMs are moved
+# between layouts with migrate_bom_layout.py.
+BOM_STORAGE_LAYOUT = os.environ.get('BOM_STORAGE_LAYOUT', 'embedded')
+BOM_LINES_LOCK = timedelta(seconds=int(os.environ.get('BOM_LINES_LOCK_SECONDS', '30')))
 
 # Create the main app
 app = FastAPI()
@@ -171,6 +267,7 @@ class Fabric(BaseModel):
     final_item: str
     avg_roll_size: Optional[str] = None
     unit: str
+    price_per_unit: Optional[float] = None  # Costs the fabric rows of comprehensive BOMs
     image_url: Optional[str] = None  # New field for image
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -186,6 +283,7 @@ class FabricCreate(BaseModel):
     final_item: str
     avg_roll_size: Optional[str] = None
     unit: str
+    price_per_unit: Optional[float] = None
     image_url: Optional[str] = None  # New field for image
 
 # BOM Models
@@ -216,6 +314,22 @@ class BOMCreate(BaseModel):
     color_id: str
     items: List[BOMItem]
 
+class BOMPatchOperation(BaseModel):
+    # set: a header field, a table field (no row_id) or a row cell
+    op: str = Field(pattern="^(set|insert_row|delete_row|reorder_rows)$")
+    section: str = Field(pattern="^(header|fabric|trims|operations)$")
+    table_id: Optional[int] = None  # fabric and trims tables
+    row_id: Optional[str] = None
+    field: Optional[str] = None
+    value: Any = None
+    row: Optional[dict] = None  # insert_row
+    position: Optional[int] = None  # insert_row; appends when left out
+    row_ids: Optional[List[str]] = None  # reorder_rows: every row of the table, in its new order
+
+class BOMPatch(BaseModel):
+    version: int = Field(ge=0)  # version of the BOM the edits were made on
+    operations: List[BOMPatchOperation] = Field(min_length=1)
+
 # MRP Models
 class MRPMaterialRequirement(BaseModel):
     material_id: str
@@ -246,13 +360,183 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)):
+class PasswordHashPool:
+    """Bounded worker pool for bcrypt work with an admission limit.
+
+    At most `workers` hashes run at once and at most `queue_size` more wait
+    for a worker; anything beyond that is turned away with 503 so a login
+    storm cannot build an unbounded backlog.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.pending = 0
+        self.rejected = 0
+        self.avg_seconds = 0.25
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.pending / self.workers * self.avg_seconds))
+
+    async def run(self, func, *args):
+        # Only touched from the event loop thread, so a plain counter is safe
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.avg_seconds = 0.9 * self.avg_seconds + 0.1 * (time.perf_counter() - start)
+
+password_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+def create_access_token(data: dict, expires_delta: timedelta = ACCESS_TOKEN_LIFETIME):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + expires_delta
+    # Sub-second iat so a token minted right after a revocation is not caught by it
+    to_encode.update({"exp": expire, "iat": now.timestamp(), "jti": str(uuid.uuid4())})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_token_claims(user: User) -> dict:
+    """Claims that let get_current_user rebuild the User without a DB read"""
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "username": user.username,
+        "role": user.role,
+        "created_at": user.created_at.isoformat()
+    }
+
+class BloomFilter:
+    """Fixed-size bloom filter using double hashing over a blake2b digest"""
+
+    def __init__(self, capacity: int = 10000, error_rate: float = 0.001):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class RevocationFilter:
+    """In-process view of the token_revocations collection.
+
+    Entries are keyed either "jti:<token id>" (a single logged-out token) or
+    "user:<user id>" (every token issued to that user before revoked_at, used
+    after a role change). The bloom filter answers the common "not revoked"
+    case; the exact map is only consulted on a bloom hit.
+
+    Only refresh moves its watermark, and it looks back an overlap before it,
+    so local revocations and other workers' clocks can't make it skip one.
+    Refresh also forgets revocations older than the token lifetime: every
+    token they apply to has expired.
+    """
+
+    def __init__(self, capacity: int = 10000, overlap: float = REVOCATION_REFRESH_OVERLAP_SECONDS,
+                 lifetime: float = ACCESS_TOKEN_LIFETIME.total_seconds()):
+        self.initial_capacity = capacity
+        self.capacity = capacity
+        self.overlap = overlap
+        self.lifetime = lifetime
+        self.bloom = BloomFilter(capacity)
+        self.entries = {}
+        self.refreshed_at = None
+
+    def rebuild(self, capacity: int):
+        self.capacity = capacity
+        self.bloom = BloomFilter(capacity)
+        for key in self.entries:
+            self.bloom.add(key)
+
+    def add(self, key: str, revoked_at: float):
+        if len(self.entries) >= self.capacity:
+            # Grow by rebuilding; revocations are rare so this stays cheap
+            self.rebuild(self.capacity * 2)
+        self.entries[key] = max(revoked_at, self.entries.get(key, 0.0))
+        self.bloom.add(key)
+
+    def expire(self, now: float):
+        """Drop revocations older than the token lifetime and shrink the bloom filter to what remains"""
+        cutoff = now - self.lifetime
+        expired = [key for key, revoked_at in self.entries.items() if revoked_at < cutoff]
+        if not expired:
+            return
+        for key in expired:
+            del self.entries[key]
+        capacity = self.initial_capacity
+        while capacity <= len(self.entries):
+            capacity *= 2
+        self.rebuild(capacity)
+
+    def is_revoked(self, jti: Optional[str], user_id: Optional[str], issued_at: float) -> bool:
+        if jti:
+            key = f"jti:{jti}"
+            if key in self.bloom and key in self.entries:
+                return True
+        if user_id:
+            key = f"user:{user_id}"
+            if key in self.bloom and issued_at <= self.entries.get(key, -1.0):
+                return True
+        return False
+
+    async def refresh(self):
+        """Pull revocations made since shortly before the previous refresh"""
+        started = time.time()
+        query = {} if self.refreshed_at is None else {"revoked_at": {"$gt": self.refreshed_at - self.overlap}}
+        cursor = db.token_revocations.find(query, {"_id": 0, "key": 1, "revoked_at": 1})
+        async for entry in cursor:
+            self.add(entry["key"], entry["revoked_at"])
+        self.expire(started)
+        self.refreshed_at = started
+
+revocations = RevocationFilter()
+
+async def revoke(key: str):
+    revoked_at = time.time()
+    await db.token_revocations.insert_one({
+        "key": key,
+        "revoked_at": revoked_at,
+        "expires_at": datetime.now(timezone.utc) + ACCESS_TOKEN_LIFETIME
+    })
+    revocations.add(key, revoked_at)
+
+async def revocation_refresh_loop():
+    while True:
+        try:
+            await revocations.refresh()
+        except Exception as e:
+            logger.warning(f"Revocation refresh failed: {str(e)}")
+        await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+
+def is_token_revoked(payload: dict) -> bool:
+    return revocations.is_revoked(payload.get("jti"), payload.get("uid"), float(payload.get("iat", 0)))
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
@@ -260,15 +544,803 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         email = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        user_id = payload.get("uid")
+        if is_token_revoked(payload):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        if STATELESS_AUTH and user_id and payload.get("role"):
+            return User(
+                id=user_id,
+                username=payload["username"],
+                email=email,
+                role=payload["role"],
+                created_at=datetime.fromisoformat(payload["created_at"])
+            )
+        # Legacy tokens (sub only) or stateless mode disabled
         user = await db.users.find_one({"email": email}, {"_id": 0, "password": 0})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         return User(**user)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except (jwt.InvalidTokenError, KeyError, ValueError):
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_current_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        return jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def require_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return current_user
+
+# Index management
+# Declared indexes per collection. Every collection gets a unique index on the
+# application-level "id"; dynamic_* masters get theirs on first write. The
+# (created_at, id) index backs keyset pagination on the list endpoints.
+ID_INDEX = {"keys": [("id", 1)], "unique": True}
+KEYSET_INDEX = {"keys": [("created_at", 1), ("id", 1)]}
+
+def content_hash_index(natural_key: list) -> dict:
+    """Natural key plus content_hash, so upsert and dry-run lookups are covered by the index"""
+    return {"keys": [(name, 1) for name in natural_key] + [("content_hash", 1)]}
+
+INDEX_SPECS = {
+    "users": [ID_INDEX, {"keys": [("email", 1)], "unique": True}],
+    "buyers": [ID_INDEX, KEYSET_INDEX],
+    "suppliers": [ID_INDEX, KEYSET_INDEX],
+    "raw_materials": [ID_INDEX, KEYSET_INDEX, {"keys": [("code", 1)]}],
+    "colors": [ID_INDEX, KEYSET_INDEX, {"keys": [("code", 1)]}],
+    "sizes": [ID_INDEX, {"keys": [("sort_order", 1), ("id", 1)]}],
+    "articles": [ID_INDEX, KEYSET_INDEX, {"keys": [("code", 1)]}],
+    "fabrics": [ID_INDEX, KEYSET_INDEX, content_hash_index(FABRIC_NATURAL_KEY),
+                {"keys": [("final_item", 1)]}, {"keys": [("fabric_name", 1)]}],
+    "boms": [ID_INDEX, KEYSET_INDEX, {"keys": [("status", 1), ("created_at", 1), ("id", 1)]},
+             {"keys": [("total_cost", 1), ("id", 1)]}, {"keys": [("status", 1), ("total_cost", 1), ("id", 1)]}],
+    "comprehensive_boms": [
+        ID_INDEX, KEYSET_INDEX, {"keys": [("status", 1), ("created_at", 1), ("id", 1)]},
+        {"keys": [("total_cost", 1), ("id", 1)]}, {"keys": [("status", 1), ("total_cost", 1), ("id", 1)]},
+        {"keys": [("cost_per_piece", 1), ("id", 1)]}, {"keys": [("status", 1), ("cost_per_piece", 1), ("id", 1)]},
+        # Finds the BOMs to re-cost when a fabric changes
+        {"keys": [("fabricTables.items.fabricId", 1)]}, {"keys": [("fabricTables.items.fabricQuality", 1)]}
+    ],
+    "bom_lines": [
+        # Reassembly reads a BOM's lines in order; line writes find rows by rowId
+        {"keys": [("bom_id", 1), ("section", 1), ("table_id", 1), ("position", 1)]},
+        {"keys": [("bom_id", 1), ("rowId", 1)]},
+        # Line-level queries across BOMs, e.g. a fabric quality in one colour
+        {"keys": [("fabricQuality", 1), ("colourId", 1)]}, {"keys": [("colourId", 1)]},
+        {"keys": [("itemCode", 1)]}, {"keys": [("component", 1)]}, {"keys": [("fabricId", 1)]}
+    ],
+    "mrps": [ID_INDEX, KEYSET_INDEX],
+    "master_configurations": [ID_INDEX, KEYSET_INDEX],
+    "migrations": [ID_INDEX],
+    "collection_versions": [ID_INDEX],
+    "import_jobs": [
+        ID_INDEX,
+        {"keys": [("status", 1), ("lease_expires_at", 1)]},
+        {"keys": [("created_by", 1), ("created_at", 1)]}
+    ],
+    "upload_sessions": [ID_INDEX, {"keys": [("expires_at", 1)]}],
+    "token_revocations": [
+        {"keys": [("revoked_at", 1)]},
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0}
+    ]
+}
+
+DYNAMIC_INDEX_SPECS = [ID_INDEX, KEYSET_INDEX]
+
+ensured_dynamic_collections = set()
+
+def index_specs_for(collection_name: str) -> list:
+    if collection_name.startswith("dynamic_"):
+        return DYNAMIC_INDEX_SPECS
+    return INDEX_SPECS.get(collection_name, [])
+
+async def ensure_indexes(collection_name: str):
+    for spec in index_specs_for(collection_name):
+        options = {key: value for key, value in spec.items() if key != "keys"}
+        try:
+            await db[collection_name].create_index(spec["keys"], **options)
+        except OperationFailure as e:
+            # Usually pre-existing duplicates; keep serving and surface it in the audit
+            logger.warning(f"Could not create index {spec['keys']} on {collection_name}: {str(e)}")
+
+async def ensure_dynamic_indexes(config_id: str):
+    collection_name = f"dynamic_{config_id}"
+    if collection_name not in ensured_dynamic_collections:
+        await ensure_indexes(collection_name)
+        ensured_dynamic_collections.add(collection_name)
+
+async def bootstrap_indexes():
+    for collection_name in INDEX_SPECS:
+        await ensure_indexes(collection_name)
+    for collection_name in await db.list_collection_names(filter={"name": {"$regex": "^dynamic_"}}):
+        await ensure_indexes(collection_name)
+        ensured_dynamic_collections.add(collection_name)
+
+# Keyset pagination
+# Cursors are opaque base64 tokens holding the (sort value, id) of the last row
+# returned, so each page is an index range scan no matter how deep it is.
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, last_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["$date"])
+        return value, last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_query(query: dict, cursor: Optional[str], sort_field: str) -> dict:
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    # Rows missing the sort field sort first; $gt null would match nothing
+    greater = {sort_field: {"$ne": None}} if value is None else {sort_field: {"$gt": value}}
+    after = {"$or": [
+        greater,
+        {sort_field: value, "id": {"$gt": last_id}}
+    ]}
+    if isinstance(value, str):
+        # Until migrate_datetimes has run, legacy ISO strings sort before BSON
+        # dates and $gt only compares within a type, so add the dates explicitly
+        after["$or"].append({sort_field: {"$type": "date"}})
+    return {"$and": [query, after]} if query else after
+
+class ListParams:
+    """Query parameters shared by the list endpoints.
+
+    `limit`/`cursor` select a keyset page. `stream=true` or an
+    `Accept: application/x-ndjson` header switch to a streamed export of every
+    row from the cursor onwards instead.
+    """
+
+    def __init__(self, request: Request, response: Response,
+                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None, stream: bool = False):
+        self.request = request
+        self.response = response
+        self.limit = limit
+        self.cursor = cursor
+        self.ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+        self.stream = stream or self.ndjson
+
+async def load_page(collection, query: dict, limit: int, cursor: Optional[str] = None,
+                    sort_field: str = "created_at", projection: Optional[dict] = None):
+    """Fetch one page ordered by (sort_field, id); returns (docs, next_cursor)"""
+    docs = await collection.find(
+        keyset_query(query, cursor, sort_field),
+        projection or {"_id": 0}
+    ).sort([(sort_field, 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
+
+async def fetch_page(collection, query: dict, page: ListParams, sort_field: str = "created_at",
+                     projection: Optional[dict] = None, publish_cursor: bool = True) -> list:
+    """Fetch one page and publish its X-Next-Cursor header"""
+    docs, next_cursor = await load_page(collection, query, page.limit, page.cursor, sort_field, projection)
+    if next_cursor and publish_cursor:
+        page.response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def stream_documents(sources: list, page: ListParams, sort_field: str = "created_at",
+                     projection: Optional[dict] = None, expand=None) -> StreamingResponse:
+    """Stream every matching row as NDJSON or as one JSON array.
+
+    `sources` is a list of (collection, query, extra_fields) tuples streamed one
+    after another; a fourth item overrides `projection` for that source. Rows
+    are written as Motor hands them over, so memory stays at one cursor batch
+    however large the collection is. `expand`, if given, is awaited on each
+    batch of rows before it is written, to complete them in place.
+    """
+    def encode(docs: list, first: bool) -> str:
+        lines = [json.dumps(doc, default=json_default) for doc in docs]
+        if page.ndjson:
+            return "".join(line + "\n" for line in lines)
+        return ("" if first else ",") + ",".join(lines)
+
+    async def generate():
+        first = True
+        if not page.ndjson:
+            yield "["
+        for collection, query, extra_fields, *source_projection in sources:
+            cursor = collection.find(
+                keyset_query(query, page.cursor, sort_field),
+                (source_projection and source_projection[0]) or projection or {"_id": 0}
+            ).sort([(sort_field, 1), ("id", 1)]).batch_size(STREAM_BATCH_SIZE)
+            batch = []
+            async for doc in cursor:
+                doc.update(extra_fields)
+                batch.append(doc)
+                if expand is None or len(batch) >= STREAM_BATCH_SIZE:
+                    if expand is not None:
+                        await expand(batch)
+                    yield encode(batch, first)
+                    first, batch = False, []
+            if batch:
+                await expand(batch)
+                yield encode(batch, first)
+                first = False
+        if not page.ndjson:
+            yield "]"
+
+    media_type = "application/x-ndjson" if page.ndjson else "application/json"
+    return StreamingResponse(generate(), media_type=media_type)
+
+# Field selection
+# `?fields=name,code` turns into a Mongo projection so unused columns never
+# leave the database; responses are validated against a partial model.
+@lru_cache(maxsize=256)
+def partial_list_adapter(model, names: tuple) -> TypeAdapter:
+    partial = create_model(
+        f"{model.__name__}Fields",
+        __config__=ConfigDict(extra="ignore"),
+        **{name: (Optional[model.model_fields[name].annotation], None) for name in names}
+    )
+    return TypeAdapter(List[partial])
+
+class FieldSelection:
+    def __init__(self, names: tuple, model=None):
+        self.names = names
+        self.model = model
+
+    def projection(self, sort_field: Optional[str] = None) -> dict:
+        projection = {"_id": 0}
+        projection.update({name: 1 for name in self.names})
+        if sort_field:
+            # Needed to build the next-page cursor
+            projection[sort_field] = 1
+        return projection
+
+    def render(self, docs: list, page: ListParams) -> Response:
+        if self.model is None:
+            # Drop the sort field the projection added for the cursor
+            selected = [{name: doc[name] for name in self.names if name in doc} for doc in docs]
+            body = json.dumps(selected, default=json_default).encode()
+        else:
+            adapter = partial_list_adapter(self.model, self.names)
+            body = adapter.dump_json(adapter.validate_python(docs))
+        return Response(content=body, media_type="application/json", headers=dict(page.response.headers))
+
+def select_fields(fields: Optional[str], model=None) -> Optional[FieldSelection]:
+    """Parse a comma separated `fields` parameter; `id` is always included"""
+    if not fields:
+        return None
+    names = ["id"]
+    for name in (part.strip() for part in fields.split(",")):
+        if name and name not in names:
+            names.append(name)
+    if model is not None:
+        unknown = [name for name in names if name not in model.model_fields]
+    else:
+        # Dynamic masters are schemaless (bulk uploads keep sheet headers),
+        # so only reject names Mongo would read as operators or paths
+        unknown = [name for name in names if name.startswith("$") or "." in name]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return FieldSelection(tuple(names), model)
+
+# Master data cache
+class MasterCache:
+    """Read-through cache for master lists and documents, bounded by bytes.
+
+    List pages are stored as the already-serialized JSON body, so a hit skips
+    both the Mongo query and pydantic validation. Each collection has a
+    generation number that writes bump; a load that raced with a write is
+    not stored. Readers check the collection version first (see
+    CollectionVersions), which drops entries after another worker's write;
+    entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.stats = {}
+
+    def _stats(self, collection_name: str) -> dict:
+        return self.stats.setdefault(collection_name, {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+
+    def get(self, collection_name: str, key: tuple):
+        entry = self.entries.get((collection_name, key))
+        if entry is not None and entry[2] <= time.monotonic():
+            self.total_bytes -= self.entries.pop((collection_name, key))[1]
+            entry = None
+        if entry is None:
+            self._stats(collection_name)["misses"] += 1
+            return None
+        self.entries.move_to_end((collection_name, key))
+        self._stats(collection_name)["hits"] += 1
+        return entry[0]
+
+    def put(self, collection_name: str, key: tuple, value, size: int, generation: int):
+        if generation != self.generations.get(collection_name, 0) or size > self.max_bytes:
+            return
+        old = self.entries.pop((collection_name, key), None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        self.entries[(collection_name, key)] = (value, size, time.monotonic() + self.ttl)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            (evicted_collection, _), (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self._stats(evicted_collection)["evictions"] += 1
+
+    def generation(self, collection_name: str) -> int:
+        return self.generations.get(collection_name, 0)
+
+    def invalidate(self, collection_name: str):
+        self.generations[collection_name] = self.generation(collection_name) + 1
+        self._stats(collection_name)["invalidations"] += 1
+        for cache_key in [cache_key for cache_key in self.entries if cache_key[0] == collection_name]:
+            self.total_bytes -= self.entries.pop(cache_key)[1]
+
+    def snapshot(self) -> dict:
+        entries = {}
+        for collection_name, _ in self.entries:
+            entries[collection_name] = entries.get(collection_name, 0) + 1
+        return {
+            "max_bytes": self.max_bytes,
+            "total_bytes": self.total_bytes,
+            "collections": {
+                name: {**stats, "entries": entries.get(name, 0)} for name, stats in self.stats.items()
+            }
+        }
+
+master_cache = MasterCache(MASTER_CACHE_MAX_BYTES, MASTER_CACHE_TTL_SECONDS)
+
+# Collections served through the cache, with their response model and sort key
+CACHED_MASTERS = {
+    "buyers": (Buyer, "created_at"),
+    "colors": (Color, "created_at"),
+    "sizes": (Size, "sort_order"),
+    "articles": (Article, "created_at"),
+    "fabrics": (Fabric, "created_at")
+}
+
+@lru_cache(maxsize=None)
+def list_adapter(model) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+async def cached_master_list(collection_name: str, limit: int, cursor: Optional[str] = None,
+                             selection: Optional[FieldSelection] = None, headers: Optional[dict] = None) -> Response:
+    model, sort_field = CACHED_MASTERS[collection_name]
+    key = ("list", limit, cursor, selection.names if selection else None)
+    await collection_versions.get((collection_name,))
+    entry = master_cache.get(collection_name, key)
+    if entry is None:
+        generation = master_cache.generation(collection_name)
+        projection = selection.projection(sort_field) if selection else None
+        docs, next_cursor = await load_page(db[collection_name], {}, limit, cursor, sort_field, projection)
+        adapter = partial_list_adapter(model, selection.names) if selection else list_adapter(model)
+        body = adapter.dump_json(adapter.validate_python(docs))
+        entry = (body, next_cursor)
+        master_cache.put(collection_name, key, entry, len(body), generation)
+    body, next_cursor = entry
+    headers = dict(headers or {})
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def cached_master_document(collection_name: str, document_id: str) -> Optional[dict]:
+    key = ("doc", document_id)
+    await collection_versions.get((collection_name,))
+    doc = master_cache.get(collection_name, key)
+    if doc is None:
+        generation = master_cache.generation(collection_name)
+        doc = await db[collection_name].find_one({"id": document_id}, {"_id": 0})
+        if doc is None:
+            return None
+        master_cache.put(collection_name, key, doc, len(json.dumps(doc, default=json_default)), generation)
+    return dict(doc)
+
+async def warm_master_cache():
+    for collection_name in CACHED_MASTERS:
+        await cached_master_list(collection_name, DEFAULT_PAGE_SIZE)
+
+async def master_cache_change_listener():
+    """Invalidate on writes made by other workers (requires a replica set)"""
+    pipeline = [{"$match": {"ns.coll": {"$in": list(CACHED_MASTERS)}}}]
+    while True:
+        try:
+            async with db.watch(pipeline) as stream:
+                async for change in stream:
+                    master_cache.invalidate(change["ns"]["coll"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Master cache change stream failed: {str(e)}")
+            # Anything may have changed while the stream was down
+            for collection_name in CACHED_MASTERS:
+                master_cache.invalidate(collection_name)
+            await asyncio.sleep(5)
+
+# Collection versions and conditional GET
+class CollectionVersions:
+    """Per-collection write counters persisted in collection_versions.
+
+    Every API write bumps its collection's version. Conditional GETs compare
+    the client's ETag against these stamps before touching the data, using a
+    local copy refreshed at most every COLLECTION_VERSION_TTL_SECONDS. A
+    refresh that finds a new version, i.e. a write made by another worker,
+    drops the collection's cached reads so they aren't served under the new
+    tag. updated_at moves forward by at least a second on every bump, so
+    Last-Modified, which has whole seconds, changes with each write.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.cache = {}
+
+    async def get(self, collection_names: tuple) -> list:
+        now = time.monotonic()
+        stale = [name for name in collection_names if now - self.cache.get(name, (0, None, -self.ttl - 1))[2] > self.ttl]
+        if stale:
+            found = {}
+            async for doc in db.collection_versions.find({"id": {"$in": stale}}, {"_id": 0}):
+                found[doc["id"]] = doc
+            for name in stale:
+                doc = found.get(name)
+                if doc is None:
+                    doc = await self.seed(name)
+                previous = self.cache.get(name)
+                if name in CACHED_MASTERS and (previous is None or previous[0] != doc["version"]):
+                    master_cache.invalidate(name)
+                self.cache[name] = (doc["version"], doc["updated_at"], now)
+        return [self.cache[name][:2] for name in collection_names]
+
+    async def seed(self, collection_name: str) -> dict:
+        return await db.collection_versions.find_one_and_update(
+            {"id": collection_name},
+            {"$setOnInsert": {"version": 0, "updated_at": datetime.now(timezone.utc).replace(microsecond=0)}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def bump(self, collection_name: str):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        doc = await db.collection_versions.find_one_and_update(
+            {"id": collection_name},
+            [{"$set": {
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+                # A second write within the same second still moves Last-Modified
+                "updated_at": {"$max": [now, {"$add": [{"$ifNull": ["$updated_at", now]}, 1000]}]}
+            }}],
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.cache[collection_name] = (doc["version"], doc["updated_at"], time.monotonic())
+
+collection_versions = CollectionVersions(COLLECTION_VERSION_TTL_SECONDS)
+
+async def collection_changed(*collection_names: str):
+    """Call after any write: drops cached reads and bumps the ETag version"""
+    for collection_name in collection_names:
+        if collection_name in CACHED_MASTERS:
+            master_cache.invalidate(collection_name)
+        await collection_versions.bump(collection_name)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def not_modified_since(request: Request, last_modified: datetime) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or request.headers.get("if-none-match"):
+        return False
+    try:
+        return last_modified <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+async def conditional_list(page: ListParams, *collection_names: str) -> Optional[Response]:
+    """Stamp a list response with ETag/Last-Modified, or answer 304 outright.
+
+    The ETag combines the versions of the collections behind the listing with
+    a hash of the query string, so each page, field selection and format has
+    its own tag.
+    """
+    stamps = await collection_versions.get(collection_names)
+    variant = hashlib.blake2b(
+        f"{page.request.url.query}|{page.ndjson}".encode(), digest_size=6
+    ).hexdigest()
+    etag = 'W/"' + ".".join(str(version) for version, _ in stamps) + f'-{variant}"'
+    last_modified = max(updated_at for _, updated_at in stamps)
+    headers = {"ETag": etag, "Last-Modified": format_datetime(last_modified, usegmt=True)}
+    if etag_matches(page.request, etag) or not_modified_since(page.request, last_modified):
+        return Response(status_code=304, headers=headers)
+    page.response.headers.update(headers)
+    return None
+
+def document_etag(doc: dict) -> str:
+    raw = json.dumps(doc, sort_keys=True, default=json_default).encode()
+    return '"' + hashlib.blake2b(raw, digest_size=16).hexdigest() + '"'
+
+def conditional_document(request: Request, response: Response, doc: dict) -> Optional[Response]:
+    """Per-document ETag from a content hash; 304 when the client has it"""
+    etag = document_etag(doc)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+# Spreadsheet export
+# Rows come off a Motor cursor in batches. CSV is encoded and streamed batch
+# by batch; XLSX goes through openpyxl's write-only mode, which spools each
+# sheet to a temp file, and the finished file is streamed from disk.
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8"
+}
+ILLEGAL_SHEET_TITLE = re.compile(r"[\\/*?:\[\]]")
+
+def export_cell(value):
+    if isinstance(value, datetime):
+        # Excel has no time zones; exports are in UTC
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=json_default)
+    return value
+
+def xlsx_cell(value):
+    value = export_cell(value)
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value
+
+async def cursor_batches(cursor, columns: list):
+    batch = []
+    async for doc in cursor:
+        batch.append([doc.get(column) for column in columns])
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def list_batches(items: list, columns: list):
+    for start in range(0, len(items), STREAM_BATCH_SIZE):
+        yield [[item.get(column) for column in columns] for item in items[start:start + STREAM_BATCH_SIZE]]
+
+def item_columns(items: list) -> list:
+    """Keys of a list of row dicts, in order of first appearance"""
+    columns = {}
+    for item in items:
+        columns.update(dict.fromkeys(item))
+    return list(columns)
+
+def sheet_title(title: str, used: set) -> str:
+    base = ILLEGAL_SHEET_TITLE.sub(" ", str(title)).strip()[:31] or "Sheet"
+    candidate, suffix = base, 2
+    while candidate.lower() in used:
+        candidate = f"{base[:31 - len(str(suffix)) - 1]} {suffix}"
+        suffix += 1
+    used.add(candidate.lower())
+    return candidate
+
+async def csv_stream(headers: list, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens it as UTF-8; the CSV importer strips it again
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+    async for batch in batches:
+        writer.writerows([export_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def append_rows(sheet, batch: list):
+    for row in batch:
+        sheet.append([xlsx_cell(value) for value in row])
+
+async def write_xlsx(sheets: list) -> str:
+    loop = asyncio.get_running_loop()
+    workbook = openpyxl.Workbook(write_only=True)
+    fd, path = tempfile.mkstemp(suffix=".xlsx", dir=IMPORT_SPOOL_DIR)
+    os.close(fd)
+    try:
+        used = set()
+        for title, headers, batches in sheets:
+            sheet = workbook.create_sheet(sheet_title(title, used))
+            sheet.append(headers)
+            async for batch in batches:
+                # Cell conversion and XML writing stay off the event loop
+                await loop.run_in_executor(None, append_rows, sheet, batch)
+        await loop.run_in_executor(None, workbook.save, path)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+async def export_response(filename: str, file_format: str, sheets: list) -> Response:
+    """Send [(title, headers, async batches of rows)] as one xlsx or csv file.
+
+    CSV holds a single table, so only the first sheet is written.
+    """
+    filename = re.sub(r"[^\w.-]+", "_", filename)
+    if file_format == "csv":
+        title, headers, batches = sheets[0]
+        return StreamingResponse(
+            csv_stream(headers, batches),
+            media_type=EXPORT_MEDIA_TYPES["csv"],
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+        )
+    path = await write_xlsx(sheets)
+    return FileResponse(path, media_type=EXPORT_MEDIA_TYPES["xlsx"], filename=f"{filename}.xlsx",
+                        background=BackgroundTask(os.unlink, path))
+
+# Runtime stats
+def peak_rss_mb(pid="self") -> Optional[float]:
+    """High-water mark of a process's resident set, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss(pid="self"):
+    # Writing 5 to clear_refs restarts VmHWM from the current RSS
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+class LoopMonitor:
+    """Measures how late the event loop wakes a task that sleeps LOOP_MONITOR_INTERVAL.
+
+    Lateness is time the loop spent running something else without yielding,
+    i.e. blocking every other request.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.stats = {"ticks": 0, "stalls": 0, "blocked_seconds": 0.0, "max_lag_ms": 0.0}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "blocked_seconds": round(self.stats["blocked_seconds"], 3),
+                "max_lag_ms": round(self.stats["max_lag_ms"], 1)}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            self.stats["ticks"] += 1
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], lag * 1000)
+            if lag * 1000 >= LOOP_STALL_MS:
+                self.stats["stalls"] += 1
+                self.stats["blocked_seconds"] += lag
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL)
+
+# Request coalescing
+class RequestCoalescer:
+    """Single-flight execution of identical concurrent GET requests.
+
+    Requests are identical when path, query string, Accept, If-None-Match and
+    the calling user all match; some routes answer per user (import jobs,
+    uploads), so responses are never shared between users. The first one
+    (the leader) runs the route; the rest wait for its fully-buffered
+    response and get a copy of it, so a burst costs one Mongo query and one
+    serialization. Streams and file exports are never buffered.
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "bypassed": 0, "fallbacks": 0}
+
+    def key_for(self, request: Request) -> Optional[tuple]:
+        path = request.url.path
+        if (request.method != "GET" or not path.startswith("/api/")
+                or path.startswith(("/api/auth/", "/api/admin/", "/api/export/")) or path.endswith("/export")):
+            return None
+        accept = request.headers.get("accept", "")
+        if "application/x-ndjson" in accept or request.query_params.get("stream") == "true" \
+                or "no-cache" in request.headers.get("cache-control", ""):
+            return None
+        scope = self.auth_scope(request)
+        if scope is None:
+            return None
+        query = tuple(sorted(request.query_params.multi_items()))
+        return (path, query, accept, request.headers.get("if-none-match", ""), scope)
+
+    def auth_scope(self, request: Request) -> Optional[tuple]:
+        """User id and role of a valid claims token; anything else takes the normal path"""
+        authorization = request.headers.get("authorization", "")
+        if not STATELESS_AUTH or not authorization.lower().startswith("bearer "):
+            return None
+        try:
+            payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.InvalidTokenError:
+            return None
+        if not payload.get("uid") or not payload.get("role") or is_token_revoked(payload):
+            return None
+        return payload["uid"], payload["role"]
+
+    @staticmethod
+    def replay(status_code: int, raw_headers: list, body: bytes) -> Response:
+        """A buffered response; raw headers keep repeated ones such as Set-Cookie"""
+        response = Response(content=body, status_code=status_code)
+        response.raw_headers = [(name, value) for name, value in raw_headers if name.lower() != b"content-length"]
+        response.raw_headers.append((b"content-length", str(len(body)).encode()))
+        return response
+
+    async def dispatch(self, request: Request, call_next):
+        key = self.key_for(request)
+        if key is None:
+            self.stats["bypassed"] += 1
+            return await call_next(request)
+
+        leader = self.in_flight.get(key)
+        if leader is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return self.replay(*await asyncio.shield(leader))
+            except Exception:
+                self.stats["fallbacks"] += 1
+                return await call_next(request)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        self.stats["leaders"] += 1
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            result = (response.status_code, list(response.raw_headers), body)
+            future.set_result(result)
+            return self.replay(*result)
+        except BaseException:
+            # Waiting followers fall back to running the route themselves
+            if not future.done():
+                future.set_exception(RuntimeError("Coalesced request failed"))
+                future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+request_coalescer = RequestCoalescer()
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_input: UserCreate):
@@ -279,17 +1351,16 @@ async def register(user_input: UserCreate):
     
     # Create user
     user_dict = user_input.model_dump()
-    hashed_password = hash_password(user_dict.pop("password"))
+    hashed_password = await hash_password_async(user_dict.pop("password"))
     user_obj = User(**user_dict)
     
     doc = user_obj.model_dump()
     doc['password'] = hashed_password
-    doc['created_at'] = doc['created_at'].isoformat()
     
     await db.users.insert_one(doc)
     
     # Create token
-    access_token = create_access_token(data={"sub": user_obj.email})
+    access_token = create_access_token(data=user_token_claims(user_obj))
     return Token(access_token=access_token, token_type="bearer", user=user_obj)
 
 @api_router.post("/auth/login", response_model=Token)
@@ -298,46 +1369,69 @@ async def login(user_input: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(user_input.password, user_doc['password']):
+    if not await verify_password_async(user_input.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_doc.pop('password')
-    if isinstance(user_doc['created_at'], str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
     
     user_obj = User(**user_doc)
-    access_token = create_access_token(data={"sub": user_obj.email})
+    access_token = create_access_token(data=user_token_claims(user_obj))
     return Token(access_token=access_token, token_type="bearer", user=user_obj)
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.post("/auth/logout")
+async def logout(current_user: User = Depends(get_current_user), claims: dict = Depends(get_current_token_claims)):
+    if claims.get("jti"):
+        await revoke(f"jti:{claims['jti']}")
+    return {"message": "Logged out successfully"}
+
+class UserRoleUpdate(BaseModel):
+    role: str
+
+@api_router.put("/users/{user_id}/role", response_model=User)
+async def update_user_role(user_id: str, role_input: UserRoleUpdate, current_user: User = Depends(require_admin)):
+    result = await db.users.update_one({"id": user_id}, {"$set": {"role": role_input.role}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Tokens carry the role claim, so everything issued before now must go
+    await revoke(f"user:{user_id}")
+    updated = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    return User(**updated)
+
+@api_router.post("/users/{user_id}/revoke-tokens")
+async def revoke_user_tokens(user_id: str, current_user: User = Depends(require_admin)):
+    await revoke(f"user:{user_id}")
+    return {"message": "User tokens revoked successfully"}
+
 # Buyer Routes
 @api_router.post("/buyers", response_model=Buyer)
 async def create_buyer(buyer_input: BuyerCreate, current_user: User = Depends(get_current_user)):
     buyer_obj = Buyer(**buyer_input.model_dump())
     doc = buyer_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.buyers.insert_one(doc)
+    await collection_changed("buyers")
     return buyer_obj
 
 @api_router.get("/buyers", response_model=List[Buyer])
-async def get_buyers(current_user: User = Depends(get_current_user)):
-    buyers = await db.buyers.find({}, {"_id": 0}).to_list(1000)
-    for buyer in buyers:
-        if isinstance(buyer['created_at'], str):
-            buyer['created_at'] = datetime.fromisoformat(buyer['created_at'])
-    return buyers
+async def get_buyers(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Buyer)
+    if page.stream:
+        return stream_documents([(db.buyers, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "buyers")
+    if not_modified:
+        return not_modified
+    return await cached_master_list("buyers", page.limit, page.cursor, selection, headers=dict(page.response.headers))
 
 @api_router.put("/buyers/{buyer_id}", response_model=Buyer)
 async def update_buyer(buyer_id: str, buyer_input: BuyerCreate, current_user: User = Depends(get_current_user)):
     result = await db.buyers.update_one({"id": buyer_id}, {"$set": buyer_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Buyer not found")
+    await collection_changed("buyers")
     updated = await db.buyers.find_one({"id": buyer_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Buyer(**updated)
 
 @api_router.delete("/buyers/{buyer_id}")
@@ -345,6 +1439,7 @@ async def delete_buyer(buyer_id: str, current_user: User = Depends(get_current_u
     result = await db.buyers.delete_one({"id": buyer_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Buyer not found")
+    await collection_changed("buyers")
     return {"message": "Buyer deleted successfully"}
 
 # Supplier Routes
@@ -352,16 +1447,21 @@ async def delete_buyer(buyer_id: str, current_user: User = Depends(get_current_u
 async def create_supplier(supplier_input: SupplierCreate, current_user: User = Depends(get_current_user)):
     supplier_obj = Supplier(**supplier_input.model_dump())
     doc = supplier_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.suppliers.insert_one(doc)
+    await collection_changed("suppliers")
     return supplier_obj
 
 @api_router.get("/suppliers", response_model=List[Supplier])
-async def get_suppliers(current_user: User = Depends(get_current_user)):
-    suppliers = await db.suppliers.find({}, {"_id": 0}).to_list(1000)
-    for supplier in suppliers:
-        if isinstance(supplier['created_at'], str):
-            supplier['created_at'] = datetime.fromisoformat(supplier['created_at'])
+async def get_suppliers(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Supplier)
+    if page.stream:
+        return stream_documents([(db.suppliers, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "suppliers")
+    if not_modified:
+        return not_modified
+    suppliers = await fetch_page(db.suppliers, {}, page, projection=selection and selection.projection("created_at"))
+    if selection:
+        return selection.render(suppliers, page)
     return suppliers
 
 @api_router.put("/suppliers/{supplier_id}", response_model=Supplier)
@@ -369,9 +1469,8 @@ async def update_supplier(supplier_id: str, supplier_input: SupplierCreate, curr
     result = await db.suppliers.update_one({"id": supplier_id}, {"$set": supplier_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Supplier not found")
+    await collection_changed("suppliers")
     updated = await db.suppliers.find_one({"id": supplier_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Supplier(**updated)
 
 @api_router.delete("/suppliers/{supplier_id}")
@@ -379,6 +1478,7 @@ async def delete_supplier(supplier_id: str, current_user: User = Depends(get_cur
     result = await db.suppliers.delete_one({"id": supplier_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Supplier not found")
+    await collection_changed("suppliers")
     return {"message": "Supplier deleted successfully"}
 
 # Raw Material Routes
@@ -386,16 +1486,21 @@ async def delete_supplier(supplier_id: str, current_user: User = Depends(get_cur
 async def create_raw_material(material_input: RawMaterialCreate, current_user: User = Depends(get_current_user)):
     material_obj = RawMaterial(**material_input.model_dump())
     doc = material_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.raw_materials.insert_one(doc)
+    await collection_changed("raw_materials")
     return material_obj
 
 @api_router.get("/raw-materials", response_model=List[RawMaterial])
-async def get_raw_materials(current_user: User = Depends(get_current_user)):
-    materials = await db.raw_materials.find({}, {"_id": 0}).to_list(1000)
-    for material in materials:
-        if isinstance(material['created_at'], str):
-            material['created_at'] = datetime.fromisoformat(material['created_at'])
+async def get_raw_materials(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, RawMaterial)
+    if page.stream:
+        return stream_documents([(db.raw_materials, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "raw_materials")
+    if not_modified:
+        return not_modified
+    materials = await fetch_page(db.raw_materials, {}, page, projection=selection and selection.projection("created_at"))
+    if selection:
+        return selection.render(materials, page)
     return materials
 
 @api_router.put("/raw-materials/{material_id}", response_model=RawMaterial)
@@ -403,9 +1508,8 @@ async def update_raw_material(material_id: str, material_input: RawMaterialCreat
     result = await db.raw_materials.update_one({"id": material_id}, {"$set": material_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Raw material not found")
+    await collection_changed("raw_materials")
     updated = await db.raw_materials.find_one({"id": material_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return RawMaterial(**updated)
 
 @api_router.delete("/raw-materials/{material_id}")
@@ -413,6 +1517,7 @@ async def delete_raw_material(material_id: str, current_user: User = Depends(get
     result = await db.raw_materials.delete_one({"id": material_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Raw material not found")
+    await collection_changed("raw_materials")
     return {"message": "Raw material deleted successfully"}
 
 # Color Routes
@@ -420,26 +1525,27 @@ async def delete_raw_material(material_id: str, current_user: User = Depends(get
 async def create_color(color_input: ColorCreate, current_user: User = Depends(get_current_user)):
     color_obj = Color(**color_input.model_dump())
     doc = color_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.colors.insert_one(doc)
+    await collection_changed("colors")
     return color_obj
 
 @api_router.get("/colors", response_model=List[Color])
-async def get_colors(current_user: User = Depends(get_current_user)):
-    colors = await db.colors.find({}, {"_id": 0}).to_list(1000)
-    for color in colors:
-        if isinstance(color['created_at'], str):
-            color['created_at'] = datetime.fromisoformat(color['created_at'])
-    return colors
+async def get_colors(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Color)
+    if page.stream:
+        return stream_documents([(db.colors, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "colors")
+    if not_modified:
+        return not_modified
+    return await cached_master_list("colors", page.limit, page.cursor, selection, headers=dict(page.response.headers))
 
 @api_router.put("/colors/{color_id}", response_model=Color)
 async def update_color(color_id: str, color_input: ColorCreate, current_user: User = Depends(get_current_user)):
     result = await db.colors.update_one({"id": color_id}, {"$set": color_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Color not found")
+    await collection_changed("colors")
     updated = await db.colors.find_one({"id": color_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Color(**updated)
 
 @api_router.delete("/colors/{color_id}")
@@ -447,6 +1553,7 @@ async def delete_color(color_id: str, current_user: User = Depends(get_current_u
     result = await db.colors.delete_one({"id": color_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Color not found")
+    await collection_changed("colors")
     return {"message": "Color deleted successfully"}
 
 # Size Routes
@@ -454,26 +1561,27 @@ async def delete_color(color_id: str, current_user: User = Depends(get_current_u
 async def create_size(size_input: SizeCreate, current_user: User = Depends(get_current_user)):
     size_obj = Size(**size_input.model_dump())
     doc = size_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.sizes.insert_one(doc)
+    await collection_changed("sizes")
     return size_obj
 
 @api_router.get("/sizes", response_model=List[Size])
-async def get_sizes(current_user: User = Depends(get_current_user)):
-    sizes = await db.sizes.find({}, {"_id": 0}).sort("sort_order", 1).to_list(1000)
-    for size in sizes:
-        if isinstance(size['created_at'], str):
-            size['created_at'] = datetime.fromisoformat(size['created_at'])
-    return sizes
+async def get_sizes(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Size)
+    if page.stream:
+        return stream_documents([(db.sizes, {}, {})], page, sort_field="sort_order", projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "sizes")
+    if not_modified:
+        return not_modified
+    return await cached_master_list("sizes", page.limit, page.cursor, selection, headers=dict(page.response.headers))
 
 @api_router.put("/sizes/{size_id}", response_model=Size)
 async def update_size(size_id: str, size_input: SizeCreate, current_user: User = Depends(get_current_user)):
     result = await db.sizes.update_one({"id": size_id}, {"$set": size_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Size not found")
+    await collection_changed("sizes")
     updated = await db.sizes.find_one({"id": size_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Size(**updated)
 
 @api_router.delete("/sizes/{size_id}")
@@ -481,6 +1589,7 @@ async def delete_size(size_id: str, current_user: User = Depends(get_current_use
     result = await db.sizes.delete_one({"id": size_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Size not found")
+    await collection_changed("sizes")
     return {"message": "Size deleted successfully"}
 
 # Article Routes
@@ -488,26 +1597,27 @@ async def delete_size(size_id: str, current_user: User = Depends(get_current_use
 async def create_article(article_input: ArticleCreate, current_user: User = Depends(get_current_user)):
     article_obj = Article(**article_input.model_dump())
     doc = article_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.articles.insert_one(doc)
+    await collection_changed("articles")
     return article_obj
 
 @api_router.get("/articles", response_model=List[Article])
-async def get_articles(current_user: User = Depends(get_current_user)):
-    articles = await db.articles.find({}, {"_id": 0}).to_list(1000)
-    for article in articles:
-        if isinstance(article['created_at'], str):
-            article['created_at'] = datetime.fromisoformat(article['created_at'])
-    return articles
+async def get_articles(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Article)
+    if page.stream:
+        return stream_documents([(db.articles, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "articles")
+    if not_modified:
+        return not_modified
+    return await cached_master_list("articles", page.limit, page.cursor, selection, headers=dict(page.response.headers))
 
 @api_router.put("/articles/{article_id}", response_model=Article)
 async def update_article(article_id: str, article_input: ArticleCreate, current_user: User = Depends(get_current_user)):
     result = await db.articles.update_one({"id": article_id}, {"$set": article_input.model_dump()})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Article not found")
+    await collection_changed("articles")
     updated = await db.articles.find_one({"id": article_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Article(**updated)
 
 @api_router.delete("/articles/{article_id}")
@@ -515,6 +1625,7 @@ async def delete_article(article_id: str, current_user: User = Depends(get_curre
     result = await db.articles.delete_one({"id": article_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Article not found")
+    await collection_changed("articles")
     return {"message": "Article deleted successfully"}
 
 # Fabric Routes
@@ -522,35 +1633,666 @@ async def delete_article(article_id: str, current_user: User = Depends(get_curre
 async def create_fabric(fabric_input: FabricCreate, current_user: User = Depends(get_current_user)):
     fabric_obj = Fabric(**fabric_input.model_dump())
     doc = fabric_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.fabrics.insert_one(doc)
+    await collection_changed("fabrics")
+    # BOM rows may already name it by quality
+    schedule_bom_recompute([doc])
     return fabric_obj
 
 @api_router.get("/fabrics", response_model=List[Fabric])
-async def get_fabrics(current_user: User = Depends(get_current_user)):
-    fabrics = await db.fabrics.find({}, {"_id": 0}).to_list(1000)
-    for fabric in fabrics:
-        if isinstance(fabric['created_at'], str):
-            fabric['created_at'] = datetime.fromisoformat(fabric['created_at'])
-    return fabrics
+async def get_fabrics(fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    selection = select_fields(fields, Fabric)
+    if page.stream:
+        return stream_documents([(db.fabrics, {}, {})], page, projection=selection and selection.projection())
+    not_modified = await conditional_list(page, "fabrics")
+    if not_modified:
+        return not_modified
+    return await cached_master_list("fabrics", page.limit, page.cursor, selection, headers=dict(page.response.headers))
+
+@api_router.get("/fabrics/process-loss")
+async def get_fabric_process_loss(current_user: User = Depends(get_current_user)):
+    """Greige-to-ready factors by fabric item type, so forms show the figures the server will store"""
+    return {"factors": FABRIC_PROCESS_LOSS, "default": FABRIC_PROCESS_LOSS_DEFAULT}
 
 @api_router.put("/fabrics/{fabric_id}", response_model=Fabric)
 async def update_fabric(fabric_id: str, fabric_input: FabricCreate, current_user: User = Depends(get_current_user)):
-    result = await db.fabrics.update_one({"id": fabric_id}, {"$set": fabric_input.model_dump()})
-    if result.modified_count == 0:
+    previous = await db.fabrics.find_one_and_update({"id": fabric_id}, {"$set": fabric_input.model_dump()}, projection={"_id": 0})
+    if previous is None:
         raise HTTPException(status_code=404, detail="Fabric not found")
+    await collection_changed("fabrics")
     updated = await db.fabrics.find_one({"id": fabric_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    # Rows matched by the old or the new name may change price or loss factor
+    schedule_bom_recompute([previous, updated])
     return Fabric(**updated)
 
 @api_router.delete("/fabrics/{fabric_id}")
 async def delete_fabric(fabric_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.fabrics.delete_one({"id": fabric_id})
-    if result.deleted_count == 0:
+    fabric = await db.fabrics.find_one_and_delete({"id": fabric_id}, projection={"_id": 0})
+    if fabric is None:
         raise HTTPException(status_code=404, detail="Fabric not found")
+    await collection_changed("fabrics")
+    schedule_bom_recompute([fabric])
     return {"message": "Fabric deleted successfully"}
 
+# Master Export Route
+# Collection, model (for column order) and sort key of each exportable master
+EXPORT_MASTERS = {
+    "buyers": ("buyers", Buyer, "created_at"),
+    "suppliers": ("suppliers", Supplier, "created_at"),
+    "raw-materials": ("raw_materials", RawMaterial, "created_at"),
+    "colors": ("colors", Color, "created_at"),
+    "sizes": ("sizes", Size, "sort_order"),
+    "articles": ("articles", Article, "created_at"),
+    "fabrics": ("fabrics", Fabric, "created_at")
+}
+
+@api_router.get("/export/{master}")
+async def export_master(master: str, file_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+                        current_user: User = Depends(get_current_user)):
+    if master not in EXPORT_MASTERS:
+        raise HTTPException(status_code=404, detail="Unknown master")
+    collection_name, model, sort_field = EXPORT_MASTERS[master]
+    columns = list(model.model_fields)
+    cursor = db[collection_name].find({}, {"_id": 0}).sort([(sort_field, 1), ("id", 1)]).batch_size(STREAM_BATCH_SIZE)
+    return await export_response(master, file_format, [(master, columns, cursor_batches(cursor, columns))])
+
+# BOM calculations
+# Derived figures of comprehensive BOMs are computed here rather than trusted
+# from the client. All rows of a batch of BOMs are parsed into numpy columns
+# and computed in one pass. Fabric rows get
+#   readyFabricNeed  = (orderPcs + extraPcs + wastagePcs) × planRat
+#   greigeFabricNeed = readyFabricNeed × process-loss factor of the fabric type
+#   shortage         = greigeFabricNeed − readyFabricNeed
+# as 2-decimal strings, the way the BOM form shows them. Each BOM gets numeric
+# cost rollups for the whole order of header planQty pieces:
+#   fabric_cost    = Σ greigeFabricNeed × fabric price_per_unit
+#   trims_cost     = Σ trims totalCost
+#   cmt_cost       = Σ operations costPerPiece × planQty
+#   total_cost     = fabric_cost + trims_cost + cmt_cost
+#   cost_per_piece = total_cost / planQty (None without a planQty)
+BOM_COST_FIELDS = ["fabric_cost", "trims_cost", "cmt_cost_per_piece", "cmt_cost", "total_cost", "cost_per_piece"]
+# Fields a recompute may rewrite: figures, and row ids backfilled on old BOMs
+BOM_DERIVED_FIELDS = ["fabricTables", "trimsTables", "operations"] + BOM_COST_FIELDS
+FABRIC_DERIVED_COLUMNS = ["readyFabricNeed", "greigeFabricNeed", "shortage"]
+BOM_TABLE_SECTIONS = {"fabricTables": "fabric", "trimsTables": "trims"}
+
+def bom_row_groups(bom: dict) -> list:
+    """(section, table id, rows) of each fabric and trims table of a comprehensive BOM, and of its operations"""
+    groups = [(section, table.get("id"), table.get("items") or []) for key, section in BOM_TABLE_SECTIONS.items()
+              for table in bom.get(key) or [] if isinstance(table, dict)]
+    return groups + [("operations", None, bom.get("operations") or [])]
+
+def assign_row_ids(bom: dict):
+    """Give every row of `bom` a rowId, unique within its table, for patches to address it by"""
+    for _, _, rows in bom_row_groups(bom):
+        seen = set()
+        for row in rows:
+            if isinstance(row, dict):
+                if not row.get("rowId") or row["rowId"] in seen:
+                    row["rowId"] = uuid.uuid4().hex
+                seen.add(row["rowId"])
+
+def bom_parts(bom: dict) -> list:
+    """Names of the separately versioned parts of a BOM"""
+    return ["header", "operations"] + [f"{key}:{table.get('id')}" for key in BOM_TABLE_SECTIONS
+                                       for table in bom.get(key) or [] if isinstance(table, dict)]
+
+def numeric_column(rows: list, field: str) -> np.ndarray:
+    values = pd.to_numeric(pd.Series([row.get(field) for row in rows], dtype=object), errors="coerce")
+    return values.fillna(0).to_numpy(dtype=float)
+
+def fixed_2(values: np.ndarray) -> list:
+    return np.char.mod("%.2f", np.round(values, 2)).tolist()
+
+def bom_rows(boms: list, tables: Optional[str], field: str) -> tuple:
+    """Rows under `field` (of each table in `tables`, when given) and the index of the BOM owning each"""
+    rows, owners = [], []
+    for index, bom in enumerate(boms):
+        groups = [table.get(field) or [] for table in bom.get(tables) or []] if tables else [bom.get(field) or []]
+        for group in groups:
+            for row in group:
+                if isinstance(row, dict):
+                    rows.append(row)
+                    owners.append(index)
+    return rows, np.array(owners, dtype=int)
+
+async def fabric_details(rows: list) -> list:
+    """Item type and price of each row's fabric; {} when unknown.
+
+    Rows are matched by fabricId, else by fabricQuality, which the form fills
+    with the fabric's final_item or fabric_name.
+    """
+    ids = {row["fabricId"] for row in rows if row.get("fabricId")}
+    qualities = {row["fabricQuality"] for row in rows if not row.get("fabricId") and row.get("fabricQuality")}
+    clauses = []
+    if ids:
+        clauses.append({"id": {"$in": list(ids)}})
+    if qualities:
+        clauses += [{"final_item": {"$in": list(qualities)}}, {"fabric_name": {"$in": list(qualities)}}]
+    by_id, by_quality = {}, {}
+    if clauses:
+        projection = {"_id": 0, "id": 1, "final_item": 1, "fabric_name": 1, "item_type": 1, "price_per_unit": 1}
+        async for fabric in db.fabrics.find({"$or": clauses}, projection):
+            by_id[fabric["id"]] = fabric
+            for name in (fabric.get("fabric_name"), fabric.get("final_item")):
+                if name in qualities:
+                    by_quality[name] = fabric
+    return [by_id.get(row.get("fabricId")) or by_quality.get(row.get("fabricQuality")) or {} for row in rows]
+
+def process_loss_factor(item_type: Optional[str]) -> float:
+    return FABRIC_PROCESS_LOSS.get((item_type or "").strip().upper(), FABRIC_PROCESS_LOSS_DEFAULT)
+
+async def compute_bom_figures(boms: list):
+    """Recompute the fabric columns and cost rollups of comprehensive `boms` in place"""
+    fabric_rows, fabric_owners = bom_rows(boms, "fabricTables", "items")
+    fabric_cost = np.zeros(len(boms))
+    if fabric_rows:
+        fabrics = await fabric_details(fabric_rows)
+        factors = np.array([process_loss_factor(fabric.get("item_type")) for fabric in fabrics])
+        prices = np.array([fabric.get("price_per_unit") or 0 for fabric in fabrics], dtype=float)
+        pieces = (numeric_column(fabric_rows, "orderPcs") + numeric_column(fabric_rows, "extraPcs")
+                  + numeric_column(fabric_rows, "wastagePcs"))
+        ready = np.round(pieces * numeric_column(fabric_rows, "planRat"), 2)
+        greige = np.round(ready * factors, 2)
+        for row, ready_need, greige_need, shortage in zip(fabric_rows, fixed_2(ready), fixed_2(greige), fixed_2(greige - ready)):
+            row["readyFabricNeed"] = ready_need
+            row["greigeFabricNeed"] = greige_need
+            row["shortage"] = shortage
+        fabric_cost = np.bincount(fabric_owners, weights=greige * prices, minlength=len(boms))
+
+    trims_rows, trims_owners = bom_rows(boms, "trimsTables", "items")
+    trims_cost = np.bincount(trims_owners, weights=numeric_column(trims_rows, "totalCost"), minlength=len(boms))
+    operation_rows, operation_owners = bom_rows(boms, None, "operations")
+    cmt_per_piece = np.bincount(operation_owners, weights=numeric_column(operation_rows, "costPerPiece"), minlength=len(boms))
+    plan_qty = numeric_column([bom.get("header") or {} for bom in boms], "planQty")
+
+    cmt_cost = cmt_per_piece * plan_qty
+    total_cost = fabric_cost + trims_cost + cmt_cost
+    for index, bom in enumerate(boms):
+        bom.update(
+            fabric_cost=round(float(fabric_cost[index]), 2),
+            trims_cost=round(float(trims_cost[index]), 2),
+            cmt_cost_per_piece=round(float(cmt_per_piece[index]), 2),
+            cmt_cost=round(float(cmt_cost[index]), 2),
+            total_cost=round(float(total_cost[index]), 2),
+            cost_per_piece=round(float(total_cost[index] / plan_qty[index]), 4) if plan_qty[index] > 0 else None
+        )
+
+async def recompute_comprehensive_boms(query: dict) -> dict:
+    """Recompute the stored figures of matching BOMs in batches.
+
+    A BOM is written back only if a figure changed, and only if nobody
+    wrote it (version) since it was read. The version is bumped so that a
+    patch costed from the old figures retries, but part versions are left
+    alone: recomputing is not an edit anybody can conflict with.
+    """
+    scanned = updated = 0
+    projection = {"_id": 0, "id": 1, "version": 1, "layout": 1, "lock_expires_at": 1, "header.planQty": 1,
+                  "fabricTables": 1, "trimsTables": 1, "operations": 1, **{field: 1 for field in BOM_COST_FIELDS}}
+    cursor = db.comprehensive_boms.find(query, projection).batch_size(STREAM_BATCH_SIZE)
+
+    async def flush(batch: list) -> int:
+        await attach_bom_lines(batch)
+        recomputed = copy.deepcopy(batch)
+        for bom in recomputed:
+            assign_row_ids(bom)
+        await compute_bom_figures(recomputed)
+        operations, written = [], 0
+        for bom, new in zip(batch, recomputed):
+            changed = {field: new[field] for field in BOM_DERIVED_FIELDS if field in new and bom.get(field) != new[field]}
+            if not changed:
+                continue
+            version = (bom.get("version") or 0) + 1
+            if bom.get("layout") == "lines":
+                costs = {field: value for field, value in changed.items() if field in BOM_COST_FIELDS}
+                written += not bom_locked(bom) and await write_lined_bom(bom, new, {**costs, "version": version})
+            else:
+                operations.append(UpdateOne({"id": bom["id"], "version": bom.get("version")},
+                                            {"$set": {"version": version, **changed}}))
+        if operations:
+            result = await db.comprehensive_boms.bulk_write(operations, ordered=False)
+            written += result.modified_count
+        return written
+
+    batch = []
+    async for bom in cursor:
+        batch.append(bom)
+        scanned += 1
+        if len(batch) >= STREAM_BATCH_SIZE:
+            updated += await flush(batch)
+            batch = []
+    if batch:
+        updated += await flush(batch)
+    if updated:
+        await collection_changed("comprehensive_boms")
+    return {"scanned": scanned, "updated": updated}
+
+bom_recompute_tasks = set()
+
+def schedule_bom_recompute(fabrics: list):
+    """Re-cost, in the background, the BOMs whose fabric rows point at any of `fabrics`"""
+    ids = [fabric["id"] for fabric in fabrics]
+    names = list({name for fabric in fabrics for name in (fabric.get("final_item"), fabric.get("fabric_name")) if name})
+    fabric_rows = [{"fabricId": {"$in": ids}}, {"fabricQuality": {"$in": names}}]
+
+    async def run():
+        try:
+            lined = await db.bom_lines.distinct("bom_id", {"section": "fabric", "$or": fabric_rows})
+            query = {"$or": [{f"fabricTables.items.{field}": value} for clause in fabric_rows for field, value in clause.items()]
+                     + [{"id": {"$in": lined}}]}
+            result = await recompute_comprehensive_boms(query)
+            logger.info(f"Re-costed {result['updated']} of {result['scanned']} BOMs after a fabric change")
+        except Exception:
+            logger.exception("Re-costing BOMs after a fabric change failed")
+
+    task = asyncio.create_task(run())
+    # The loop only keeps weak references to tasks
+    bom_recompute_tasks.add(task)
+    task.add_done_callback(bom_recompute_tasks.discard)
+
+# BOM patches
+# A patch edits a comprehensive BOM in place instead of replacing it. Each
+# operation becomes a $set of one cell, a $push of inserted rows or a $pull
+# of deleted rows, addressed by array filters on table id and row rowId.
+# The operations are first applied to a copy of the stored BOM, to check
+# them and recompute its figures; the update then carries only the touched
+# cells, the derived columns of touched fabric rows and the cost rollups.
+# Mongo refuses updates whose paths overlap, so a row list that one patch
+# edits in more than one way (cells set, rows inserted, deleted or
+# reordered) is written back whole instead. Either way a patch is one
+# update: its edits are applied together or not at all.
+#
+# Concurrency is optimistic. Every write bumps the BOM's version, and each
+# part (header, operations, each table) records in part_versions the version
+# that last changed it. A patch made on version v is refused (409) only if a
+# part it touches changed after v, so planners editing different tables
+# don't collide; a write that lost a race with an edit elsewhere is re-read
+# and retried. A lines-layout BOM stores the patched copy's changed lines
+# instead (see BOM line storage). Row numbers (srNo) are positional: deleting rows leaves the
+# stored numbers of later rows as they were, and readers number by position.
+PATCH_TABLE_SECTIONS = {"fabric": "fabricTables", "trims": "trimsTables"}
+# Fields patches address tables and rows by, or rewrite as a whole
+PATCH_PROTECTED_FIELDS = {"id", "rowId", "items"}
+
+def patch_error(index: int, message: str, status_code: int = 400) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=f"Operation {index}: {message}")
+
+def export_rows(rows: list) -> list:
+    """BOM rows as exported: without rowId, and srNo renumbered by position as patches leave it after deletes"""
+    return [{key: (number if key == "srNo" else value) for key, value in row.items() if key != "rowId"}
+            for number, row in enumerate(rows, start=1)]
+
+def check_patch_field(field: Optional[str], index: int) -> str:
+    if not field or field.startswith("$") or "." in field or field in PATCH_PROTECTED_FIELDS:
+        raise patch_error(index, f"cannot set field {field!r}")
+    return field
+
+class BOMPatchPlan:
+    """Patch operations applied to a copy of a BOM, and the Mongo update doing the same"""
+
+    def __init__(self, bom: dict):
+        self.bom = bom
+        self.parts = set()
+        self.sets = {}  # path -> (owner, key); values are read once figures are recomputed
+        self.pushes = {}  # row list path -> inserted rows
+        self.positions = {}  # row list path -> position of a positioned insert
+        self.pulls = {}  # row list path -> deleted row ids
+        self.filters = {}  # (kind, key) -> (identifier, array filter)
+        self.row_lists = {}  # row list path -> (owner, key); owner[key] is the list
+        self.row_edits = {}  # row list path -> kinds of edits made to it
+        self.rewritten = set()  # row list paths written back whole
+        self.fabric_rows = {}  # row path -> edited fabric row, whose derived columns are rewritten
+        self.changed = []  # edited and inserted rows, reported back with their final values
+
+    def apply(self, operations: list):
+        for index, operation in enumerate(operations):
+            getattr(self, f"apply_{operation.op}")(operation, index)
+
+    def identifier(self, kind: str, key: tuple, field: str, value) -> str:
+        if (kind, key) not in self.filters:
+            name = f"{kind}{len(self.filters)}"
+            self.filters[(kind, key)] = (name, {f"{name}.{field}": value})
+        return self.filters[(kind, key)][0]
+
+    def claim(self, path: str, kind: str):
+        """Record an edit of a row list; a list edited in more than one way is written back whole"""
+        kinds = self.row_edits.setdefault(path, set())
+        kinds.add(kind)
+        if len(kinds) > 1:
+            self.rewritten.add(path)
+
+    def table(self, operation, index: int) -> tuple:
+        key = PATCH_TABLE_SECTIONS[operation.section]
+        table = next((table for table in self.bom.get(key) or []
+                      if isinstance(table, dict) and table.get("id") == operation.table_id), None)
+        if table is None:
+            raise patch_error(index, f"no {operation.section} table {operation.table_id}", 404)
+        self.parts.add(f"{key}:{operation.table_id}")
+        return table, f"{key}.$[{self.identifier('t', (key, operation.table_id), 'id', operation.table_id)}]"
+
+    def row_list(self, operation, index: int) -> tuple:
+        """(path, owner, key) of the row list an operation edits; owner[key] is the list"""
+        if operation.section == "header":
+            raise patch_error(index, "the header has no rows")
+        if operation.section == "operations":
+            self.parts.add("operations")
+            self.bom.setdefault("operations", [])
+            self.row_lists["operations"] = (self.bom, "operations")
+            return "operations", self.bom, "operations"
+        table, path = self.table(operation, index)
+        table.setdefault("items", [])
+        self.row_lists[f"{path}.items"] = (table, "items")
+        return f"{path}.items", table, "items"
+
+    def find_row(self, rows: list, row_id: Optional[str], index: int) -> int:
+        position = next((position for position, row in enumerate(rows) if row.get("rowId") == row_id), None)
+        if position is None:
+            raise patch_error(index, f"no row {row_id}", 404)
+        return position
+
+    def report(self, operation, row: dict):
+        if not any(row is changed["row"] for changed in self.changed):
+            self.changed.append({"section": operation.section, "table_id": operation.table_id, "row": row})
+
+    def apply_set(self, operation, index: int):
+        field = check_patch_field(operation.field, index)
+        if operation.section == "header":
+            self.parts.add("header")
+            if not isinstance(self.bom.get("header"), dict):
+                self.bom["header"] = {}
+            owner, path = self.bom["header"], f"header.{field}"
+        elif operation.row_id is None:
+            if operation.section == "operations":
+                raise patch_error(index, "set on operations needs a row_id")
+            owner, table_path = self.table(operation, index)
+            path = f"{table_path}.{field}"
+        else:
+            rows_path, rows_owner, rows_key = self.row_list(operation, index)
+            rows = rows_owner[rows_key]
+            owner = rows[self.find_row(rows, operation.row_id, index)]
+            row_path = f"{rows_path}.$[{self.identifier('r', (rows_path, operation.row_id), 'rowId', operation.row_id)}]"
+            path = f"{row_path}.{field}"
+            if operation.section == "fabric":
+                self.fabric_rows[row_path] = owner
+            self.report(operation, owner)
+            self.claim(rows_path, "set")
+        owner[field] = operation.value
+        self.sets[path] = (owner, field)
+
+    def apply_insert_row(self, operation, index: int):
+        if operation.row is None or any(key.startswith("$") or "." in key for key in operation.row):
+            raise patch_error(index, "insert_row needs a row with plain field names")
+        path, owner, key = self.row_list(operation, index)
+        self.claim(path, "insert")
+        rows, inserted = owner[key], self.pushes.setdefault(path, [])
+        # One $push inserts at one place
+        if path in self.positions or (operation.position is not None and inserted):
+            self.rewritten.add(path)
+        position = len(rows) if operation.position is None else max(0, min(operation.position, len(rows)))
+        row = {**operation.row, "srNo": position + 1, "rowId": uuid.uuid4().hex}
+        rows.insert(position, row)
+        inserted.append(row)
+        if operation.position is not None:
+            self.positions[path] = position
+        self.report(operation, row)
+
+    def apply_delete_row(self, operation, index: int):
+        path, owner, key = self.row_list(operation, index)
+        self.claim(path, "delete")
+        rows = owner[key]
+        row = rows.pop(self.find_row(rows, operation.row_id, index))
+        self.changed = [changed for changed in self.changed if changed["row"] is not row]
+        self.pulls.setdefault(path, []).append(operation.row_id)
+
+    def apply_reorder_rows(self, operation, index: int):
+        path, owner, key = self.row_list(operation, index)
+        self.claim(path, "reorder")
+        rows = owner[key]
+        by_id = {row.get("rowId"): row for row in rows}
+        row_ids = operation.row_ids or []
+        if len(by_id) != len(rows) or len(set(row_ids)) != len(row_ids) or set(row_ids) != set(by_id):
+            raise patch_error(index, "reorder_rows must list every row of the table once")
+        rows[:] = [by_id[row_id] for row_id in row_ids]
+        for number, row in enumerate(rows, start=1):
+            row["srNo"] = number
+        self.sets[path] = (owner, key)
+
+    def rewrites(self, path: str) -> bool:
+        """Whether path lies inside a row list that is written back whole"""
+        return any(path.startswith(rows_path + ".") for rows_path in self.rewritten)
+
+    def set_paths(self) -> dict:
+        """path -> value of every $set, once compute_bom_figures has run on the patched copy"""
+        values = {path: owner[key] for path, (owner, key) in self.sets.items() if not self.rewrites(path)}
+        for path, row in self.fabric_rows.items():
+            if not self.rewrites(path):
+                values.update({f"{path}.{column}": row.get(column) for column in FABRIC_DERIVED_COLUMNS})
+        for path in self.rewritten:
+            owner, key = self.row_lists[path]
+            values[path] = owner[key]
+        return values
+
+    def array_filters(self, update: dict) -> Optional[list]:
+        """Filters of the identifiers an update's paths use; Mongo refuses unused ones"""
+        used = " ".join(path for fields in update.values() for path in fields)
+        return [array_filter for name, array_filter in self.filters.values() if f"$[{name}]" in used] or None
+
+    def document_fields(self, version: int, username: str) -> dict:
+        """Fields every patch sets on the BOM document: figures and versions"""
+        return {
+            **{field: self.bom.get(field) for field in BOM_COST_FIELDS},
+            **{f"part_versions.{part}": version for part in self.parts},
+            "version": version,
+            "updated_at": datetime.now(timezone.utc),
+            "updated_by": username
+        }
+
+    def update(self, version: int, username: str) -> dict:
+        """The Mongo update of an embedded BOM, once compute_bom_figures has run on the patched copy"""
+        update = {"$set": {**self.set_paths(), **self.document_fields(version, username)}}
+        pushes = {path: rows for path, rows in self.pushes.items() if rows and path not in self.rewritten}
+        if pushes:
+            update["$push"] = {path: {"$each": rows, **({"$position": self.positions[path]} if path in self.positions else {})}
+                               for path, rows in pushes.items()}
+        pulls = {path: row_ids for path, row_ids in self.pulls.items() if path not in self.rewritten}
+        if pulls:
+            update["$pull"] = {path: {"rowId": {"$in": row_ids}} for path, row_ids in pulls.items()}
+        return update
+
+# BOM line storage
+# A comprehensive BOM with layout "lines" keeps its header, table names and
+# figures in comprehensive_boms and each fabric, trims and operations row in
+# a bom_lines document of its own:
+#   {bom_id, section: fabric|trims|operations, table_id, position, rowId, ...row}
+# Line-level questions become index lookups, the BOM document stays small
+# however many rows it has, and a write touches only the lines it changed
+# (and those whose position moved). Readers put the rows back, so the API
+# returns the same shape for both layouts.
+#
+# There are no multi-document transactions, so a write bumps the version and
+# locks the BOM (lock_expires_at) in one update, writes the lines, then
+# unlocks. A reader reads the lines between two reads of the version and
+# starts over if a write began in between. If a writer dies, its lock
+# expires and the next write of the BOM rewrites whatever lines differ.
+# Row fields named like the line fields below are not stored.
+BOM_LINE_FIELDS = ["_id", "bom_id", "section", "table_id", "position"]
+BOM_ROW_FIELDS = ["fabricTables", "trimsTables", "operations"]
+# Bookkeeping of lines-layout BOMs, left out of API responses
+BOM_LAYOUT_FIELDS = ["layout", "line_counts", "lock_expires_at"]
+BOM_LINES_READ_ATTEMPTS = 50
+BOM_LINES_READ_WAIT = 0.05
+
+def bom_lines(bom: dict) -> list:
+    """bom_lines documents for the rows of `bom`, which must have rowIds"""
+    return [{**row, "bom_id": bom["id"], "section": section, "table_id": table_id, "position": position}
+            for section, table_id, rows in bom_row_groups(bom)
+            for position, row in enumerate(rows) if isinstance(row, dict)]
+
+def bom_line_header(bom: dict) -> dict:
+    """Fields standing in for the rows on the document of a lines-layout BOM"""
+    counts = dict.fromkeys(["fabric", "trims", "operations"], 0)
+    for section, _, rows in bom_row_groups(bom):
+        counts[section] += len(rows)
+    tables = {key: [{field: value for field, value in table.items() if field != "items"}
+                    for table in bom.get(key) or [] if isinstance(table, dict)]
+              for key in BOM_TABLE_SECTIONS}
+    return {**tables, "line_counts": counts, "layout": "lines"}
+
+def bom_line_writes(before: dict, after: dict) -> list:
+    """bom_lines writes turning the rows of `before` into those of `after`"""
+    def by_row(bom: dict) -> dict:
+        return {(line["section"], line["table_id"], line["rowId"]): line for line in bom_lines(bom)}
+
+    old, new = by_row(before), by_row(after)
+    writes = []
+    for (section, table_id, row_id), line in new.items():
+        if (section, table_id, row_id) not in old:
+            writes.append(InsertOne(line))
+        elif line != old[(section, table_id, row_id)]:
+            writes.append(ReplaceOne({"bom_id": line["bom_id"], "rowId": row_id, "section": section, "table_id": table_id}, line))
+    deleted = {}
+    for section, table_id, row_id in old.keys() - new.keys():
+        deleted.setdefault((section, table_id), []).append(row_id)
+    writes += [DeleteMany({"bom_id": before["id"], "rowId": {"$in": row_ids}, "section": section, "table_id": table_id})
+               for (section, table_id), row_ids in deleted.items()]
+    return writes
+
+def bom_locked(bom: dict) -> bool:
+    return bool(bom.get("lock_expires_at")) and bom["lock_expires_at"] > datetime.now(timezone.utc)
+
+async def attach_bom_lines(boms: list):
+    """Put the rows of the lines-layout BOMs among `boms` back into them, in place"""
+    lined = {bom["id"]: bom for bom in boms if bom.get("layout") == "lines"}
+    if not lined:
+        return
+    groups = {}
+    for bom_id, bom in lined.items():
+        bom["operations"] = []
+        groups[(bom_id, "operations", None)] = bom["operations"]
+        for key, section in BOM_TABLE_SECTIONS.items():
+            for table in bom.get(key) or []:
+                table["items"] = []
+                groups[(bom_id, section, table.get("id"))] = table["items"]
+    cursor = db.bom_lines.find({"bom_id": {"$in": list(lined)}}, {"_id": 0}).sort(
+        [("bom_id", 1), ("section", 1), ("table_id", 1), ("position", 1)]).batch_size(STREAM_BATCH_SIZE)
+    async for line in cursor:
+        rows = groups.get((line["bom_id"], line["section"], line.get("table_id")))
+        if rows is not None:
+            rows.append({field: value for field, value in line.items() if field not in BOM_LINE_FIELDS})
+
+def public_bom(bom: dict) -> dict:
+    for field in BOM_LAYOUT_FIELDS:
+        bom.pop(field, None)
+    return bom
+
+async def expand_boms(boms: list):
+    """Turn BOM documents of either layout into the shape the API returns"""
+    await attach_bom_lines(boms)
+    for bom in boms:
+        public_bom(bom)
+
+async def read_comprehensive_bom(bom_id: str) -> Optional[dict]:
+    """A comprehensive BOM with its rows, whatever its layout; None if there is none.
+
+    Lines are read between two reads of the BOM's version, and read again if
+    a write began in between.
+    """
+    for _ in range(BOM_LINES_READ_ATTEMPTS):
+        bom = await db.comprehensive_boms.find_one({"id": bom_id}, {"_id": 0})
+        if not bom or bom.get("layout") != "lines":
+            return bom
+        if not bom_locked(bom):
+            await attach_bom_lines([bom])
+            current = await db.comprehensive_boms.find_one({"id": bom_id}, {"_id": 0, "version": 1})
+            if current is None or current.get("version") == bom.get("version"):
+                return bom if current else None
+        await asyncio.sleep(BOM_LINES_READ_WAIT)
+    raise HTTPException(status_code=503, detail="BOM is being saved; retry")
+
+async def write_lined_bom(before: dict, after: dict, fields: dict) -> bool:
+    """Store lines-layout BOM `before`, read with its rows, as `after`.
+
+    `fields` are set on the BOM document along with those standing in for
+    the rows, and must include the bumped version. False, with nothing
+    written, if the BOM was written or is locked since `before` was read.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.comprehensive_boms.update_one(
+        {"id": before["id"], "version": before.get("version"), "lock_expires_at": {"$not": {"$gt": now}}},
+        {"$set": {**bom_line_header(after), **fields, "lock_expires_at": now + BOM_LINES_LOCK}}
+    )
+    if not result.matched_count:
+        return False
+    try:
+        writes = bom_line_writes(before, after)
+        if writes:
+            await db.bom_lines.bulk_write(writes, ordered=False)
+    finally:
+        await db.comprehensive_boms.update_one({"id": before["id"], "version": fields["version"]},
+                                               {"$unset": {"lock_expires_at": ""}})
+    return True
+
+async def move_bom_to_lines(bom: dict) -> bool:
+    """Move the rows of embedded BOM `bom` into bom_lines; False if it changed or is being moved meanwhile"""
+    moved = copy.deepcopy(bom)
+    assign_row_ids(moved)
+    # Only the holder of the BOM's lock touches its lines, so two moves can't
+    # delete each other's. Embedded writes don't take it; the version check
+    # below catches those.
+    now = datetime.now(timezone.utc)
+    lock = now + BOM_LINES_LOCK
+    locked = await db.comprehensive_boms.update_one(
+        {"id": bom["id"], "version": bom.get("version"), "layout": {"$ne": "lines"},
+         "lock_expires_at": {"$not": {"$gt": now}}},
+        {"$set": {"lock_expires_at": lock}}
+    )
+    if not locked.matched_count:
+        return False
+    moved_ok = False
+    try:
+        # Lines left by an interrupted move
+        await db.bom_lines.delete_many({"bom_id": bom["id"]})
+        lines = bom_lines(moved)
+        if lines:
+            await db.bom_lines.insert_many(lines)
+        result = await db.comprehensive_boms.update_one(
+            {"id": bom["id"], "version": bom.get("version"), "lock_expires_at": lock},
+            {"$set": {**bom_line_header(moved), "version": (bom.get("version") or 0) + 1},
+             "$unset": {"operations": "", "lock_expires_at": ""}}
+        )
+        moved_ok = bool(result.matched_count)
+    finally:
+        # Unless the move landed after all (e.g. its reply was lost), drop the lines while still holding the lock
+        if not moved_ok and await db.comprehensive_boms.find_one({"id": bom["id"], "lock_expires_at": lock}, {"_id": 1}):
+            await db.bom_lines.delete_many({"bom_id": bom["id"]})
+            await db.comprehensive_boms.update_one({"id": bom["id"], "lock_expires_at": lock},
+                                                   {"$unset": {"lock_expires_at": ""}})
+    return moved_ok
+
+async def move_bom_to_document(bom: dict) -> bool:
+    """Put the rows of lines-layout BOM `bom`, read with its rows, back into its document; False if it changed meanwhile"""
+    now = datetime.now(timezone.utc)
+    result = await db.comprehensive_boms.update_one(
+        {"id": bom["id"], "version": bom.get("version"), "layout": "lines", "lock_expires_at": {"$not": {"$gt": now}}},
+        {"$set": {**{key: bom.get(key) or [] for key in BOM_ROW_FIELDS}, "version": (bom.get("version") or 0) + 1},
+         "$unset": {field: "" for field in BOM_LAYOUT_FIELDS}}
+    )
+    if not result.matched_count:
+        return False
+    await db.bom_lines.delete_many({"bom_id": bom["id"]})
+    return True
+
+async def move_bom_layout(bom: dict, layout: str) -> bool:
+    """Move a comprehensive BOM document, as stored, to `layout` ("lines" or "embedded")"""
+    if (bom.get("layout") == "lines") == (layout == "lines"):
+        return True
+    if layout == "lines":
+        return await move_bom_to_lines(bom)
+    if bom_locked(bom):
+        return False
+    await attach_bom_lines([bom])
+    return await move_bom_to_document(bom)
+
 # BOM Routes
 @api_router.post("/boms/comprehensive")
 async def create_comprehensive_bom(bom_data: dict, current_user: User = Depends(get_current_user)):
@@ -570,11 +2312,21 @@ async def create_comprehensive_bom(bom_data: dict, current_user: User = Depends(
             "trimsTables": trims_tables,
             "operations": operations,
             "status": "assigned",
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "version": 1,
+            "created_at": datetime.now(timezone.utc),
             "created_by": current_user.username
         }
+        assign_row_ids(bom_doc)
+        await compute_bom_figures([bom_doc])
         
+        if BOM_STORAGE_LAYOUT == "lines":
+            # Lines first: readers find nothing until the BOM document exists
+            lines = bom_lines(bom_doc)
+            if lines:
+                await db.bom_lines.insert_many(lines)
+            bom_doc = {**{key: value for key, value in bom_doc.items() if key != "operations"}, **bom_line_header(bom_doc)}
         await db.comprehensive_boms.insert_one(bom_doc)
+        await collection_changed("comprehensive_boms")
         
         return {
             "message": "BOM created successfully with all tabs",
@@ -586,11 +2338,11 @@ async def create_comprehensive_bom(bom_data: dict, current_user: User = Depends(
 @api_router.post("/boms", response_model=BOM)
 async def create_bom(bom_input: BOMCreate, current_user: User = Depends(get_current_user)):
     # Get article and color names
-    article = await db.articles.find_one({"id": bom_input.article_id}, {"_id": 0})
+    article = await cached_master_document("articles", bom_input.article_id)
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
     
-    color = await db.colors.find_one({"id": bom_input.color_id}, {"_id": 0})
+    color = await cached_master_document("colors", bom_input.color_id)
     if not color:
         raise HTTPException(status_code=404, detail="Color not found")
     
@@ -607,53 +2359,149 @@ async def create_bom(bom_input: BOMCreate, current_user: User = Depends(get_curr
     )
     
     doc = bom_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.boms.insert_one(doc)
+    await collection_changed("boms")
     return bom_obj
 
+# BOM listing
+# Regular and comprehensive BOMs are listed by one aggregation: each branch
+# sorts and limits on its own (status, created_at, id) index, then $unionWith
+# merges the two short runs. A page reads at most 2 × (limit + 1) documents
+# however many BOMs there are. The summary view computes row counts inside
+# Mongo, so table rows never leave the database; costs are stored fields.
+BOM_SORT_FIELDS = ["created_at", "total_cost", "cost_per_piece"]
+
+def sum_over(array: str, each) -> dict:
+    return {"$sum": {"$map": {"input": {"$ifNull": [array, []]}, "as": "row", "in": each}}}
+
+REGULAR_BOM_SUMMARY = {
+    "_id": 0, "id": 1, "article_id": 1, "article_name": 1, "color_id": 1, "color_name": 1,
+    "total_cost": 1, "status": 1, "mrp_id": 1, "created_at": 1,
+    "item_count": {"$size": {"$ifNull": ["$items", []]}}
+}
+
+COMPREHENSIVE_BOM_SUMMARY = {
+    "_id": 0, "id": 1, "header": 1, "status": 1, "created_at": 1, "created_by": 1,
+    "fabric_table_count": {"$size": {"$ifNull": ["$fabricTables", []]}},
+    # Lines-layout BOMs keep their row counts; embedded ones are counted
+    "fabric_line_count": {"$ifNull": ["$line_counts.fabric", sum_over("$fabricTables", {"$size": {"$ifNull": ["$$row.items", []]}})]},
+    "trims_line_count": {"$ifNull": ["$line_counts.trims", sum_over("$trimsTables", {"$size": {"$ifNull": ["$$row.items", []]}})]},
+    "operation_count": {"$ifNull": ["$line_counts.operations", {"$size": {"$ifNull": ["$operations", []]}}]},
+    **{field: 1 for field in BOM_COST_FIELDS}
+}
+
+def bom_list_branch(match: dict, sort_field: str, limit: int, projection: dict, bom_type: str) -> list:
+    return [
+        {"$match": match},
+        {"$sort": {sort_field: 1, "id": 1}},
+        {"$limit": limit},
+        {"$project": projection},
+        {"$set": {"bom_type": bom_type}}
+    ]
+
 @api_router.get("/boms")
-async def get_boms(status: Optional[str] = None, current_user: User = Depends(get_current_user)):
+async def get_boms(status: Optional[str] = None, view: str = Query("summary", pattern="^(summary|full)$"),
+                   sort: str = Query("created_at", pattern=f"^({'|'.join(BOM_SORT_FIELDS)})$"),
+                   min_cost: Optional[float] = None, max_cost: Optional[float] = None,
+                   page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    """Regular and comprehensive BOMs in (sort, id) order.
+
+    view=summary (the default) returns header fields, row counts and costs;
+    view=full returns every table row as well. min_cost/max_cost bound the
+    sort field when sorting by a cost, total_cost otherwise.
+    """
     query = {}
     if status:
         query["status"] = status
+    cost_field = sort if sort != "created_at" else "total_cost"
+    bounds = {operator: value for operator, value in (("$gte", min_cost), ("$lte", max_cost)) if value is not None}
+    if bounds:
+        query[cost_field] = bounds
+    summary = view == "summary"
+    regular_projection = REGULAR_BOM_SUMMARY if summary else {"_id": 0}
+    comprehensive_projection = COMPREHENSIVE_BOM_SUMMARY if summary else {"_id": 0}
     
-    # Fetch from both collections
-    boms_regular = await db.boms.find(query, {"_id": 0}).to_list(1000)
-    boms_comprehensive = await db.comprehensive_boms.find(query, {"_id": 0}).to_list(1000)
-    
-    # Process regular BOMs
-    for bom in boms_regular:
-        if isinstance(bom.get('created_at'), str):
-            bom['created_at'] = datetime.fromisoformat(bom['created_at'])
-        bom['bom_type'] = 'regular'
+    if page.stream:
+        return stream_documents([
+            (db.boms, query, {"bom_type": "regular"}, regular_projection),
+            (db.comprehensive_boms, query, {"bom_type": "comprehensive"}, comprehensive_projection)
+        ], page, sort_field=sort, expand=None if summary else expand_boms)
     
-    # Process comprehensive BOMs
-    for bom in boms_comprehensive:
-        if isinstance(bom.get('created_at'), str):
-            bom['created_at'] = datetime.fromisoformat(bom['created_at'])
-        bom['bom_type'] = 'comprehensive'
+    not_modified = await conditional_list(page, "boms", "comprehensive_boms")
+    if not_modified:
+        return not_modified
     
-    # Combine both lists
-    all_boms = boms_regular + boms_comprehensive
+    match = keyset_query(query, page.cursor, sort)
+    limit = page.limit + 1
+    pipeline = bom_list_branch(match, sort, limit, regular_projection, "regular") + [
+        {"$unionWith": {
+            "coll": "comprehensive_boms",
+            "pipeline": bom_list_branch(match, sort, limit, comprehensive_projection, "comprehensive")
+        }},
+        {"$sort": {sort: 1, "id": 1}},
+        {"$limit": limit}
+    ]
+    boms = await db.boms.aggregate(pipeline).to_list(limit)
+    if len(boms) > page.limit:
+        boms = boms[:page.limit]
+        page.response.headers["X-Next-Cursor"] = encode_cursor(boms[-1], sort)
+    if not summary:
+        await expand_boms(boms)
     
-    return all_boms
+    return boms
 
 @api_router.get("/boms/{bom_id}")
-async def get_bom(bom_id: str, current_user: User = Depends(get_current_user)):
+async def get_bom(bom_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
     # Try finding in regular BOMs first
     bom = await db.boms.find_one({"id": bom_id}, {"_id": 0})
     
     # If not found, try comprehensive BOMs
     if not bom:
-        bom = await db.comprehensive_boms.find_one({"id": bom_id}, {"_id": 0})
+        bom = await read_comprehensive_bom(bom_id)
     
     if not bom:
         raise HTTPException(status_code=404, detail="BOM not found")
     
-    if isinstance(bom.get('created_at'), str):
-        bom['created_at'] = datetime.fromisoformat(bom['created_at'])
+    public_bom(bom)
+    return conditional_document(request, response, bom) or bom
+
+@api_router.get("/boms/{bom_id}/export")
+async def export_bom(bom_id: str, file_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+                     section: str = Query("fabric", pattern="^(fabric|trims|operations)$"),
+                     current_user: User = Depends(get_current_user)):
+    """Workbook with one sheet per fabric table, trims table and operations.
+
+    CSV carries one section (`section`), with a Table column naming each row's table.
+    """
+    bom = await read_comprehensive_bom(bom_id)
+    if not bom:
+        regular = await db.boms.find_one({"id": bom_id}, {"_id": 0})
+        if not regular:
+            raise HTTPException(status_code=404, detail="BOM not found")
+        items = regular.get("items", [])
+        columns = item_columns(items)
+        return await export_response(f"bom_{regular['article_name']}_{regular['color_name']}", file_format,
+                                     [("Items", columns, list_batches(items, columns))])
     
-    return bom
+    filename = f"bom_{bom.get('header', {}).get('artNo') or bom_id}"
+    sections = {
+        "fabric": [(table.get("name") or f"Fabric {idx}", export_rows(table.get("items", [])))
+                   for idx, table in enumerate(bom.get("fabricTables", []), start=1)],
+        "trims": [(table.get("name") or f"Trims {idx}", export_rows(table.get("items", [])))
+                  for idx, table in enumerate(bom.get("trimsTables", []), start=1)],
+        "operations": [("Operations", export_rows(bom.get("operations", [])))]
+    }
+    if file_format == "csv":
+        rows = [{"Table": name, **item} for name, items in sections[section] for item in items]
+        columns = item_columns(rows)
+        return await export_response(f"{filename}_{section}", file_format, [(section, columns, list_batches(rows, columns))])
+    
+    header = bom.get("header", {})
+    sheets = [("Header", ["Field", "Value"], list_batches([{"Field": key, "Value": value} for key, value in header.items()], ["Field", "Value"]))]
+    for name, items in sections["fabric"] + sections["trims"] + sections["operations"]:
+        columns = item_columns(items)
+        sheets.append((name, columns, list_batches(items, columns)))
+    return await export_response(filename, file_format, sheets)
 
 @api_router.put("/boms/{bom_id}")
 async def update_bom(bom_id: str, bom_data: dict, current_user: User = Depends(get_current_user)):
@@ -663,7 +2511,7 @@ async def update_bom(bom_id: str, bom_data: dict, current_user: User = Depends(g
         collection = db.boms
         
         if not existing_bom:
-            existing_bom = await db.comprehensive_boms.find_one({"id": bom_id})
+            existing_bom = await read_comprehensive_bom(bom_id)
             collection = db.comprehensive_boms
         
         if not existing_bom:
@@ -680,33 +2528,173 @@ async def update_bom(bom_id: str, bom_data: dict, current_user: User = Depends(g
             "fabricTables": fabric_tables,
             "trimsTables": trims_tables,
             "operations": operations,
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc),
             "updated_by": current_user.username
         }
+        query = {"id": bom_id}
+        if collection.name == "comprehensive_boms":
+            # Replacing the whole BOM conflicts with an edit to any part of it
+            # since the version the client sent (see BOM patches)
+            version = bom_data.get("version")
+            if version is not None and max((existing_bom.get("part_versions") or {}).values(), default=0) > version:
+                raise HTTPException(status_code=409, detail="BOM was changed by someone else; reload it and reapply your edits")
+            assign_row_ids(update_doc)
+            await compute_bom_figures([update_doc])
+            query["version"] = existing_bom.get("version")
+            update_doc["version"] = (existing_bom.get("version") or 0) + 1
+            update_doc["part_versions"] = dict.fromkeys(bom_parts(update_doc), update_doc["version"])
         
-        result = await collection.update_one(
-            {"id": bom_id},
-            {"$set": update_doc}
-        )
+        if existing_bom.get("layout") == "lines":
+            fields = {key: value for key, value in update_doc.items() if key not in BOM_ROW_FIELDS}
+            matched = modified = await write_lined_bom(existing_bom, {**existing_bom, **update_doc}, fields)
+        else:
+            result = await collection.update_one(query, {"$set": update_doc})
+            matched, modified = result.matched_count, result.modified_count
         
-        if result.modified_count == 0:
+        if not matched:
+            raise HTTPException(status_code=409, detail="BOM was changed while saving; reload it and reapply your edits")
+        if not modified:
             raise HTTPException(status_code=400, detail="BOM update failed")
+        await collection_changed(collection.name)
         
         return {
             "message": "BOM updated successfully",
-            "bom_id": bom_id
+            "bom_id": bom_id,
+            "version": update_doc.get("version")
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating BOM: {str(e)}")
+
+@api_router.patch("/boms/{bom_id}")
+async def patch_bom(bom_id: str, patch: BOMPatch, current_user: User = Depends(get_current_user)):
+    """Apply cell and row edits to a comprehensive BOM (see BOM patches).
+
+    Returns the new version, the cost rollups and the final values of the
+    edited and inserted rows, including the rowIds given to inserted rows.
+    """
+    try:
+        for _ in range(BOM_PATCH_RETRIES):
+            bom = await read_comprehensive_bom(bom_id)
+            if not bom:
+                if await db.boms.find_one({"id": bom_id}, {"_id": 1}):
+                    raise HTTPException(status_code=400, detail="Only comprehensive BOMs can be patched")
+                raise HTTPException(status_code=404, detail="BOM not found")
+            
+            plan = BOMPatchPlan(copy.deepcopy(bom))
+            plan.apply(patch.operations)
+            part_versions = bom.get("part_versions") or {}
+            stale = sorted(part for part in plan.parts if part_versions.get(part, 0) > patch.version)
+            if stale:
+                raise HTTPException(status_code=409, detail={
+                    "message": "Parts of this BOM were changed by someone else; reload them and reapply your edits",
+                    "parts": stale,
+                    "version": bom.get("version") or 0
+                })
+            
+            await compute_bom_figures([plan.bom])
+            version = (bom.get("version") or 0) + 1
+            if bom.get("layout") == "lines":
+                fields = {"header": plan.bom.get("header"), **plan.document_fields(version, current_user.username)}
+                stored = await write_lined_bom(bom, plan.bom, fields)
+            else:
+                update = plan.update(version, current_user.username)
+                result = await db.comprehensive_boms.update_one(
+                    {"id": bom_id, "version": bom.get("version")},
+                    update,
+                    array_filters=plan.array_filters(update)
+                )
+                stored = result.matched_count
+            if stored:
+                break
+        else:
+            raise HTTPException(status_code=409, detail="BOM kept changing while being patched; retry")
+        await collection_changed("comprehensive_boms")
+        
+        return {
+            "message": "BOM updated successfully",
+            "bom_id": bom_id,
+            "version": version,
+            **{field: plan.bom.get(field) for field in BOM_COST_FIELDS},
+            "rows": plan.changed
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating BOM: {str(e)}")
 
+@api_router.post("/boms/recompute")
+async def recompute_boms(current_user: User = Depends(require_admin)):
+    """Recompute fabric requirements and cost rollups of every comprehensive BOM.
+
+    Needed after changing FABRIC_PROCESS_LOSS; fabric edits re-cost their BOMs
+    on their own.
+    """
+    result = await recompute_comprehensive_boms({})
+    return {"message": "BOM figures recomputed", **result}
+
+@api_router.post("/boms/{bom_id}/layout")
+async def set_bom_layout(bom_id: str, layout: str = Query(..., pattern="^(embedded|lines)$"),
+                         current_user: User = Depends(require_admin)):
+    """Move one comprehensive BOM's rows into or out of bom_lines; migrate_bom_layout.py moves them all"""
+    bom = await db.comprehensive_boms.find_one({"id": bom_id}, {"_id": 0})
+    if not bom:
+        raise HTTPException(status_code=404, detail="BOM not found")
+    if not await move_bom_layout(bom, layout):
+        raise HTTPException(status_code=409, detail="BOM is being edited; retry")
+    await collection_changed("comprehensive_boms")
+    return {"message": f"BOM stored as {layout}", "bom_id": bom_id}
+
+def embedded_line_branch(key: str, section: str, match: dict) -> list:
+    """Rows of embedded BOMs' `key` tables matching `match`, shaped like bom_lines documents"""
+    rows = f"{key}.items"
+    return [
+        {"$match": {"layout": {"$ne": "lines"}, rows: {"$elemMatch": match}}},
+        {"$unwind": f"${key}"},
+        {"$unwind": {"path": f"${rows}", "includeArrayIndex": "position"}},
+        {"$match": {f"{rows}.{field}": value for field, value in match.items()}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+            f"${rows}", {"bom_id": "$id", "section": section, "table_id": f"${key}.id", "position": "$position"}
+        ]}}}
+    ]
+
+@api_router.get("/bom-lines")
+async def search_bom_lines(fabric_quality: Optional[str] = Query(None, alias="fabricQuality"),
+                           colour_id: Optional[str] = Query(None, alias="colourId"),
+                           item_code: Optional[str] = Query(None, alias="itemCode"),
+                           component: Optional[str] = None,
+                           section: Optional[str] = Query(None, pattern="^(fabric|trims)$"),
+                           limit: int = Query(100, ge=1, le=1000),
+                           current_user: User = Depends(get_current_user)):
+    """Comprehensive BOM rows matching every given field, e.g. every line using a fabric quality in one colour.
+
+    Rows come back as bom_lines documents: the row's fields plus bom_id,
+    section, table_id and position. Lines-layout BOMs are answered from the
+    bom_lines indexes; BOMs still embedded are unwound, which scans them.
+    """
+    match = {field: value for field, value in (("fabricQuality", fabric_quality), ("colourId", colour_id),
+                                               ("itemCode", item_code), ("component", component)) if value is not None}
+    if not match:
+        raise HTTPException(status_code=400, detail="Give at least one of fabricQuality, colourId, itemCode and component")
+    sections = [section] if section else list(BOM_TABLE_SECTIONS.values())
+    pipeline = [{"$match": {**match, "section": {"$in": sections}}}, {"$project": {"_id": 0}}]
+    pipeline += [{"$unionWith": {"coll": "comprehensive_boms", "pipeline": embedded_line_branch(key, name, match)}}
+                 for key, name in BOM_TABLE_SECTIONS.items() if name in sections]
+    pipeline += [{"$sort": {"bom_id": 1, "section": 1, "table_id": 1, "position": 1}}, {"$limit": limit}]
+    return await db.bom_lines.aggregate(pipeline).to_list(limit)
+
 @api_router.delete("/boms/{bom_id}")
 async def delete_bom(bom_id: str, current_user: User = Depends(get_current_user)):
     # Try deleting from both collections
     result1 = await db.boms.delete_one({"id": bom_id})
     result2 = await db.comprehensive_boms.delete_one({"id": bom_id})
+    if result2.deleted_count:
+        await db.bom_lines.delete_many({"bom_id": bom_id})
     
     if result1.deleted_count == 0 and result2.deleted_count == 0:
         raise HTTPException(status_code=404, detail="BOM not found")
+    await collection_changed("boms" if result1.deleted_count else "comprehensive_boms")
     return {"message": "BOM deleted successfully"}
 
 # MRP Routes
@@ -758,7 +2746,6 @@ async def create_mrp(mrp_input: MRPCreate, current_user: User = Depends(get_curr
     )
     
     doc = mrp_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.mrps.insert_one(doc)
     
     # Update BOMs as assigned
@@ -766,25 +2753,52 @@ async def create_mrp(mrp_input: MRPCreate, current_user: User = Depends(get_curr
         {"id": {"$in": mrp_input.bom_ids}},
         {"$set": {"status": "assigned", "mrp_id": mrp_obj.id}}
     )
+    await collection_changed("mrps", "boms")
     
     return mrp_obj
 
 @api_router.get("/mrps", response_model=List[MRP])
-async def get_mrps(current_user: User = Depends(get_current_user)):
-    mrps = await db.mrps.find({}, {"_id": 0}).to_list(1000)
-    for mrp in mrps:
-        if isinstance(mrp['created_at'], str):
-            mrp['created_at'] = datetime.fromisoformat(mrp['created_at'])
+async def get_mrps(page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
+    if page.stream:
+        return stream_documents([(db.mrps, {}, {})], page)
+    not_modified = await conditional_list(page, "mrps")
+    if not_modified:
+        return not_modified
+    mrps = await fetch_page(db.mrps, {}, page)
     return mrps
 
+MRP_EXPORT_COLUMNS = ["mrp_number", "created_at"] + list(MRPMaterialRequirement.model_fields)
+
+@api_router.get("/mrps/export")
+async def export_mrps(file_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+                      current_user: User = Depends(get_current_user)):
+    """Every MRP's material requirements, one row per material"""
+    cursor = db.mrps.aggregate([
+        {"$sort": {"created_at": 1, "id": 1}},
+        {"$unwind": "$material_requirements"},
+        {"$replaceWith": {"$mergeObjects": [
+            {"mrp_number": "$mrp_number", "created_at": "$created_at"}, "$material_requirements"
+        ]}}
+    ], batchSize=STREAM_BATCH_SIZE)
+    return await export_response("mrp_requirements", file_format,
+                                 [("Material Requirements", MRP_EXPORT_COLUMNS, cursor_batches(cursor, MRP_EXPORT_COLUMNS))])
+
+@api_router.get("/mrps/{mrp_id}/export")
+async def export_mrp(mrp_id: str, file_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+                     current_user: User = Depends(get_current_user)):
+    mrp = await db.mrps.find_one({"id": mrp_id}, {"_id": 0})
+    if not mrp:
+        raise HTTPException(status_code=404, detail="MRP not found")
+    columns = list(MRPMaterialRequirement.model_fields)
+    return await export_response(f"mrp_{mrp['mrp_number']}", file_format,
+                                 [("Material Requirements", columns, list_batches(mrp["material_requirements"], columns))])
+
 @api_router.get("/mrps/{mrp_id}", response_model=MRP)
-async def get_mrp(mrp_id: str, current_user: User = Depends(get_current_user)):
+async def get_mrp(mrp_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
     mrp = await db.mrps.find_one({"id": mrp_id}, {"_id": 0})
     if not mrp:
         raise HTTPException(status_code=404, detail="MRP not found")
-    if isinstance(mrp['created_at'], str):
-        mrp['created_at'] = datetime.fromisoformat(mrp['created_at'])
-    return MRP(**mrp)
+    return conditional_document(request, response, mrp) or MRP(**mrp)
 
 @api_router.delete("/mrps/{mrp_id}")
 async def delete_mrp(mrp_id: str, current_user: User = Depends(get_current_user)):
@@ -801,6 +2815,7 @@ async def delete_mrp(mrp_id: str, current_user: User = Depends(get_current_user)
     
     # Delete MRP
     await db.mrps.delete_one({"id": mrp_id})
+    await collection_changed("mrps", "boms")
     return {"message": "MRP deleted successfully"}
 
 
@@ -815,6 +2830,7 @@ class FieldConfig(BaseModel):
     label: str  # Display label
     type: str  # text, number, dropdown, date, file, etc.
     required: bool = False
+    unique: bool = False  # Part of the natural key for upsert imports
     options: Optional[List[str]] = None  # For dropdown/multi-select
     validation: Optional[dict] = None  # Min, max, regex, etc.
     placeholder: Optional[str] = None
@@ -844,7 +2860,6 @@ async def create_master_config(config: MasterConfiguration, current_user: User =
         config.created_by = current_user.username
         config.created_at = datetime.now(timezone.utc)
         doc = config.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
         
         await db.master_configurations.insert_one(doc)
         
@@ -856,20 +2871,16 @@ async def create_master_config(config: MasterConfiguration, current_user: User =
         raise HTTPException(status_code=500, detail=f"Error creating master config: {str(e)}")
 
 @api_router.get("/master-configs")
-async def get_master_configs(category: Optional[str] = None, current_user: User = Depends(get_current_user)):
+async def get_master_configs(category: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
     """Get all master configurations"""
     try:
         query = {}
         if category:
             query["category"] = category
         
-        configs = await db.master_configurations.find(query, {"_id": 0}).to_list(1000)
-        
-        for config in configs:
-            if isinstance(config.get('created_at'), str):
-                config['created_at'] = datetime.fromisoformat(config['created_at'])
-            if isinstance(config.get('updated_at'), str):
-                config['updated_at'] = datetime.fromisoformat(config['updated_at'])
+        if page.stream:
+            return stream_documents([(db.master_configurations, query, {})], page)
+        configs = await fetch_page(db.master_configurations, query, page)
         
         return configs
     except Exception as e:
@@ -884,11 +2895,6 @@ async def get_master_config(config_id: str, current_user: User = Depends(get_cur
         if not config:
             raise HTTPException(status_code=404, detail="Master configuration not found")
         
-        if isinstance(config.get('created_at'), str):
-            config['created_at'] = datetime.fromisoformat(config['created_at'])
-        if isinstance(config.get('updated_at'), str):
-            config['updated_at'] = datetime.fromisoformat(config['updated_at'])
-        
         return config
     except HTTPException:
         raise
@@ -908,8 +2914,8 @@ async def update_master_config(config_id: str, config: MasterConfiguration, curr
         config.updated_by = current_user.username
         
         doc = config.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['updated_at'] = doc['updated_at'].isoformat()
+        if doc['created_at'] is None:
+            doc.pop('created_at')
         
         await db.master_configurations.update_one(
             {"id": config_id},
@@ -934,6 +2940,8 @@ async def delete_master_config(config_id: str, current_user: User = Depends(get_
         # Also delete all data for this master type
         collection_name = f"dynamic_{config_id}"
         await db[collection_name].drop()
+        ensured_dynamic_collections.discard(collection_name)
+        await collection_changed(collection_name)
         
         return {"message": "Master configuration deleted successfully"}
     except HTTPException:
@@ -957,12 +2965,14 @@ async def create_dynamic_master_data(config_id: str, data: dict, current_user: U
         
         # Add metadata
         data["id"] = str(uuid.uuid4())
-        data["created_at"] = datetime.now(timezone.utc).isoformat()
+        data["created_at"] = datetime.now(timezone.utc)
         data["created_by"] = current_user.username
         
         # Store in dynamic collection
         collection_name = f"dynamic_{config_id}"
+        await ensure_dynamic_indexes(config_id)
         await db[collection_name].insert_one(data)
+        await collection_changed(collection_name)
         
         return {
             "message": "Master data created successfully",
@@ -974,9 +2984,15 @@ async def create_dynamic_master_data(config_id: str, data: dict, current_user: U
         raise HTTPException(status_code=500, detail=f"Error creating master data: {str(e)}")
 
 @api_router.get("/dynamic-masters/{config_id}/data")
-async def get_dynamic_master_data(config_id: str, current_user: User = Depends(get_current_user)):
+async def get_dynamic_master_data(config_id: str, fields: Optional[str] = None, page: ListParams = Depends(), current_user: User = Depends(get_current_user)):
     """Get all data for a dynamic master"""
     try:
+        # Answer revalidations before any query; deleting the config bumps this too
+        if not page.stream:
+            not_modified = await conditional_list(page, f"dynamic_{config_id}")
+            if not_modified:
+                return not_modified
+        
         # Get master configuration
         config = await db.master_configurations.find_one({"id": config_id})
         
@@ -985,7 +3001,12 @@ async def get_dynamic_master_data(config_id: str, current_user: User = Depends(g
         
         # Fetch data from dynamic collection
         collection_name = f"dynamic_{config_id}"
-        data = await db[collection_name].find({}, {"_id": 0}).to_list(1000)
+        selection = select_fields(fields)
+        if page.stream:
+            return stream_documents([(db[collection_name], {}, {})], page, projection=selection and selection.projection())
+        data = await fetch_page(db[collection_name], {}, page, projection=selection and selection.projection("created_at"))
+        if selection:
+            return selection.render(data, page)
         
         return data
     except HTTPException:
@@ -993,8 +3014,22 @@ async def get_dynamic_master_data(config_id: str, current_user: User = Depends(g
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching master data: {str(e)}")
 
+@api_router.get("/dynamic-masters/{config_id}/export")
+async def export_dynamic_master_data(config_id: str, file_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+                                     current_user: User = Depends(get_current_user)):
+    """Columns follow the FieldConfig order and use the labels, so the file uploads back as-is"""
+    config = await db.master_configurations.find_one({"id": config_id}, {"_id": 0})
+    if not config:
+        raise HTTPException(status_code=404, detail="Master configuration not found")
+    fields = sorted(config.get("fields", []), key=lambda field: field.get("order", 0))
+    columns = [field["name"] for field in fields]
+    headers = [field.get("label") or field["name"] for field in fields]
+    
+    cursor = db[f"dynamic_{config_id}"].find({}, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).batch_size(STREAM_BATCH_SIZE)
+    return await export_response(config_id, file_format, [(config["name"], headers, cursor_batches(cursor, columns))])
+
 @api_router.get("/dynamic-masters/{config_id}/data/{data_id}")
-async def get_dynamic_master_data_by_id(config_id: str, data_id: str, current_user: User = Depends(get_current_user)):
+async def get_dynamic_master_data_by_id(config_id: str, data_id: str, request: Request, response: Response, current_user: User = Depends(get_current_user)):
     """Get specific data item for a dynamic master"""
     try:
         collection_name = f"dynamic_{config_id}"
@@ -1003,7 +3038,7 @@ async def get_dynamic_master_data_by_id(config_id: str, data_id: str, current_us
         if not data:
             raise HTTPException(status_code=404, detail="Data not found")
         
-        return data
+        return conditional_document(request, response, data) or data
     except HTTPException:
         raise
     except Exception as e:
@@ -1014,7 +3049,7 @@ async def update_dynamic_master_data(config_id: str, data_id: str, data: dict, c
     """Update data for a dynamic master"""
     try:
         # Add metadata
-        data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        data["updated_at"] = datetime.now(timezone.utc)
         data["updated_by"] = current_user.username
         
         # Update in dynamic collection
@@ -1026,6 +3061,7 @@ async def update_dynamic_master_data(config_id: str, data_id: str, data: dict, c
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Data not found")
+        await collection_changed(collection_name)
         
         return {"message": "Master data updated successfully"}
     except HTTPException:
@@ -1042,6 +3078,7 @@ async def delete_dynamic_master_data(config_id: str, data_id: str, current_user:
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Data not found")
+        await collection_changed(collection_name)
         
         return {"message": "Master data deleted successfully"}
     except HTTPException:
@@ -1189,7 +3226,7 @@ async def initialize_predefined_masters(current_user: User = Depends(get_current
                 # Create the master configuration
                 config_doc = {
                     **master_config,
-                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "created_at": datetime.now(timezone.utc),
                     "created_by": current_user.username
                 }
                 await db.master_configurations.insert_one(config_doc)
@@ -1214,13 +3251,15 @@ async def initialize_predefined_masters(current_user: User = Depends(get_current
                     if old_data:
                         # Migrate to dynamic collection
                         new_collection = f"dynamic_{master_config['id']}"
+                        await ensure_dynamic_indexes(master_config['id'])
                         for item in old_data:
-                            item["created_at"] = datetime.now(timezone.utc).isoformat()
+                            item["created_at"] = datetime.now(timezone.utc)
                             item["created_by"] = "system_migration"
                             if "id" not in item:
                                 item["id"] = str(uuid.uuid4())
                         
                         await db[new_collection].insert_many(old_data)
+                        await collection_changed(new_collection)
                         migrated_count += len(old_data)
             else:
                 skipped_count += 1
@@ -1278,254 +3317,1200 @@ async def get_predefined_masters_status(current_user: User = Depends(get_current
 
         raise HTTPException(status_code=500, detail=f"Error deleting master data: {str(e)}")
 
+# Bulk import helpers
+UPLOAD_FORMATS = {".xlsx": "excel", ".xls": "excel", ".csv": "csv", ".parquet": "parquet"}
+
+def upload_format(filename: Optional[str]) -> Optional[str]:
+    return UPLOAD_FORMATS.get(Path(filename or "").suffix.lower())
+
+async def spool_upload(file: UploadFile) -> str:
+    """Copy an upload to a temp file piece by piece; returns its path"""
+    fd, path = tempfile.mkstemp(suffix=Path(file.filename or "").suffix, dir=IMPORT_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(UPLOAD_READ_BYTES):
+                spool.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+def open_workbook(path: str):
+    # Read-only mode streams rows from the zip instead of building every cell
+    return openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+def iter_sheet_rows(sheet, min_row: int = 2, width: int = 0):
+    """Yield (row number, values) padded to `width` cells.
+
+    Read-only sheets stop a row at its last stored cell, so trailing blanks
+    would otherwise make rows shorter than the header.
+    """
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=min_row, values_only=True), start=min_row):
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        yield row_idx, row
+
+# Fields that describe a row's history rather than its content
+IMPORT_METADATA_FIELDS = {"id", "created_at", "created_by", "updated_at", "updated_by", "content_hash"}
+
+def content_hash(doc: dict, exclude: set = frozenset()) -> str:
+    content = {key: value for key, value in doc.items() if key not in IMPORT_METADATA_FIELDS and key not in exclude}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=json_default).encode()).hexdigest()
+
+def preview_values(doc: dict) -> dict:
+    return {key: value for key, value in doc.items() if key not in IMPORT_METADATA_FIELDS}
+
+class SheetImporter:
+    """Buffers parsed rows of one sheet and writes them in chunks.
+
+    Rows with a code are checked against the collection with one $in query
+    per chunk and against earlier rows of the same workbook, then the new
+    ones go out in a single insert_many(ordered=False). Write failures are
+    mapped back to their sheet rows in results["errors"]. With `row_ids`
+    each row's id is derived from it and the row number, so rows written
+    again by a resumed job hit the unique id index and count as inserted
+    instead of being duplicated.
+
+    With a natural key the importer upserts instead: rows are matched on the
+    key, skipped when their content_hash is unchanged and otherwise written
+    as one bulk_write of UpdateOne(upsert=True). `defaults` are fields the
+    parser fills in because the sheet has no column for them; they are only
+    written when a row is inserted, so an update keeps the values set in the
+    app.
+
+    A dry run makes the same decisions from the key and hash lookups alone,
+    counts them, keeps a few sample rows in results["preview"] and writes
+    nothing.
+    """
+
+    def __init__(self, collection_name: str, counter_key: str, label: Optional[str], results: dict,
+                 sequence_field: Optional[str] = None, chunk_size: int = IMPORT_CHUNK_SIZE,
+                 natural_key: Optional[List[str]] = None, actor: Optional[str] = None, dry_run: bool = False,
+                 defaults: frozenset = frozenset(), row_ids: Optional[uuid.UUID] = None):
+        self.collection = db[collection_name]
+        self.counter_key = counter_key
+        self.label = label
+        self.results = results
+        self.sequence_field = sequence_field
+        self.chunk_size = chunk_size
+        self.natural_key = natural_key
+        self.actor = actor
+        self.dry_run = dry_run
+        self.defaults = defaults
+        self.row_ids = row_ids
+        self.next_sequence = 1
+        self.seen_codes = set()
+        # Dry run: hashes of keys an earlier chunk of the file would have written
+        self.previewed = {}
+        self.pending = []
+
+    def error(self, row_idx: int, message: str):
+        prefix = f"{self.label} row" if self.label else "Row"
+        self.results["errors"].append(f"{prefix} {row_idx}: {message}")
+
+    def sample(self, action: str, entry: dict) -> bool:
+        samples = self.results["preview"][action]
+        if len(samples) >= IMPORT_PREVIEW_SAMPLES:
+            return False
+        samples.append({"sheet": self.label, **entry})
+        return True
+
+    def key_query(self, keys) -> dict:
+        if len(self.natural_key) == 1:
+            return {self.natural_key[0]: {"$in": [key[0] for key in keys]}}
+        return {"$or": [dict(zip(self.natural_key, key)) for key in keys]}
+
+    async def add(self, row_idx: int, code: Optional[str], doc: dict):
+        self.pending.append((row_idx, code, doc))
+        if len(self.pending) >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, []
+        if self.natural_key:
+            await self.upsert(pending)
+            return
+        codes = {code for _, code, _ in pending if code is not None and code not in self.seen_codes}
+        existing = set()
+        if codes:
+            async for doc in self.collection.find({"code": {"$in": list(codes)}}, {"_id": 0, "code": 1}):
+                existing.add(doc["code"])
+
+        rows = []
+        for row_idx, code, doc in pending:
+            if code is not None:
+                if code in existing or code in self.seen_codes:
+                    if self.dry_run:
+                        self.results["unchanged_count"] += 1
+                    continue
+                self.seen_codes.add(code)
+            if self.dry_run:
+                self.results[self.counter_key] += 1
+                self.sample("insert", {"row": row_idx, "values": preview_values(doc)})
+                continue
+            if self.sequence_field:
+                doc[self.sequence_field] = self.next_sequence
+                self.next_sequence += 1
+            if self.row_ids:
+                doc["id"] = str(uuid.uuid5(self.row_ids, str(row_idx)))
+            rows.append((row_idx, doc))
+        if not rows:
+            return
+
+        try:
+            result = await self.collection.insert_many([doc for _, doc in rows], ordered=False)
+            self.results[self.counter_key] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.results[self.counter_key] += e.details["nInserted"]
+            for write_error in e.details["writeErrors"]:
+                if write_error["code"] == 11000 and write_error.get("keyPattern") == {"id": 1}:
+                    # Written before the job was taken over, after its last checkpoint
+                    self.results[self.counter_key] += 1
+                    continue
+                self.error(rows[write_error["index"]][0], write_error["errmsg"])
+
+    async def upsert(self, pending: list):
+        # A key repeated within the chunk keeps its last row
+        latest = {}
+        for row_idx, _, doc in pending:
+            latest[tuple(doc.get(name) for name in self.natural_key)] = (row_idx, doc)
+        if not latest:
+            return
+
+        existing = {}
+        projection = {"_id": 0, "content_hash": 1, **{name: 1 for name in self.natural_key}}
+        async for doc in self.collection.find(self.key_query(latest), projection):
+            existing[tuple(doc.get(name) for name in self.natural_key)] = doc.get("content_hash")
+        if self.dry_run:
+            await self.preview_upsert(latest, existing)
+            return
+
+        insert_only = {"id", "created_at", "created_by", self.sequence_field, *self.defaults}
+        now = datetime.now(timezone.utc)
+        operations, rows = [], []
+        for key, (row_idx, doc) in latest.items():
+            if key in existing and existing[key] == doc["content_hash"]:
+                self.results["unchanged_count"] += 1
+                continue
+            if key not in existing and self.sequence_field:
+                doc[self.sequence_field] = self.next_sequence
+                self.next_sequence += 1
+            changes = {name: value for name, value in doc.items() if name not in insert_only}
+            if key in existing:
+                changes["updated_at"] = now
+                changes["updated_by"] = self.actor
+            operations.append(UpdateOne(
+                dict(zip(self.natural_key, key)),
+                {"$set": changes, "$setOnInsert": {name: doc[name] for name in insert_only if name in doc}},
+                upsert=True
+            ))
+            rows.append(row_idx)
+        if not operations:
+            return
+
+        try:
+            result = await self.collection.bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details["writeErrors"]:
+                self.error(rows[write_error["index"]], write_error["errmsg"])
+        self.results[self.counter_key] += details["nUpserted"]
+        self.results["updated_count"] += details["nModified"]
+        self.results["unchanged_count"] += details["nMatched"] - details["nModified"]
+
+    async def preview_upsert(self, latest: dict, existing: dict):
+        updated = []
+        for key, (row_idx, doc) in latest.items():
+            known = self.previewed[key] if key in self.previewed else existing.get(key)
+            if key not in existing and key not in self.previewed:
+                self.results[self.counter_key] += 1
+                self.sample("insert", {"row": row_idx, "values": preview_values(doc)})
+            elif known == doc["content_hash"]:
+                self.results["unchanged_count"] += 1
+            else:
+                self.results["updated_count"] += 1
+                if key in existing:
+                    updated.append(key)
+            self.previewed[key] = doc["content_hash"]
+
+        # Only the sampled updates are fetched in full, to show what changes
+        room = IMPORT_PREVIEW_SAMPLES - len(self.results["preview"]["update"])
+        if room <= 0 or not updated:
+            return
+        async for current in self.collection.find(self.key_query(updated[:room]), {"_id": 0}):
+            key = tuple(current.get(name) for name in self.natural_key)
+            if key not in latest:
+                continue
+            row_idx, doc = latest[key]
+            changes = {
+                name: {"from": current.get(name), "to": value}
+                for name, value in preview_values(doc).items()
+                if name not in self.defaults and current.get(name) != value
+            }
+            self.sample("update", {"row": row_idx, "key": dict(zip(self.natural_key, key)), "changes": changes})
+
+# Dynamic master validation
+# A master's FieldConfig list is compiled once into a FieldValidator, which
+# checks and coerces a whole chunk of uploaded rows with vectorized pandas
+# operations. Only rejected rows are visited one by one, to word the report.
+CHECKBOX_VALUES = {
+    "true": True, "yes": True, "y": True, "1": True, "1.0": True,
+    "false": False, "no": False, "n": False, "0": False, "0.0": False
+}
+
+def validation_number(validation: dict, key: str) -> Optional[float]:
+    value = validation.get(key)
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value)
+
+def check_mask(condition: pd.Series) -> np.ndarray:
+    return condition.fillna(False).to_numpy(dtype=bool)
+
+def coerce_text(rule: dict, raw: pd.Series, text: pd.Series):
+    checks = []
+    if rule["pattern"] is not None:
+        checks.append((text.notna() & ~text.str.fullmatch(rule["pattern"]), "has an invalid format"))
+    if rule["min_length"] is not None:
+        checks.append((text.str.len() < rule["min_length"], f"must be at least {rule['min_length']:g} characters"))
+    if rule["max_length"] is not None:
+        checks.append((text.str.len() > rule["max_length"], f"must be at most {rule['max_length']:g} characters"))
+    return text, checks
+
+def coerce_numeric(rule: dict, raw: pd.Series, text: pd.Series):
+    numbers = pd.to_numeric(text, errors="coerce")
+    checks = [(text.notna() & numbers.isna(), "must be a number")]
+    if rule["type"] == "number":
+        fractional = numbers.notna() & (numbers % 1 != 0)
+        checks.append((fractional, "must be a whole number"))
+        numbers = numbers.mask(fractional).astype("Int64")
+    else:
+        numbers = numbers.astype("float64")
+    if rule["min"] is not None:
+        checks.append((numbers < rule["min"], f"must be at least {rule['min']:g}"))
+    if rule["max"] is not None:
+        checks.append((numbers > rule["max"], f"must be at most {rule['max']:g}"))
+    return numbers, checks
+
+def coerce_date(rule: dict, raw: pd.Series, text: pd.Series):
+    # Date cells arrive as datetimes already; text cells are parsed
+    dates = pd.to_datetime(raw.where(text.notna()), errors="coerce", utc=True, format="mixed")
+    return dates, [(text.notna() & dates.isna(), "must be a date")]
+
+def coerce_dropdown(rule: dict, raw: pd.Series, text: pd.Series):
+    choices = text.str.lower().map(rule["options"])
+    return choices, [(text.notna() & choices.isna(), rule["options_message"])]
+
+def coerce_multiselect(rule: dict, raw: pd.Series, text: pd.Series):
+    # Comma-separated choices; lists don't vectorize, so this one loops
+    options = rule["options"]
+    selected, invalid = [], []
+    for value in text.tolist():
+        choices = [] if value is pd.NA else [part.strip().lower() for part in value.split(",") if part.strip()]
+        selected.append([options[choice] for choice in choices if choice in options] or None)
+        invalid.append(any(choice not in options for choice in choices))
+    return pd.Series(selected, index=text.index, dtype=object), [(pd.Series(invalid, index=text.index), rule["options_message"])]
+
+def coerce_checkbox(rule: dict, raw: pd.Series, text: pd.Series):
+    flags = text.str.lower().map(CHECKBOX_VALUES)
+    return flags, [(text.notna() & flags.isna(), "must be yes or no")]
+
+FIELD_COERCERS = {
+    "number": coerce_numeric,
+    "decimal": coerce_numeric,
+    "date": coerce_date,
+    "dropdown": coerce_dropdown,
+    "multiselect": coerce_multiselect,
+    "checkbox": coerce_checkbox
+}
+
+class FieldValidator:
+    """Checks uploaded rows against a master's fields.
+
+    Headers are matched to fields by name or label, ignoring case; columns
+    that match no field are kept as trimmed text. Valid rows get typed
+    values (Int64/float/UTC datetimes/lists/booleans, None for blanks).
+    """
+
+    def __init__(self, fields: list):
+        self.rules = []
+        self.header_names = {}
+        fields = sorted(fields, key=lambda field: field.get("order", 0))
+        for field in fields:
+            self.header_names[field["name"].strip().lower()] = field["name"]
+        for field in fields:
+            label = str(field.get("label") or "").strip()
+            if label:
+                self.header_names.setdefault(label.lower(), field["name"])
+
+            validation = field.get("validation") or {}
+            options = field.get("options") or []
+            pattern = validation.get("regex") or validation.get("pattern")
+            default = field.get("defaultValue")
+            self.rules.append({
+                "name": field["name"],
+                "label": label or field["name"],
+                "type": field.get("type", "text"),
+                "required": bool(field.get("required")),
+                "default": None if default is None or str(default).strip() == "" else str(default).strip(),
+                "options": {str(option).strip().lower(): option for option in options},
+                "options_message": f"must be one of {', '.join(map(str, options))}",
+                "pattern": re.compile(pattern).pattern if pattern else None,
+                "min": validation_number(validation, "min"),
+                "max": validation_number(validation, "max"),
+                "min_length": validation_number(validation, "minLength"),
+                "max_length": validation_number(validation, "maxLength")
+            })
+
+    def column_names(self, headers) -> list:
+        """Field name for each header cell; None for blank or repeated headers"""
+        names, seen = [], set()
+        for header in headers:
+            header = "" if header is None else str(header).strip()
+            name = self.header_names.get(header.lower(), header) or None
+            names.append(name if name not in seen else None)
+            seen.add(name)
+        return names
+
+    def validate(self, names: list, extra: dict, row_numbers: list, frame: pd.DataFrame) -> list:
+        """Check and coerce a chunk whose columns are numbered like `names`.
+
+        Returns (row number, None, document, None) for valid rows and
+        (row number, None, None, message) for rejects. Blank rows are dropped.
+        """
+        rows = row_numbers
+        raws, texts = {}, {}
+        blank = np.ones(len(rows), dtype=bool)
+        for position, name in enumerate(names):
+            if name is None:
+                continue
+            text = frame[position].astype("string").str.strip()
+            texts[name] = text.mask(text == "")
+            raws[name] = frame[position]
+            blank &= texts[name].isna().to_numpy()
+
+        missing = pd.Series(pd.NA, index=frame.index, dtype="string")
+        values, checks = {}, []
+        for rule in self.rules:
+            name = rule["name"]
+            raw, text = raws.get(name, missing.astype(object)), texts.get(name, missing)
+            if rule["default"] is not None:
+                raw, text = raw.where(text.notna(), rule["default"]), text.fillna(rule["default"])
+            value, field_checks = FIELD_COERCERS.get(rule["type"], coerce_text)(rule, raw, text)
+            if rule["required"]:
+                field_checks.append((value.isna(), "is required"))
+            values[name] = value
+            checks += [(check_mask(condition), f"{rule['label']} {message}") for condition, message in field_checks]
+        for name, text in texts.items():
+            values.setdefault(name, text)
+
+        rejected = np.zeros(len(rows), dtype=bool)
+        for condition, _ in checks:
+            rejected |= condition
+        rejected &= ~blank
+
+        columns = list(values)
+        cells = [values[name].astype(object).where(values[name].notna(), None).tolist() for name in columns]
+        now = datetime.now(timezone.utc)
+        parsed = []
+        for position, (row_idx, row_values) in enumerate(zip(rows, zip(*cells))):
+            if blank[position]:
+                continue
+            if rejected[position]:
+                message = "; ".join(text for condition, text in checks if condition[position])
+                parsed.append((row_idx, None, None, message))
+                continue
+            doc = dict(zip(columns, row_values))
+            doc["id"] = str(uuid.uuid4())
+            doc["created_at"] = now
+            doc.update(extra)
+            parsed.append((row_idx, None, doc, None))
+        return parsed
+
+@lru_cache(maxsize=64)
+def compile_field_validator(fields_json: str) -> FieldValidator:
+    # Keyed on the serialized field list, so an edited config compiles afresh
+    return FieldValidator(json.loads(fields_json))
+
+def field_validator_for(config: dict) -> FieldValidator:
+    return compile_field_validator(json.dumps(config.get("fields", []), sort_keys=True, default=str))
+
+# Import jobs
+# Uploads are spooled to disk and queued in import_jobs. A parser process
+# streams row chunks back over a managed queue and the event loop writes them
+# with SheetImporter, checkpointing after every chunk. Jobs are leased, so if
+# the API worker running one dies another picks it up and resumes after the
+# last committed row of each sheet; rows written after that checkpoint are
+# written again, which row_ids makes harmless. Only a worker that can read
+# the spooled file can resume: without a shared IMPORT_SPOOL_DIR a job
+# records its host and fails on any other.
+IMPORT_JOB_ACTIVE = ["queued", "running", "cancelling"]
+IMPORT_JOB_FINISHED = ["completed", "failed", "cancelled"]
+# Internal bookkeeping left out of API responses
+IMPORT_JOB_PROJECTION = {"_id": 0, "path": 0, "spool_host": 0, "owner": 0, "lease_expires_at": 0, "checkpoints": 0}
+SPOOL_HOST = None if IMPORT_SPOOL_DIR else socket.gethostname()
+
+class ImportLeaseLost(Exception):
+    pass
+
+def header_positions(headers, columns: list) -> list:
+    """Source column for each of a parser's (name, label) columns, or -1"""
+    lookup = {}
+    for position, header in enumerate(headers):
+        lookup.setdefault("" if header is None else str(header).strip().lower(), position)
+    return [lookup.get(name.lower(), lookup.get(label.lower(), -1)) for name, label in columns]
+
+def parse_row_chunk(parse_row, positions: Optional[list], row_numbers: list, frame: pd.DataFrame) -> list:
+    if positions is not None:
+        frame = frame.reindex(columns=positions)
+    cells = frame.astype(object).where(frame.notna(), None)
+    parsed = []
+    for row_idx, row in zip(row_numbers, cells.itertuples(index=False, name=None)):
+        try:
+            result = parse_row(row)
+        except Exception as e:
+            parsed.append((row_idx, None, None, str(e)))
+        else:
+            if result:
+                parsed.append((row_idx, result[0], result[1], None))
+    return parsed
+
+def hash_row_chunk(parse_chunk, exclude: set, row_numbers: list, frame: pd.DataFrame) -> list:
+    parsed = parse_chunk(row_numbers, frame)
+    for _, _, doc, _ in parsed:
+        if doc is not None:
+            doc["content_hash"] = content_hash(doc, exclude)
+    return parsed
+
+def chunk_parser(step: dict, headers: list, file_format: str):
+    """Turns (row numbers, frame) chunks of one sheet into parsed rows"""
+    if step.get("validator"):
+        names = step["validator"].column_names(headers)
+        parse_chunk = partial(step["validator"].validate, names, step["extra"])
+    else:
+        # Workbook sheets are positional; CSV/Parquet columns are found by header
+        positions = header_positions(headers, step["headers"]) if file_format != "excel" else None
+        parse_chunk = partial(parse_row_chunk, step["parse_row"], positions)
+    exclude = set(step.get("defaults", ()))
+    if step.get("sequence_field"):
+        exclude.add(step["sequence_field"])
+    return partial(hash_row_chunk, parse_chunk, exclude)
+
+# Chunk readers. Each yields (headers, row numbers, frame) with the frame's
+# columns numbered from 0; data rows are numbered from 2 as in a spreadsheet,
+# and rows up to step["resume_after"] are skipped.
+def excel_chunks(workbook, step: dict, chunk_size: int):
+    sheet = workbook.active if step["sheet"] is None else workbook[step["sheet"]]
+    headers = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    width = max(len(headers), step.get("columns", 0))
+    row_numbers, rows = [], []
+    for row_idx, row in iter_sheet_rows(sheet, min_row=step["resume_after"] + 1, width=width):
+        row_numbers.append(row_idx)
+        rows.append(row[:width])
+        if len(rows) >= chunk_size:
+            yield headers, row_numbers, pd.DataFrame(rows, columns=range(width), dtype=object)
+            row_numbers, rows = [], []
+    if rows:
+        yield headers, row_numbers, pd.DataFrame(rows, columns=range(width), dtype=object)
+
+def csv_chunks(path: str, step: dict, chunk_size: int):
+    # Everything is read as text; typing is the parser's or validator's job
+    reader = pd.read_csv(path, dtype=str, na_filter=False, encoding="utf-8-sig", chunksize=chunk_size,
+                         skiprows=range(1, step["resume_after"]))
+    next_row = step["resume_after"] + 1
+    with reader:
+        for frame in reader:
+            headers = list(frame.columns)
+            frame.columns = range(len(headers))
+            yield headers, list(range(next_row, next_row + len(frame))), frame
+            next_row += len(frame)
+
+def parquet_chunks(path: str, step: dict, chunk_size: int):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    headers = parquet.schema_arrow.names
+    next_row = 2
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        first_row, next_row = next_row, next_row + batch.num_rows
+        if next_row - 1 <= step["resume_after"]:
+            continue
+        frame = batch.to_pandas()
+        skip = max(0, step["resume_after"] + 1 - first_row)
+        frame = frame.iloc[skip:].reset_index(drop=True)
+        frame.columns = range(len(headers))
+        yield headers, list(range(first_row + skip, next_row)), frame
+
+def put_chunk(out, message, cancel) -> bool:
+    # Block while the writer catches up, but give up once the job is cancelled
+    while True:
+        try:
+            out.put(message, timeout=1)
+            return True
+        except queue.Full:
+            if cancel.is_set():
+                return False
+
+def parse_upload_chunks(path: str, file_format: str, plan: list, chunk_size: int, out, cancel):
+    """Parser process entry point.
+
+    Walks the plan's sheets in order and sends ("rows", key, rows) messages,
+    each row being (row number, code, document, error), then ("done", None,
+    None) or ("failed", None, message). A step with a validator maps columns
+    onto fields by header and checks them a chunk at a time; CSV and Parquet
+    files hold a single sheet.
+    """
+    try:
+        workbook = open_workbook(path) if file_format == "excel" else None
+        try:
+            for step in plan:
+                if cancel.is_set():
+                    return
+                if workbook is None:
+                    chunks = (csv_chunks if file_format == "csv" else parquet_chunks)(path, step, chunk_size)
+                elif step["sheet"] is None or step["sheet"] in workbook.sheetnames:
+                    chunks = excel_chunks(workbook, step, chunk_size)
+                else:
+                    continue
+                
+                parse_chunk = None
+                for headers, row_numbers, frame in chunks:
+                    if parse_chunk is None:
+                        parse_chunk = chunk_parser(step, headers, file_format)
+                    chunk = parse_chunk(row_numbers, frame)
+                    if chunk and not put_chunk(out, ("rows", step["key"], chunk), cancel):
+                        return
+        finally:
+            if workbook is not None:
+                workbook.close()
+        put_chunk(out, ("done", None, None), cancel)
+    except Exception as e:
+        put_chunk(out, ("failed", None, str(e)), cancel)
+
+async def import_job_plan(job: dict) -> list:
+    if job["kind"] == "dynamic_master":
+        config = await db.master_configurations.find_one({"id": job["config_id"]}, {"_id": 0, "fields": 1})
+        if not config:
+            raise RuntimeError("Master configuration no longer exists")
+        steps = [{
+            "key": "data", "sheet": None, "validator": field_validator_for(config),
+            "collection": f"dynamic_{job['config_id']}", "counter": "added_count", "label": None,
+            "extra": {"created_by": job["created_by"]},
+            "natural_key": [field["name"] for field in config.get("fields", []) if field.get("unique")]
+        }]
+    else:
+        # A CSV or Parquet file is one table, imported as the sheet that has named headers
+        steps = [dict(spec, key=spec["collection"]) for spec in EXCEL_SHEETS
+                 if job.get("format", "excel") == "excel" or spec.get("headers")]
+        if job.get("format", "excel") != "excel":
+            steps = [dict(step, sheet=None) for step in steps]
+    for step in steps:
+        step["resume_after"] = job["checkpoints"].get(step["key"], {}).get("row", 1)
+        if job.get("mode") != "upsert":
+            step["natural_key"] = None
+        elif not step["natural_key"]:
+            raise RuntimeError("Upsert needs at least one field marked unique")
+    return steps
+
+class ImportJobRunner:
+    """Claims queued import jobs and runs up to `workers` of them at a time"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.owner = str(uuid.uuid4())
+        self.pool = None
+        self.manager = None
+        self.claiming = None
+        self.tasks = {}
+
+    def start(self):
+        # Forking a process with a running event loop and Motor threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self.manager = context.Manager()
+        self.claiming = asyncio.Lock()
+
+    def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.manager:
+            self.manager.shutdown()
+
+    async def poll(self):
+        """Start as many claimable jobs as there are free slots"""
+        async with self.claiming:
+            while len(self.tasks) < self.workers:
+                now = datetime.now(timezone.utc)
+                job = await db.import_jobs.find_one_and_update(
+                    {"status": {"$in": IMPORT_JOB_ACTIVE}, "lease_expires_at": {"$lt": now}},
+                    {"$set": {"owner": self.owner, "lease_expires_at": now + IMPORT_JOB_LEASE, "updated_at": now}},
+                    projection={"_id": 0},
+                    sort=[("created_at", 1)],
+                    return_document=ReturnDocument.AFTER
+                )
+                if not job:
+                    return
+                task = asyncio.create_task(self.run(job))
+                self.tasks[job["id"]] = task
+                task.add_done_callback(lambda _, job_id=job["id"]: self.tasks.pop(job_id, None))
+
+    async def save(self, job: dict, fields: dict, query: Optional[dict] = None) -> Optional[str]:
+        """Persist fields and renew the lease; returns the job's current status"""
+        now = datetime.now(timezone.utc)
+        updated = await db.import_jobs.find_one_and_update(
+            {"id": job["id"], "owner": self.owner, **(query or {})},
+            {"$set": {**fields, "updated_at": now, "lease_expires_at": now + IMPORT_JOB_LEASE}},
+            projection={"_id": 0, "status": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None and query is None:
+            raise ImportLeaseLost(job["id"])
+        return updated and updated["status"]
+
+    async def finish(self, job: dict, status: str, error: Optional[str] = None):
+        await self.save(job, {
+            "status": status,
+            "error": error,
+            "progress": job["progress"],
+            "results": job["results"],
+            "finished_at": datetime.now(timezone.utc)
+        })
+        try:
+            os.unlink(job["path"])
+        except FileNotFoundError:
+            pass
+
+    async def run(self, job: dict):
+        try:
+            if job["status"] == "cancelling":
+                await self.finish(job, "cancelled")
+            elif job.get("spool_host") not in (None, SPOOL_HOST):
+                await self.finish(job, "failed", f"Uploaded file is on host {job['spool_host']}; "
+                                                 "set IMPORT_SPOOL_DIR to a directory every worker shares to resume jobs elsewhere")
+            elif not os.path.exists(job["path"]):
+                await self.finish(job, "failed", "Uploaded file is no longer available")
+            else:
+                await self.finish(job, await self.execute(job))
+        except ImportLeaseLost:
+            logger.warning(f"Import job {job['id']} was taken over by another worker")
+        except asyncio.CancelledError:
+            # Shutting down; the lease runs out and another worker resumes the job
+            raise
+        except Exception as e:
+            logger.exception(f"Import job {job['id']} failed")
+            try:
+                await self.finish(job, "failed", str(e))
+            except ImportLeaseLost:
+                pass
+
+    async def execute(self, job: dict) -> str:
+        plan = await import_job_plan(job)
+        steps = {step["key"]: step for step in plan}
+        progress, results, checkpoints = job["progress"], job["results"], job["checkpoints"]
+        await self.save(job, {"status": "running", "started_at": datetime.now(timezone.utc)}, {"status": "queued"})
+        
+        loop = asyncio.get_running_loop()
+        out = self.manager.Queue(IMPORT_QUEUE_CHUNKS)
+        cancel = self.manager.Event()
+        parser = loop.run_in_executor(
+            self.pool, parse_upload_chunks, job["path"], job.get("format", "excel"), plan, IMPORT_CHUNK_SIZE, out, cancel
+        )
+        importers = {}
+        outcome = "completed"
+        try:
+            while True:
+                try:
+                    kind, key, payload = await loop.run_in_executor(None, out.get, True, 1.0)
+                except queue.Empty:
+                    # The parser queues its last message before returning
+                    if parser.done() and out.empty():
+                        parser.result()
+                        raise RuntimeError("Parser stopped without finishing the file")
+                    if await self.save(job, {}) == "cancelling":
+                        outcome = "cancelled"
+                        break
+                    continue
+                if kind == "failed":
+                    raise RuntimeError(f"Could not read file: {payload}")
+                if kind == "done":
+                    break
+                
+                step = steps[key]
+                importer = importers.get(key)
+                if importer is None:
+                    await ensure_indexes(step["collection"])
+                    if step["natural_key"]:
+                        await db[step["collection"]].create_index(content_hash_index(step["natural_key"])["keys"])
+                    importer = importers[key] = SheetImporter(
+                        step["collection"], step["counter"], step["label"], results, step.get("sequence_field"),
+                        natural_key=step["natural_key"], actor=job["created_by"], dry_run=job.get("dry_run", False),
+                        defaults=frozenset(step.get("defaults", ())), row_ids=uuid.uuid5(uuid.UUID(job["id"]), key)
+                    )
+                    importer.next_sequence = checkpoints.get(key, {}).get("sequence", 1)
+                
+                errors_before = len(results["errors"])
+                for row_idx, code, doc, error in payload:
+                    if error is not None:
+                        importer.error(row_idx, error)
+                    else:
+                        await importer.add(row_idx, code, doc)
+                await importer.flush()
+                
+                progress["rows_parsed"] += len(payload)
+                progress["rows_failed"] += len(results["errors"]) - errors_before
+                progress["rows_inserted"] = sum(results[entry["counter"]] for entry in plan)
+                if job.get("mode") == "upsert" or job.get("dry_run"):
+                    progress["rows_updated"] = results["updated_count"]
+                    progress["rows_unchanged"] = results["unchanged_count"]
+                del results["errors"][IMPORT_MAX_ERRORS:]
+                checkpoints[key] = {"row": payload[-1][0], "sequence": importer.next_sequence}
+                status = await self.save(job, {"progress": progress, "results": results, "checkpoints": checkpoints})
+                if status == "cancelling":
+                    outcome = "cancelled"
+                    break
+        finally:
+            cancel.set()
+            if not job.get("dry_run"):
+                await collection_changed(*{step["collection"] for step in plan})
+        return outcome
+
+import_runner = ImportJobRunner(IMPORT_WORKERS)
+
+async def import_job_loop():
+    while True:
+        try:
+            await import_runner.poll()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Import job poll failed: {str(e)}")
+        await asyncio.sleep(IMPORT_JOB_POLL_SECONDS)
+
+def import_results(kind: str, mode: str, dry_run: bool) -> dict:
+    if kind == "dynamic_master":
+        results = {"added_count": 0, "errors": []}
+    else:
+        results = {
+            "colors_added": 0,
+            "articles_added": 0,
+            "sizes_added": 0,
+            "raw_materials_added": 0,
+            "fabrics_added": 0,
+            "errors": []
+        }
+    if mode == "upsert" or dry_run:
+        results.update(updated_count=0, unchanged_count=0)
+    if dry_run:
+        results["preview"] = {"insert": [], "update": []}
+    return results
+
+async def check_dynamic_import(config_id: str, mode: str):
+    config = await db.master_configurations.find_one({"id": config_id}, {"_id": 0, "fields": 1})
+    if not config:
+        raise HTTPException(status_code=404, detail="Master configuration not found")
+    if mode == "upsert" and not any(field.get("unique") for field in config.get("fields", [])):
+        raise HTTPException(status_code=400, detail="Mark at least one field as unique to upsert")
+
+async def create_import_job(file: UploadFile, kind: str, current_user: User, config_id: Optional[str] = None,
+                            mode: str = "insert", dry_run: bool = False) -> dict:
+    path = await spool_upload(file)
+    return await queue_import_job(path, file.filename, kind, current_user.username, config_id, mode, dry_run)
+
+async def queue_import_job(path: str, filename: str, kind: str, created_by: str, config_id: Optional[str] = None,
+                           mode: str = "insert", dry_run: bool = False) -> dict:
+    """Hand a file on disk to the import workers; the job owns and removes it from here on"""
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "mode": mode,
+        "dry_run": dry_run,
+        "format": upload_format(filename),
+        "config_id": config_id,
+        "filename": filename,
+        "path": path,
+        "spool_host": SPOOL_HOST,
+        "status": "queued",
+        "created_by": created_by,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        # Expired from the start so any worker with a free slot can claim it
+        "lease_expires_at": now - timedelta(seconds=1),
+        "owner": None,
+        "progress": {"rows_parsed": 0, "rows_inserted": 0, "rows_failed": 0},
+        "checkpoints": {},
+        "results": import_results(kind, mode, dry_run),
+        "error": None
+    }
+    try:
+        await db.import_jobs.insert_one(job)
+    except BaseException:
+        os.unlink(path)
+        raise
+    await import_runner.poll()
+    return {"message": "Dry run started" if dry_run else "Import started", "job_id": job["id"], "status": "queued"}
+
 # Bulk Excel Upload for Dynamic Masters
-@api_router.post("/dynamic-masters/{config_id}/bulk-upload")
+@api_router.post("/dynamic-masters/{config_id}/bulk-upload", status_code=http_status.HTTP_202_ACCEPTED)
 async def bulk_upload_dynamic_master(
     config_id: str,
     file: UploadFile = File(...),
+    mode: str = Query("insert", pattern="^(insert|upsert)$"),
+    dry_run: bool = Query(False),
     current_user: User = Depends(get_current_user)
 ):
-    """Bulk upload data for dynamic master via Excel"""
+    """Queue a bulk upload of dynamic master data from Excel, CSV or Parquet; poll /import-jobs/{job_id}.
+
+    mode=upsert matches rows on the fields marked unique and only writes new
+    or changed ones. dry_run=true reports what the upload would insert,
+    update or reject, with sample rows, and writes nothing.
+    """
     try:
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            raise HTTPException(status_code=400, detail="File must be an Excel file")
-        
-        # Get master configuration
-        config = await db.master_configurations.find_one({"id": config_id})
-        
-        if not config:
-            raise HTTPException(status_code=404, detail="Master configuration not found")
-        
-        # Read Excel file
-        contents = await file.read()
-        workbook = openpyxl.load_workbook(io.BytesIO(contents))
-        sheet = workbook.active
-        
-        # Get headers from first row
-        headers = [cell.value for cell in sheet[1]]
-        
-        # Process rows
-        added_count = 0
-        errors = []
-        collection_name = f"dynamic_{config_id}"
-        
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                data = {}
-                for idx, value in enumerate(row):
-                    if idx < len(headers) and headers[idx]:
-                        field_name = headers[idx]
-                        data[field_name] = value if value is not None else ""
-                
-                # Add metadata
-                data["id"] = str(uuid.uuid4())
-                data["created_at"] = datetime.now(timezone.utc).isoformat()
-                data["created_by"] = current_user.username
-                
-                await db[collection_name].insert_one(data)
-                added_count += 1
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
+        if not upload_format(file.filename):
+            raise HTTPException(status_code=400, detail="File must be an Excel, CSV or Parquet file")
         
-        return {
-            "message": f"Successfully uploaded {added_count} records",
-            "added_count": added_count,
-            "errors": errors
-        }
+        await check_dynamic_import(config_id, mode)
+        return await create_import_job(file, "dynamic_master", current_user, config_id, mode, dry_run)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading data: {str(e)}")
 
 # Excel Upload Route
-@api_router.post("/upload-excel")
-async def upload_excel(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="File must be an Excel file (.xlsx or .xls)")
+def clean_cell(val) -> str:
+    if val is None:
+        return ""
+    val_str = str(val).strip()
+    # Handle Excel "None" strings
+    if val_str.upper() == "NONE" or val_str == "":
+        return ""
+    return val_str
+
+# Row parsers for the upload_excel sheets. Each returns (code, document) for a
+# row to import, or None to skip it; code is None for sheets with no key.
+def parse_color_row(row):
+    if row[0] and row[1]:
+        color_data = row[1].split("/")
+        if len(color_data) >= 2:
+            color_id = color_data[0].strip()
+            color_name = color_data[1].strip()
+            return color_id, Color(name=color_name, code=color_id, hex_value=None).model_dump()
+    return None
+
+def parse_article_row(row):
+    if row[0]:
+        article_code = str(row[0]).strip()
+        article_obj = Article(
+            name=article_code,
+            code=article_code,
+            description=f"Article {article_code}",
+            buyer_id=None
+        )
+        return article_code, article_obj.model_dump()
+    return None
+
+def parse_unit_row(row):
+    if row[0]:
+        unit_name = str(row[0]).strip()
+        # sort_order is assigned by the importer once the row is accepted
+        return unit_name, Size(name=unit_name, code=unit_name, sort_order=0).model_dump()
+    return None
+
+def parse_component_row(row):
+    if row[0]:
+        component_name = str(row[0]).strip()
+        component_code = component_name[:20].upper().replace(" ", "_")
+        material_obj = RawMaterial(
+            name=component_name,
+            code=component_code,
+            material_type="accessories",
+            unit="pieces",
+            cost_per_unit=0.0,
+            supplier_id=None
+        )
+        return component_code, material_obj.model_dump()
+    return None
+
+def parse_fabric_row(row):
+    # Skip empty rows
+    if not row[0] or str(row[0]).strip() == "":
+        return None
+    
+    # Handle GSM - can be numeric or None
+    gsm = None
+    if row[5] and str(row[5]).strip().upper() != "NONE":
+        try:
+            gsm = int(float(row[5]))
+        except (ValueError, TypeError):
+            pass
+    
+    width = clean_cell(row[6])
+    color = clean_cell(row[7])
+    avg_roll_size = clean_cell(row[9])
+    fabric_obj = Fabric(
+        item_type=clean_cell(row[0]),
+        count_const=clean_cell(row[1]),
+        fabric_name=clean_cell(row[2]),
+        composition=clean_cell(row[3]),
+        add_description=clean_cell(row[4]),
+        gsm=gsm,
+        width=width if width else None,
+        color=color if color else None,
+        final_item=clean_cell(row[8]),
+        avg_roll_size=avg_roll_size if avg_roll_size else None,
+        unit=clean_cell(row[10]) or "Pcs"
+    )
+    # The sheet has no price column; leave prices set in the app untouched
+    return None, fabric_obj.model_dump(exclude={"price_per_unit"})
+
+# Sheets understood by upload_excel. `columns` is the number of cells the
+# parser reads; `sequence_field` is numbered across the rows actually added;
+# `natural_key` matches rows to existing documents in upsert mode; `defaults`
+# are filled in by the parser rather than read from the sheet, so upserts only
+# set them on new rows; sheets with `headers` can also come as CSV/Parquet,
+# with columns found by header.
+EXCEL_SHEETS = [
+    {"sheet": "Color ID", "collection": "colors", "counter": "colors_added", "label": "Color sheet",
+     "parse_row": parse_color_row, "columns": 2, "natural_key": ["code"], "defaults": ["hex_value"]},
+    {"sheet": "Art No.", "collection": "articles", "counter": "articles_added", "label": "Article sheet",
+     "parse_row": parse_article_row, "columns": 1, "natural_key": ["code"],
+     "defaults": ["name", "description", "buyer_id"]},
+    {"sheet": "Units Master", "collection": "sizes", "counter": "sizes_added", "label": "Units sheet",
+     "parse_row": parse_unit_row, "columns": 1, "sequence_field": "sort_order",
+     "natural_key": ["code"]},
+    {"sheet": "Components", "collection": "raw_materials", "counter": "raw_materials_added", "label": "Components sheet",
+     "parse_row": parse_component_row, "columns": 1, "natural_key": ["code"],
+     "defaults": ["material_type", "unit", "cost_per_unit", "supplier_id"]},
+    {"sheet": "FABRIC MASTER DATA", "collection": "fabrics", "counter": "fabrics_added", "label": "Fabric sheet",
+     "parse_row": parse_fabric_row, "columns": 11, "natural_key": FABRIC_NATURAL_KEY,
+     "headers": [("item_type", "Item Type"), ("count_const", "Count/Const"), ("fabric_name", "Fabric Name"),
+                 ("composition", "Composition"), ("add_description", "Add Description"), ("gsm", "GSM"),
+                 ("width", "Width"), ("color", "Color"), ("final_item", "Final Item"),
+                 ("avg_roll_size", "Avg Roll Size"), ("unit", "Unit")]}
+]
+
+@api_router.post("/upload-excel", status_code=http_status.HTTP_202_ACCEPTED)
+async def upload_excel(file: UploadFile = File(...), mode: str = Query("insert", pattern="^(insert|upsert)$"),
+                       dry_run: bool = Query(False), current_user: User = Depends(get_current_user)):
+    if not upload_format(file.filename):
+        raise HTTPException(status_code=400, detail="File must be an Excel (.xlsx or .xls), CSV or Parquet file")
     
     try:
-        contents = await file.read()
-        workbook = openpyxl.load_workbook(io.BytesIO(contents))
-        
-        results = {
-            "colors_added": 0,
-            "articles_added": 0,
-            "sizes_added": 0,
-            "raw_materials_added": 0,
-            "fabrics_added": 0,
-            "errors": []
-        }
-        
-        # Process Color ID sheet
-        if "Color ID" in workbook.sheetnames:
-            sheet = workbook["Color ID"]
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    if row[0] and row[1]:
-                        color_data = row[1].split("/")
-                        if len(color_data) >= 2:
-                            color_id = color_data[0].strip()
-                            color_name = color_data[1].strip()
-                            
-                            # Check if color already exists
-                            existing = await db.colors.find_one({"code": color_id})
-                            if not existing:
-                                color_obj = Color(
-                                    name=color_name,
-                                    code=color_id,
-                                    hex_value=None
-                                )
-                                doc = color_obj.model_dump()
-                                doc['created_at'] = doc['created_at'].isoformat()
-                                await db.colors.insert_one(doc)
-                                results["colors_added"] += 1
-                except Exception as e:
-                    results["errors"].append(f"Color sheet row {row_idx}: {str(e)}")
-        
-        # Process Art No. sheet
-        if "Art No." in workbook.sheetnames:
-            sheet = workbook["Art No."]
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    if row[0]:
-                        article_code = str(row[0]).strip()
-                        
-                        # Check if article already exists
-                        existing = await db.articles.find_one({"code": article_code})
-                        if not existing:
-                            article_obj = Article(
-                                name=article_code,
-                                code=article_code,
-                                description=f"Article {article_code}",
-                                buyer_id=None
-                            )
-                            doc = article_obj.model_dump()
-                            doc['created_at'] = doc['created_at'].isoformat()
-                            await db.articles.insert_one(doc)
-                            results["articles_added"] += 1
-                except Exception as e:
-                    results["errors"].append(f"Article sheet row {row_idx}: {str(e)}")
-        
-        # Process Units Master sheet
-        if "Units Master" in workbook.sheetnames:
-            sheet = workbook["Units Master"]
-            sort_order = 1
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    if row[0]:
-                        unit_name = str(row[0]).strip()
-                        
-                        # Check if size already exists
-                        existing = await db.sizes.find_one({"code": unit_name})
-                        if not existing:
-                            size_obj = Size(
-                                name=unit_name,
-                                code=unit_name,
-                                sort_order=sort_order
-                            )
-                            doc = size_obj.model_dump()
-                            doc['created_at'] = doc['created_at'].isoformat()
-                            await db.sizes.insert_one(doc)
-                            results["sizes_added"] += 1
-                            sort_order += 1
-                except Exception as e:
-                    results["errors"].append(f"Units sheet row {row_idx}: {str(e)}")
-        
-        # Process Components sheet (as Raw Materials)
-        if "Components" in workbook.sheetnames:
-            sheet = workbook["Components"]
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    if row[0]:
-                        component_name = str(row[0]).strip()
-                        component_code = component_name[:20].upper().replace(" ", "_")
-                        
-                        # Check if material already exists
-                        existing = await db.raw_materials.find_one({"code": component_code})
-                        if not existing:
-                            material_obj = RawMaterial(
-                                name=component_name,
-                                code=component_code,
-                                material_type="accessories",
-                                unit="pieces",
-                                cost_per_unit=0.0,
-                                supplier_id=None
-                            )
-                            doc = material_obj.model_dump()
-                            doc['created_at'] = doc['created_at'].isoformat()
-                            await db.raw_materials.insert_one(doc)
-                            results["raw_materials_added"] += 1
-                except Exception as e:
-                    results["errors"].append(f"Components sheet row {row_idx}: {str(e)}")
-        
-        # Process Fabric Master Data sheet
-        if "FABRIC MASTER DATA" in workbook.sheetnames:
-            sheet = workbook["FABRIC MASTER DATA"]
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    # Skip empty rows
-                    if not row[0] or str(row[0]).strip() == "":
-                        continue
-                    
-                    # Helper function to clean values
-                    def clean_value(val):
-                        if val is None:
-                            return ""
-                        val_str = str(val).strip()
-                        # Handle Excel "None" strings
-                        if val_str.upper() == "NONE" or val_str == "":
-                            return ""
-                        return val_str
-                    
-                    # Parse values with proper null handling
-                    item_type = clean_value(row[0])
-                    count_const = clean_value(row[1])
-                    fabric_name = clean_value(row[2])
-                    composition = clean_value(row[3])
-                    add_description = clean_value(row[4])
-                    
-                    # Handle GSM - can be numeric or None
-                    gsm = None
-                    if row[5] and str(row[5]).strip().upper() != "NONE":
-                        try:
-                            gsm = int(float(row[5]))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    width = clean_value(row[6])
-                    color = clean_value(row[7])
-                    final_item = clean_value(row[8])
-                    avg_roll_size = clean_value(row[9])
-                    unit = clean_value(row[10]) or "Pcs"
-                    
-                    fabric_obj = Fabric(
-                        item_type=item_type,
-                        count_const=count_const,
-                        fabric_name=fabric_name,
-                        composition=composition,
-                        add_description=add_description,
-                        gsm=gsm,
-                        width=width if width else None,
-                        color=color if color else None,
-                        final_item=final_item,
-                        avg_roll_size=avg_roll_size if avg_roll_size else None,
-                        unit=unit
-                    )
-                    doc = fabric_obj.model_dump()
-                    doc['created_at'] = doc['created_at'].isoformat()
-                    await db.fabrics.insert_one(doc)
-                    results["fabrics_added"] += 1
-                except Exception as e:
-                    results["errors"].append(f"Fabric sheet row {row_idx}: {str(e)}")
-        
-        return {
-            "message": "Excel file processed successfully",
-            "results": results
-        }
-        
+        return await create_import_job(file, "masters", current_user, mode=mode, dry_run=dry_run)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing Excel file: {str(e)}")
 
+# Import Job Routes
+async def get_visible_import_job(job_id: str, current_user: User) -> dict:
+    job = await db.import_jobs.find_one({"id": job_id}, IMPORT_JOB_PROJECTION)
+    if not job or (current_user.role != "admin" and job["created_by"] != current_user.username):
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@api_router.get("/import-jobs/{job_id}")
+async def get_import_job(job_id: str, current_user: User = Depends(get_current_user)):
+    return await get_visible_import_job(job_id, current_user)
+
+@api_router.post("/import-jobs/{job_id}/cancel")
+async def cancel_import_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await get_visible_import_job(job_id, current_user)
+    if job["status"] in IMPORT_JOB_FINISHED:
+        raise HTTPException(status_code=409, detail=f"Import job already {job['status']}")
+    
+    # The worker running it notices at its next checkpoint
+    job = await db.import_jobs.find_one_and_update(
+        {"id": job_id, "status": {"$in": ["queued", "running"]}},
+        {"$set": {"status": "cancelling", "updated_at": datetime.now(timezone.utc)}},
+        projection=IMPORT_JOB_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    return job or await get_visible_import_job(job_id, current_user)
+
+# Resumable Upload Routes
+# A large file is sent as a series of PUTs, each with the offset it starts at
+# and its SHA-256. Chunks go straight into a staging file; the session's
+# committed offset only moves once a chunk has been written and verified, so
+# after a dropped connection the client asks for the offset and resumes
+# there. A chunk holds a short lock on its session, renewed while bytes
+# arrive; a connection that goes quiet is dropped after
+# UPLOAD_READ_TIMEOUT_SECONDS so the client can resend soon. Completing the
+# upload hands the staging file to an import job.
+UPLOAD_SESSION_PROJECTION = {"_id": 0, "path": 0, "lock_expires_at": 0}
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    kind: str = Field(pattern="^(masters|dynamic_master)$")
+    config_id: Optional[str] = None
+    mode: str = Field("insert", pattern="^(insert|upsert)$")
+    dry_run: bool = False
+
+async def get_upload_session(upload_id: str, current_user: User) -> dict:
+    session = await db.upload_sessions.find_one({"id": upload_id, "created_by": current_user.username}, UPLOAD_SESSION_PROJECTION)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+def discard_staging_file(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+@api_router.post("/uploads", status_code=http_status.HTTP_201_CREATED)
+async def create_upload_session(upload: UploadSessionCreate, current_user: User = Depends(get_current_user)):
+    if not upload_format(upload.filename):
+        raise HTTPException(status_code=400, detail="File must be an Excel, CSV or Parquet file")
+    if upload.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_BYTES} bytes")
+    if upload.kind == "dynamic_master":
+        if not upload.config_id:
+            raise HTTPException(status_code=400, detail="config_id is required for dynamic master uploads")
+        await check_dynamic_import(upload.config_id, upload.mode)
+    
+    fd, path = tempfile.mkstemp(suffix=Path(upload.filename).suffix, dir=IMPORT_SPOOL_DIR)
+    os.close(fd)
+    now = datetime.now(timezone.utc)
+    session = {
+        "id": str(uuid.uuid4()),
+        **upload.model_dump(),
+        "offset": 0,
+        "path": path,
+        "created_by": current_user.username,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + UPLOAD_SESSION_TTL,
+        "lock_expires_at": now
+    }
+    try:
+        await db.upload_sessions.insert_one(session)
+    except BaseException:
+        discard_staging_file(path)
+        raise
+    return {"upload_id": session["id"], "offset": 0, "size": upload.size, "chunk_size": UPLOAD_CHUNK_MAX_BYTES}
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Where to resume: `offset` is the number of bytes received and verified"""
+    return await get_upload_session(upload_id, current_user)
+
+@api_router.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0),
+                       checksum: str = Header(..., alias="X-Chunk-SHA256"),
+                       current_user: User = Depends(get_current_user)):
+    """Write the request body at `offset`; X-Chunk-SHA256 is the hex digest of the body"""
+    now = datetime.now(timezone.utc)
+    # Only one writer per session, and only at the committed offset
+    session = await db.upload_sessions.find_one_and_update(
+        {"id": upload_id, "created_by": current_user.username, "offset": offset, "lock_expires_at": {"$lt": now}},
+        {"$set": {"lock_expires_at": now + UPLOAD_CHUNK_LOCK}},
+        projection={"_id": 0}
+    )
+    if not session:
+        current = await get_upload_session(upload_id, current_user)
+        if current["offset"] != offset:
+            raise HTTPException(status_code=409, detail=f"Upload is at offset {current['offset']}")
+        raise HTTPException(status_code=409, detail="Another chunk of this upload is being written")
+    
+    received, verified = 0, False
+    digest = hashlib.sha256()
+    loop = asyncio.get_running_loop()
+    renew_at = now + UPLOAD_CHUNK_LOCK / 2
+    try:
+        # File writes go to a thread so a slow disk doesn't stall the event loop
+        staging = await loop.run_in_executor(None, open, session["path"], "r+b")
+        try:
+            await loop.run_in_executor(None, staging.seek, offset)
+            pieces = request.stream().__aiter__()
+            while True:
+                try:
+                    piece = await asyncio.wait_for(pieces.__anext__(), UPLOAD_READ_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise HTTPException(status_code=408, detail="Chunk body stalled; resend it")
+                received += len(piece)
+                if received > UPLOAD_CHUNK_MAX_BYTES or offset + received > session["size"]:
+                    raise HTTPException(status_code=413, detail="Chunk is larger than allowed or runs past the declared size")
+                digest.update(piece)
+                await loop.run_in_executor(None, staging.write, piece)
+                if datetime.now(timezone.utc) >= renew_at:
+                    renewed = datetime.now(timezone.utc)
+                    await db.upload_sessions.update_one(
+                        {"id": upload_id, "offset": offset},
+                        {"$set": {"lock_expires_at": renewed + UPLOAD_CHUNK_LOCK}}
+                    )
+                    renew_at = renewed + UPLOAD_CHUNK_LOCK / 2
+            if received == 0:
+                raise HTTPException(status_code=400, detail="Chunk is empty")
+            if digest.hexdigest() != checksum.strip().lower():
+                raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+            await loop.run_in_executor(None, staging.flush)
+            verified = True
+        except BaseException:
+            # Drop the partial chunk; the client resends it from `offset`
+            await loop.run_in_executor(None, staging.truncate, offset)
+            raise
+        finally:
+            await loop.run_in_executor(None, staging.close)
+    finally:
+        released = datetime.now(timezone.utc)
+        fields = {"lock_expires_at": released}
+        if verified:
+            fields.update(offset=offset + received, updated_at=released, expires_at=released + UPLOAD_SESSION_TTL)
+        await db.upload_sessions.update_one({"id": upload_id, "offset": offset}, {"$set": fields})
+    return {"upload_id": upload_id, "offset": offset + received, "size": session["size"]}
+
+@api_router.post("/uploads/{upload_id}/complete", status_code=http_status.HTTP_202_ACCEPTED)
+async def complete_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Queue the import of a fully received upload; poll /import-jobs/{job_id}"""
+    session = await db.upload_sessions.find_one_and_delete({
+        "id": upload_id,
+        "created_by": current_user.username,
+        "lock_expires_at": {"$lt": datetime.now(timezone.utc)},
+        "$expr": {"$eq": ["$offset", "$size"]}
+    }, projection={"_id": 0})
+    if not session:
+        current = await get_upload_session(upload_id, current_user)
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {current['offset']} of {current['size']} bytes received")
+    
+    try:
+        return await queue_import_job(session["path"], session["filename"], session["kind"], session["created_by"],
+                                      session["config_id"], session["mode"], session["dry_run"])
+    except BaseException:
+        discard_staging_file(session["path"])
+        raise
+
+@api_router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    session = await db.upload_sessions.find_one_and_delete({"id": upload_id, "created_by": current_user.username})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    discard_staging_file(session["path"])
+    return {"message": "Upload discarded"}
+
+async def expire_upload_sessions():
+    """Remove sessions, and their staging files, that saw no chunk within UPLOAD_SESSION_TTL"""
+    now = datetime.now(timezone.utc)
+    while session := await db.upload_sessions.find_one_and_delete(
+            {"expires_at": {"$lt": now}, "lock_expires_at": {"$lt": now}}, projection={"_id": 0, "path": 1}):
+        discard_staging_file(session["path"])
+
+async def upload_cleanup_loop():
+    while True:
+        try:
+            await expire_upload_sessions()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Upload session cleanup failed: {str(e)}")
+        await asyncio.sleep(UPLOAD_CLEANUP_SECONDS)
+
 # Image Upload Route
 @api_router.post("/upload-image")
 async def upload_image(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
@@ -1559,18 +4544,199 @@ async def upload_image(file: UploadFile = File(...), current_user: User = Depend
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
 
+# ============================================================================
+# DATA MIGRATIONS
+# ============================================================================
+
+DATETIME_FIELDS = ["created_at", "updated_at"]
+
+async def datetime_migration_targets() -> list:
+    # migrations holds the checkpoints of this very run
+    collection_names = [name for name in INDEX_SPECS if name not in ("token_revocations", "bom_lines", "migrations")]
+    collection_names += sorted(await db.list_collection_names(filter={"name": {"$regex": "^dynamic_"}}))
+    return collection_names
+
+async def migrate_datetime_fields(collection_name: str, batch_size: int = 1000) -> int:
+    """Rewrite legacy ISO-string timestamps in one collection as BSON dates.
+
+    Walks the collection in _id order and checkpoints the last _id in the
+    migrations collection after every batch, so an interrupted run resumes
+    where it stopped; after a completed run it starts over, to pick up
+    legacy rows written since. Each update is conditional on the old string
+    value so a concurrent write from the API is never overwritten.
+    """
+    checkpoint_id = f"datetimes:{collection_name}"
+    checkpoint = await db.migrations.find_one({"id": checkpoint_id}) or {}
+    if checkpoint.get("completed_at"):
+        checkpoint = {}
+    last_id = checkpoint.get("last_id")
+    converted = checkpoint.get("converted", 0)
+    string_filter = {"$or": [{field: {"$type": "string"}} for field in DATETIME_FIELDS]}
+    projection = {field: 1 for field in DATETIME_FIELDS}
+
+    while True:
+        query = string_filter if last_id is None else {"$and": [string_filter, {"_id": {"$gt": last_id}}]}
+        batch = await db[collection_name].find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        operations = []
+        for doc in batch:
+            updates = {}
+            for field in DATETIME_FIELDS:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    parsed = datetime.fromisoformat(value)
+                except ValueError:
+                    continue
+                updates[field] = parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+            if updates:
+                guard = {field: doc[field] for field in updates}
+                operations.append(UpdateOne({"_id": doc["_id"], **guard}, {"$set": updates}))
+
+        if operations:
+            result = await db[collection_name].bulk_write(operations, ordered=False)
+            converted += result.modified_count
+        last_id = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": converted, "updated_at": datetime.now(timezone.utc)},
+             "$unset": {"completed_at": ""}},
+            upsert=True
+        )
+
+    await db.migrations.update_one(
+        {"id": checkpoint_id},
+        {"$set": {"converted": converted, "completed_at": datetime.now(timezone.utc)}, "$unset": {"last_id": ""}},
+        upsert=True
+    )
+    return converted
+
+async def migrate_bom_layout(layout: str, batch_size: int = 100) -> tuple:
+    """Move every comprehensive BOM to `layout` ("lines" or "embedded").
+
+    Walks the BOMs still in the other layout in _id order. A BOM edited while
+    it is being moved is left as it was and counted as skipped; re-running
+    picks it up, since moved BOMs drop out of the query. Returns (moved,
+    skipped) and records them in the migrations collection.
+    """
+    checkpoint_id = f"bom_layout:{layout}"
+    pending = {"layout": "lines"} if layout == "embedded" else {"layout": {"$ne": "lines"}}
+    moved = skipped = 0
+    last_id = None
+
+    while True:
+        query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+        batch = await db.comprehensive_boms.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        for bom in batch:
+            del bom["_id"]
+            if await move_bom_layout(bom, layout):
+                moved += 1
+            else:
+                skipped += 1
+        await db.migrations.update_one(
+            {"id": checkpoint_id},
+            {"$set": {"moved": moved, "skipped": skipped, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    if moved:
+        await collection_changed("comprehensive_boms")
+    await db.migrations.update_one(
+        {"id": checkpoint_id},
+        {"$set": {"moved": moved, "skipped": skipped, "completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return moved, skipped
+
+# Index audit
+def index_key_signature(keys) -> tuple:
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in keys)
+
+@api_router.get("/admin/indexes")
+async def audit_indexes(current_user: User = Depends(require_admin)):
+    """Report missing, extra and unused indexes for every collection"""
+    try:
+        collection_names = set(INDEX_SPECS)
+        collection_names.update(await db.list_collection_names(filter={"name": {"$regex": "^dynamic_"}}))
+        existing_collections = set(await db.list_collection_names())
+
+        report = []
+        for collection_name in sorted(collection_names):
+            declared = {index_key_signature(spec["keys"]): spec for spec in index_specs_for(collection_name)}
+            present = {}
+            usage = {}
+            if collection_name in existing_collections:
+                info = await db[collection_name].index_information()
+                present = {index_key_signature(index["key"]): name for name, index in info.items() if name != "_id_"}
+                async for stat in db[collection_name].aggregate([{"$indexStats": {}}]):
+                    usage[stat["name"]] = {
+                        "ops": stat["accesses"]["ops"],
+                        "since": stat["accesses"]["since"]
+                    }
+
+            report.append({
+                "collection": collection_name,
+                "missing": [[list(pair) for pair in signature] for signature in declared if signature not in present],
+                "extra": [name for signature, name in present.items() if signature not in declared],
+                "unused": [name for name in present.values() if usage.get(name, {}).get("ops", 0) == 0],
+                "usage": usage
+            })
+
+        return report
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error auditing indexes: {str(e)}")
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: User = Depends(require_admin)):
+    """Hit/miss counters and size of the master data cache"""
+    return master_cache.snapshot()
+
+@api_router.get("/admin/coalescing-stats")
+async def get_coalescing_stats(current_user: User = Depends(require_admin)):
+    """How many GET requests shared another request's in-flight response"""
+    return {**request_coalescer.stats, "in_flight": len(request_coalescer.in_flight)}
+
+@api_router.get("/admin/runtime-stats")
+async def get_runtime_stats(current_user: User = Depends(require_admin)):
+    """Event loop stalls (with LOOP_MONITOR=true) and peak memory of this API worker and its import processes"""
+    return {
+        "pid": os.getpid(),
+        "loop": loop_monitor.snapshot() if LOOP_MONITOR else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": {str(child.pid): peak_rss_mb(child.pid) for child in multiprocessing.active_children()}
+    }
+
+@api_router.post("/admin/runtime-stats/reset")
+async def reset_runtime_stats(current_user: User = Depends(require_admin)):
+    """Start a fresh measurement window, e.g. before a benchmark run"""
+    loop_monitor.reset()
+    reset_peak_rss()
+    for child in multiprocessing.active_children():
+        reset_peak_rss(child.pid)
+    return await get_runtime_stats(current_user)
+
 # Include router
 app.include_router(api_router)
 
 # Mount static files for image serving
 app.mount("/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
 
+if COALESCE_GET_REQUESTS:
+    app.middleware("http")(request_coalescer.dispatch)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 logging.basicConfig(
@@ -1579,6 +4745,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_bootstrap_indexes():
+    await bootstrap_indexes()
+
+@app.on_event("startup")
+async def startup_master_cache():
+    try:
+        await warm_master_cache()
+    except Exception as e:
+        logger.warning(f"Master cache warm-up failed: {str(e)}")
+    app.state.master_cache_task = None
+    if MASTER_CACHE_CHANGE_STREAM:
+        app.state.master_cache_task = asyncio.create_task(master_cache_change_listener())
+
+@app.on_event("startup")
+async def start_revocation_refresh():
+    await revocations.refresh()
+    app.state.revocation_task = asyncio.create_task(revocation_refresh_loop())
+
+@app.on_event("startup")
+async def start_import_jobs():
+    import_runner.start()
+    app.state.import_job_task = asyncio.create_task(import_job_loop())
+
+@app.on_event("startup")
+async def start_upload_cleanup():
+    app.state.upload_cleanup_task = asyncio.create_task(upload_cleanup_loop())
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    app.state.loop_monitor_task = None
+    if LOOP_MONITOR:
+        app.state.loop_monitor_task = asyncio.create_task(loop_monitor.run())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if app.state.loop_monitor_task:
+        app.state.loop_monitor_task.cancel()
+    app.state.upload_cleanup_task.cancel()
+    app.state.import_job_task.cancel()
+    import_runner.stop()
+    app.state.revocation_task.cancel()
+    if app.state.master_cache_task:
+        app.state.master_cache_task.cancel()
+    password_pool.executor.shutdown(wait=False)
     client.close()
@@ -0,0 +1,742 @@
+import requests
+import sys
+import os
+import json
+import time
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import io
+import random
+import subprocess
+import tempfile
+
+import jwt
+import openpyxl
+
+FABRIC_HEADERS = ["Item Type", "Count/Const", "Fabric Name", "Composition", "Add Description",
+                  "GSM", "Width", "Color", "Final Item", "Avg Roll Size", "Unit"]
+
+def fabric_rows(rows, rng):
+    item_types = ["DYED", "GREIGE", "ZIP"]
+    fabric_names = ["SINGLE JERSEY", "PIQUE", "RIB 1X1", "FLEECE", "INTERLOCK"]
+    for i in range(rows):
+        fabric_name = rng.choice(fabric_names)
+        yield [
+            rng.choice(item_types), f"{rng.choice([20, 24, 30, 40])}S", fabric_name,
+            rng.choice(["100% COTTON", "60/40 CVC", "95/5 COTTON LYCRA"]), "",
+            rng.choice([140, 160, 180, 220, 260, None]), f"{rng.randint(30, 72)}\"",
+            f"COLOUR {rng.randrange(500)}", f"{fabric_name} {i}", rng.choice(["25", "30", None]),
+            rng.choice(["KG", "MTR"])
+        ]
+
+def build_garment_workbook(rows, seed=42, target=None):
+    """Deterministic workbook with the sheets upload_excel understands.
+
+    FABRIC MASTER DATA gets `rows` rows; the code-keyed sheets get `rows`
+    rows each with roughly 10% repeated codes to exercise de-duplication.
+    Returns the bytes, or writes to `target` (a path) when given.
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+
+    def unique_ish(prefix, i):
+        return f"{prefix}{rng.randrange(i + 1) if rng.random() < 0.1 else i:07d}"
+
+    sheet = workbook.create_sheet("Color ID")
+    sheet.append(["Sr No", "Color"])
+    for i in range(rows):
+        sheet.append([i + 1, f"{unique_ish('C', i)}/Colour {i}"])
+
+    sheet = workbook.create_sheet("Art No.")
+    sheet.append(["Art No."])
+    for i in range(rows):
+        sheet.append([unique_ish("ART", i)])
+
+    sheet = workbook.create_sheet("Units Master")
+    sheet.append(["Unit"])
+    for i in range(rows):
+        sheet.append([unique_ish("U", i)])
+
+    sheet = workbook.create_sheet("Components")
+    sheet.append(["Component"])
+    for i in range(rows):
+        sheet.append([f"Component {unique_ish('', i)}"])
+
+    sheet = workbook.create_sheet("FABRIC MASTER DATA")
+    sheet.append(FABRIC_HEADERS)
+    for row in fabric_rows(rows, rng):
+        sheet.append(row)
+
+    if target is not None:
+        workbook.save(target)
+        return target
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def write_fabric_dataset(rows, directory, seed=42):
+    """The same fabric rows as .xlsx, .csv and .parquet; returns {format: path}"""
+    import pandas as pd
+
+    frame = pd.DataFrame(list(fabric_rows(rows, random.Random(seed))), columns=FABRIC_HEADERS)
+    frame["GSM"] = frame["GSM"].astype("Int64")
+    paths = {fmt: os.path.join(directory, f"fabrics_{rows}.{ext}")
+             for fmt, ext in (("excel", "xlsx"), ("csv", "csv"), ("parquet", "parquet"))}
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("FABRIC MASTER DATA")
+    sheet.append(FABRIC_HEADERS)
+    for row in frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None):
+        sheet.append(list(row))
+    workbook.save(paths["excel"])
+    frame.to_csv(paths["csv"], index=False)
+    frame.to_parquet(paths["parquet"], index=False)
+    return paths
+
+# A dynamic master shaped like the ones planners build: two unique keys and
+# one field of each type the upload validator coerces
+DYNAMIC_BENCH_FIELDS = [
+    {"name": "machine_code", "label": "Machine Code", "type": "text", "required": True, "unique": True, "order": 0},
+    {"name": "line", "label": "Line", "type": "text", "unique": True, "order": 1},
+    {"name": "capacity", "label": "Capacity", "type": "number", "validation": {"min": 0}, "order": 2},
+    {"name": "rate", "label": "Rate", "type": "decimal", "order": 3},
+    {"name": "category", "label": "Category", "type": "dropdown",
+     "options": ["Knitting", "Dyeing", "Cutting", "Stitching", "Finishing"], "order": 4},
+    {"name": "processes", "label": "Processes", "type": "multiselect",
+     "options": ["Overlock", "Flatlock", "Single Needle", "Bartack", "Buttonhole"], "order": 5},
+    {"name": "commissioned_on", "label": "Commissioned On", "type": "date", "order": 6},
+    {"name": "active", "label": "Active", "type": "checkbox", "order": 7},
+    {"name": "notes", "label": "Notes", "type": "text", "order": 8}
+]
+
+def build_dynamic_workbook(rows, seed=42, target=None, invalid_rate=0.02):
+    """Deterministic upload for DYNAMIC_BENCH_FIELDS with `rows` data rows.
+
+    About `invalid_rate` of the rows carry a bad number or an unknown option,
+    so the validator's reject path is part of the measurement.
+    """
+    rng = random.Random(seed)
+    categories = DYNAMIC_BENCH_FIELDS[4]["options"]
+    processes = DYNAMIC_BENCH_FIELDS[5]["options"]
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Machines")
+    sheet.append([field["label"] for field in DYNAMIC_BENCH_FIELDS])
+    for i in range(rows):
+        invalid = rng.random() < invalid_rate
+        sheet.append([
+            f"M{i:07d}", f"L{rng.randrange(40):02d}",
+            "lots" if invalid else rng.randint(50, 5000), round(rng.uniform(0.5, 25), 2),
+            "Weaving" if invalid and rng.random() < 0.5 else rng.choice(categories),
+            ", ".join(rng.sample(processes, rng.randint(1, 3))),
+            f"20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rng.choice(["Yes", "No"]), rng.choice(["", "Needs service", f"Bay {rng.randrange(20)}"])
+        ])
+
+    if target is not None:
+        workbook.save(target)
+        return target
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+BOM_QUALITIES = [f"{name} {count}S" for name in ("SINGLE JERSEY", "PIQUE", "RIB 1X1", "FLEECE", "INTERLOCK")
+                 for count in (20, 24, 30, 40)]
+
+def build_bom(tables, rows, rng):
+    """A comprehensive BOM shaped like the form's, with `tables` fabric and
+    trims tables of `rows` rows each and 20 operations"""
+    def fabric_row(i):
+        colour = rng.randrange(50)
+        return {
+            "srNo": i + 1, "comboName": f"COMBO {rng.randrange(4)}", "lotNo": "", "lotCount": "",
+            "colourId": f"colour-{colour}", "colourCode": f"C{colour:03d}", "colour": f"COLOUR {colour}",
+            "fabricQuality": rng.choice(BOM_QUALITIES), "fcNo": "", "planRat": f"{rng.uniform(0.1, 0.6):.3f}",
+            "gsm": str(rng.choice([140, 160, 180, 220])), "priority": "",
+            "component": rng.choice(["BODY", "SLEEVE", "COLLAR", "CUFF", "POCKET"]), "avgUnit": "kg",
+            "orderPcs": str(rng.randint(500, 5000)), "extraPcs": str(rng.randint(0, 100)), "wastagePcs": str(rng.randint(0, 50))
+        }
+
+    def trims_row(i):
+        quantity, price = rng.randint(100, 10000), round(rng.uniform(0.05, 3), 2)
+        return {
+            "srNo": i + 1, "comboName": "", "trimType": rng.choice(["LABEL", "BUTTON", "THREAD", "TAPE"]),
+            "itemName": f"TRIM {rng.randrange(300)}", "itemCode": f"TRM-{rng.randrange(300):04d}", "color": "",
+            "size": "", "quantity": str(quantity), "supplier": "", "unitPrice": str(price),
+            "totalCost": f"{quantity * price:.2f}"
+        }
+
+    return {
+        "header": {"artNo": f"ART-{rng.randrange(10 ** 6):06d}", "styleNumber": f"ST-{rng.randrange(10 ** 4)}", "planQty": "1000"},
+        "fabricTables": [{"id": t + 1, "name": f"BOM Table {t + 1}", "items": [fabric_row(i) for i in range(rows)]}
+                         for t in range(tables)],
+        "trimsTables": [{"id": t + 1, "name": f"Trims for BOM Table {t + 1}", "items": [trims_row(i) for i in range(rows)]}
+                        for t in range(tables)],
+        "operations": [{"srNo": i + 1, "sequenceType": "Fixed", "operationName": f"OPERATION {i}",
+                        "sam": f"{rng.uniform(0.2, 2):.2f}", "costPerPiece": f"{rng.uniform(0.05, 1):.2f}"} for i in range(20)]
+    }
+
+# Peak RSS of the child in KiB. ru_maxrss survives exec on Linux and would
+# report the benchmark process itself, so prefer the per-process VmHWM.
+PEAK_RSS_SNIPPET = """
+def peak_rss_kib():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+# Child process for bench_ingest_formats: read a fabric file in 1000-row
+# chunks with the reader the import job uses for that format, then print
+# rows, seconds and peak RSS in KiB.
+PARSE_FORMAT_SCRIPT = PEAK_RSS_SNIPPET + """
+import sys, time
+path, fmt = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+rows = 0
+if fmt == "excel":
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    chunk = []
+    for row in workbook.active.iter_rows(min_row=2, values_only=True):
+        chunk.append(row)
+        if len(chunk) >= 1000:
+            rows += len(chunk)
+            chunk = []
+    rows += len(chunk)
+elif fmt == "csv":
+    import pandas as pd
+    for frame in pd.read_csv(path, dtype=str, na_filter=False, chunksize=1000):
+        rows += len(frame)
+else:
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=1000):
+        rows += len(batch.to_pandas())
+print(rows, time.perf_counter() - start, peak_rss_kib())
+"""
+
+# Child process for bench_excel_memory: parse every sheet the way the server
+# does and print the peak RSS in KiB. "full" is the old whole-workbook load,
+# "read_only" the streaming path upload_excel uses now.
+PARSE_RSS_SCRIPT = PEAK_RSS_SNIPPET + """
+import io, sys
+import openpyxl
+path, mode = sys.argv[1], sys.argv[2]
+if mode == "full":
+    with open(path, "rb") as f:
+        workbook = openpyxl.load_workbook(io.BytesIO(f.read()))
+else:
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+rows, chunk = 0, []
+for sheet in workbook.worksheets:
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        chunk.append(row)
+        if len(chunk) >= 1000:
+            rows += len(chunk)
+            chunk = []
+rows += len(chunk)
+print(rows, peak_rss_kib())
+"""
+
+# Row counts for bench_import_suite, overridable as a comma-separated list
+IMPORT_SUITE_SIZES = tuple(int(size) for size in os.environ.get(
+    "BENCH_IMPORT_SIZES", "1000,10000,100000,1000000").split(",") if size.strip())
+
+# Scenarios that do not talk to the API server
+LOCAL_SCENARIOS = {"excel_memory", "ingest_formats"}
+
+class GarmentERPBenchmark:
+    def __init__(self, base_url=os.environ.get("BENCH_BASE_URL", "http://localhost:8001/api")):
+        self.base_url = base_url
+        self.token = None
+        self.user_data = None
+        self.results = {}
+        self.secret_key = os.environ.get('SECRET_KEY', 'garment-manufacturing-secret-key-change-in-production')
+
+    def headers(self, token=None):
+        return {'Authorization': f'Bearer {token or self.token}'}
+
+    def summarize(self, samples):
+        """Latency summary in milliseconds"""
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3)
+        }
+
+    def record(self, name, result):
+        self.results[name] = result
+        print(f"📊 {name}: {json.dumps(result)}")
+
+    def time_requests(self, method, endpoint, count, **kwargs):
+        session = requests.Session()
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = session.request(method, f"{self.base_url}/{endpoint}", timeout=60, **kwargs)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        return samples
+
+    def authenticate(self):
+        """Register a throwaway admin user for the benchmark run"""
+        stamp = datetime.now().strftime('%H%M%S%f')
+        user_data = {
+            "username": f"bench_{stamp}",
+            "email": f"bench_{stamp}@test.com",
+            "password": "BenchPass123!",
+            "role": "admin"
+        }
+        response = requests.post(f"{self.base_url}/auth/register", json=user_data, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ Registration failed - {response.status_code}")
+            return False
+        data = response.json()
+        self.token = data['access_token']
+        self.user_data = data['user']
+        return True
+
+    def bench_auth_overhead(self, count=500):
+        """Compare /auth/me with a claims token against a legacy sub-only token.
+
+        The legacy token forces get_current_user down the users.find_one path,
+        so the difference between the two is the per-request DB lookup cost.
+        """
+        print("\n🔍 Benchmarking auth overhead...")
+        legacy_token = jwt.encode(
+            {"sub": self.user_data['email'], "exp": datetime.now(timezone.utc) + timedelta(hours=1)},
+            self.secret_key,
+            algorithm="HS256"
+        )
+        # Warm up connections on both paths
+        self.time_requests("GET", "auth/me", 20, headers=self.headers())
+        self.time_requests("GET", "auth/me", 20, headers=self.headers(legacy_token))
+
+        stateless = self.summarize(self.time_requests("GET", "auth/me", count, headers=self.headers()))
+        with_lookup = self.summarize(self.time_requests("GET", "auth/me", count, headers=self.headers(legacy_token)))
+        self.record("auth_overhead", {
+            "stateless_claims": stateless,
+            "db_lookup": with_lookup,
+            "saved_per_request_ms": round(with_lookup["mean_ms"] - stateless["mean_ms"], 3)
+        })
+
+    def bench_login_storm(self, logins=200, concurrency=100, probes=300):
+        """p99 latency of /colors while `concurrency` clients hammer /auth/login"""
+        print("\n🔍 Benchmarking /colors latency during a login storm...")
+        baseline = self.summarize(self.time_requests("GET", "colors", probes, headers=self.headers()))
+
+        login_data = {"email": self.user_data['email'], "password": "BenchPass123!"}
+        statuses = {}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def login_worker():
+            session = requests.Session()
+            while not stop.is_set():
+                with lock:
+                    if sum(statuses.values()) >= logins:
+                        return
+                response = session.post(f"{self.base_url}/auth/login", json=login_data, timeout=120)
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(login_worker)
+            during = self.summarize(self.time_requests("GET", "colors", probes, headers=self.headers()))
+            stop.set()
+
+        self.record("login_storm", {
+            "colors_baseline": baseline,
+            "colors_during_storm": during,
+            "login_statuses": {str(code): count for code, count in statuses.items()}
+        })
+
+    def mongo_query_ops(self):
+        """Server-wide query+getmore counters, when MONGO_URL is reachable"""
+        if not os.environ.get("MONGO_URL"):
+            return None
+        from pymongo import MongoClient
+        with MongoClient(os.environ["MONGO_URL"]) as mongo:
+            counters = mongo.admin.command("serverStatus")["opcounters"]
+        return counters["query"] + counters["getmore"]
+
+    def mongo_storage(self, collection_names):
+        """Document count and sizes per collection, when MONGO_URL is reachable"""
+        if not os.environ.get("MONGO_URL"):
+            return None
+        from pymongo import MongoClient
+        from pymongo.errors import OperationFailure
+        stats = {}
+        with MongoClient(os.environ["MONGO_URL"]) as mongo:
+            database = mongo[os.environ.get("DB_NAME", "test")]
+            for name in collection_names:
+                try:
+                    collection = database.command("collStats", name)
+                except OperationFailure:
+                    continue
+                stats[name] = {
+                    "count": collection.get("count", 0),
+                    "size_mb": round(collection.get("size", 0) / 1024 / 1024, 3),
+                    "avg_doc_bytes": collection.get("avgObjSize", 0)
+                }
+        return stats
+
+    def bench_coalescing(self, endpoint="boms", burst=100, rounds=5):
+        """Mongo ops and latency for a burst of identical GETs, with and without coalescing.
+
+        The uncoalesced run sends Cache-Control: no-cache, which the server's
+        coalescer treats as an opt-out.
+        """
+        print(f"\n🔍 Benchmarking request coalescing on /{endpoint}...")
+
+        def run_burst(extra_headers):
+            headers = {**self.headers(), **extra_headers}
+            samples = []
+            before = self.mongo_query_ops()
+            with ThreadPoolExecutor(max_workers=burst) as pool:
+                for _ in range(rounds):
+                    def one_request():
+                        start = time.perf_counter()
+                        requests.get(f"{self.base_url}/{endpoint}", headers=headers, timeout=120).raise_for_status()
+                        return time.perf_counter() - start
+                    samples += list(pool.map(lambda _: one_request(), range(burst)))
+            after = self.mongo_query_ops()
+            result = self.summarize(samples)
+            if before is not None:
+                result["mongo_query_ops"] = after - before
+            return result
+
+        stats_before = requests.get(f"{self.base_url}/admin/coalescing-stats", headers=self.headers(), timeout=30).json()
+        coalesced = run_burst({})
+        stats_after = requests.get(f"{self.base_url}/admin/coalescing-stats", headers=self.headers(), timeout=30).json()
+        uncoalesced = run_burst({"Cache-Control": "no-cache"})
+        self.record("coalescing", {
+            "coalesced": coalesced,
+            "uncoalesced": uncoalesced,
+            "requests_coalesced": stats_after["coalesced"] - stats_before["coalesced"],
+            "leader_requests": stats_after["leaders"] - stats_before["leaders"]
+        })
+
+    def wait_for_job(self, job_id, interval=0.5):
+        """Poll /import-jobs until the job leaves the queued/running states"""
+        while True:
+            response = requests.get(f"{self.base_url}/import-jobs/{job_id}", headers=self.headers(), timeout=30)
+            response.raise_for_status()
+            job = response.json()
+            if job["status"] in ("completed", "failed", "cancelled"):
+                return job
+            time.sleep(interval)
+
+    def bench_upload_excel(self, sizes=(1000, 10000)):
+        """End-to-end /upload-excel throughput in sheet rows per second.
+
+        Also times /colors while the import runs, to show whether parsing
+        stalls other requests. Run it against two builds and compare the
+        JSON outputs.
+        """
+        print("\n🔍 Benchmarking /upload-excel throughput...")
+        result = {}
+        for rows in sizes:
+            # Distinct seeds so each run inserts fresh codes
+            content = build_garment_workbook(rows, seed=rows + int(time.time()))
+            probes = []
+            stop = threading.Event()
+
+            def probe():
+                session = requests.Session()
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    session.get(f"{self.base_url}/colors", headers=self.headers(), timeout=120)
+                    probes.append(time.perf_counter() - start)
+
+            prober = threading.Thread(target=probe)
+            prober.start()
+            start = time.perf_counter()
+            try:
+                response = requests.post(
+                    f"{self.base_url}/upload-excel",
+                    headers=self.headers(),
+                    files={"file": ("bench.xlsx", content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+                    timeout=3600
+                )
+                response.raise_for_status()
+                job = self.wait_for_job(response.json()["job_id"])
+            finally:
+                stop.set()
+                prober.join()
+            elapsed = time.perf_counter() - start
+            total_rows = rows * 5
+            result[str(rows)] = {
+                "sheet_rows": total_rows,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(total_rows / elapsed, 1),
+                "status": job["status"],
+                "progress": job["progress"],
+                "colors_during_import": self.summarize(probes) if probes else None
+            }
+        self.record("upload_excel", result)
+
+    def bench_excel_memory(self, sizes=(10000, 100000, 1000000), full_load_limit=100000):
+        """Peak RSS of parsing a garment workbook, full load vs read-only.
+
+        Runs locally (no server needed); each parse happens in a fresh
+        process so ru_maxrss reflects that parse alone. The full load is
+        skipped above `full_load_limit` rows, where it needs several GB.
+        """
+        print("\n🔍 Benchmarking Excel parse memory...")
+        result = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for rows in sizes:
+                path = build_garment_workbook(rows, target=os.path.join(workdir, f"bench_{rows}.xlsx"))
+                entry = {"file_mb": round(os.path.getsize(path) / 1024 / 1024, 2)}
+                modes = ["read_only"] + (["full"] if rows <= full_load_limit else [])
+                for mode in modes:
+                    start = time.perf_counter()
+                    output = subprocess.run(
+                        [sys.executable, "-c", PARSE_RSS_SCRIPT, path, mode],
+                        check=True, capture_output=True, text=True
+                    ).stdout.split()
+                    entry[mode] = {
+                        "rows": int(output[0]),
+                        "peak_rss_mb": round(int(output[1]) / 1024, 1),
+                        "seconds": round(time.perf_counter() - start, 3)
+                    }
+                result[str(rows)] = entry
+        self.record("excel_memory", result)
+
+    def bench_ingest_formats(self, rows=500000):
+        """Parse the same fabric dataset as Excel, CSV and Parquet.
+
+        Runs locally, one fresh process per format, using the same chunked
+        readers as the import job (openpyxl read-only, pandas read_csv,
+        pyarrow batches).
+        """
+        print(f"\n🔍 Benchmarking ingestion formats on {rows} rows...")
+        result = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for fmt, path in write_fabric_dataset(rows, workdir).items():
+                output = subprocess.run(
+                    [sys.executable, "-c", PARSE_FORMAT_SCRIPT, path, fmt],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                seconds = float(output[1])
+                result[fmt] = {
+                    "file_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+                    "rows": int(output[0]),
+                    "seconds": round(seconds, 3),
+                    "rows_per_sec": round(int(output[0]) / seconds, 1),
+                    "peak_rss_mb": round(int(output[2]) / 1024, 1)
+                }
+        self.record("ingest_formats", result)
+
+    def bench_upload_formats(self, rows=500000):
+        """End-to-end fabric import through /upload-excel for each format"""
+        print(f"\n🔍 Benchmarking fabric uploads by format on {rows} rows...")
+        result = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for fmt, path in write_fabric_dataset(rows, workdir, seed=int(time.time())).items():
+                start = time.perf_counter()
+                with open(path, "rb") as upload:
+                    response = requests.post(
+                        f"{self.base_url}/upload-excel",
+                        headers=self.headers(),
+                        files={"file": (os.path.basename(path), upload)},
+                        timeout=3600
+                    )
+                response.raise_for_status()
+                job = self.wait_for_job(response.json()["job_id"])
+                elapsed = time.perf_counter() - start
+                result[fmt] = {
+                    "seconds": round(elapsed, 3),
+                    "rows_per_sec": round(rows / elapsed, 1),
+                    "status": job["status"],
+                    "progress": job["progress"]
+                }
+        self.record("upload_formats", result)
+
+    def runtime_stats(self, reset=False):
+        method = "POST" if reset else "GET"
+        endpoint = "admin/runtime-stats/reset" if reset else "admin/runtime-stats"
+        response = requests.request(method, f"{self.base_url}/{endpoint}", headers=self.headers(), timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def timed_import(self, endpoint, path, sheet_rows, params=None):
+        """Upload one file, wait for its job and report throughput and server cost"""
+        self.runtime_stats(reset=True)
+        start = time.perf_counter()
+        with open(path, "rb") as upload:
+            response = requests.post(f"{self.base_url}/{endpoint}", headers=self.headers(), params=params,
+                                     files={"file": (os.path.basename(path), upload)}, timeout=3600)
+        response.raise_for_status()
+        job = self.wait_for_job(response.json()["job_id"])
+        elapsed = time.perf_counter() - start
+        stats = self.runtime_stats()
+        children = [mb for mb in stats["children_peak_rss_mb"].values() if mb is not None]
+        return {
+            "sheet_rows": sheet_rows,
+            "file_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(sheet_rows / elapsed, 1),
+            "status": job["status"],
+            "progress": job["progress"],
+            "server_peak_rss_mb": stats["peak_rss_mb"],
+            "parser_peak_rss_mb": max(children) if children else None,
+            "event_loop": stats["loop"]
+        }
+
+    def bench_import_suite(self, sizes=IMPORT_SUITE_SIZES):
+        """Import throughput of upload_excel and bulk_upload_dynamic_master by size.
+
+        Run the API as a single worker (runtime stats are per process) against
+        a local mongod; a throwaway one with --dbpath on tmpfs stands in for an
+        in-memory store. Workbooks come from the deterministic generators, with
+        the seed varied per run so each import inserts fresh rows. Reports
+        rows/sec, peak RSS of the API process and its parser processes, and
+        how long the event loop was blocked while the job ran (start the API
+        with LOOP_MONITOR=true for that).
+        """
+        print(f"\n🔍 Benchmarking imports at {', '.join(map(str, sizes))} rows...")
+        config = {"name": f"Bench Machines {int(time.time())}", "category": "Production", "fields": DYNAMIC_BENCH_FIELDS}
+        response = requests.post(f"{self.base_url}/master-configs", json=config, headers=self.headers(), timeout=30)
+        response.raise_for_status()
+        config_id = response.json()["id"]
+
+        result = {"upload_excel": {}, "dynamic_master": {}}
+        seed = int(time.time())
+        with tempfile.TemporaryDirectory() as workdir:
+            for rows in sizes:
+                path = os.path.join(workdir, f"garment_{rows}.xlsx")
+                start = time.perf_counter()
+                build_garment_workbook(rows, seed=seed + rows, target=path)
+                generated = time.perf_counter() - start
+                entry = self.timed_import("upload-excel", path, rows * 5)
+                entry["generate_seconds"] = round(generated, 3)
+                result["upload_excel"][str(rows)] = entry
+                os.unlink(path)
+
+                path = os.path.join(workdir, f"machines_{rows}.xlsx")
+                start = time.perf_counter()
+                build_dynamic_workbook(rows, seed=seed + rows, target=path)
+                generated = time.perf_counter() - start
+                entry = self.timed_import(f"dynamic-masters/{config_id}/bulk-upload", path, rows)
+                entry["generate_seconds"] = round(generated, 3)
+                result["dynamic_master"][str(rows)] = entry
+                os.unlink(path)
+        self.record("import_suite", result)
+
+    def bench_bom_layouts(self, boms=20, tables=4, rows=250, count=50):
+        """Embedded versus bom_lines storage of comprehensive BOMs.
+
+        Creates `boms` BOMs, moves them to each layout in turn and times
+        reading one, patching one cell, saving it whole, a line-level query
+        and the full BOM list. Storage sizes need MONGO_URL and DB_NAME.
+        """
+        print(f"\n🔍 Benchmarking BOM storage layouts ({boms} BOMs × {tables * rows * 2 + 20} lines)...")
+        rng = random.Random(7)
+        session = requests.Session()
+        session.headers.update(self.headers())
+        ids = []
+        for _ in range(boms):
+            response = session.post(f"{self.base_url}/boms/comprehensive", json=build_bom(tables, rows, rng), timeout=120)
+            response.raise_for_status()
+            ids.append(response.json()["bom_id"])
+
+        result = {"boms": boms, "lines_per_bom": tables * rows * 2 + 20}
+        try:
+            for layout in ("embedded", "lines"):
+                start = time.perf_counter()
+                for bom_id in ids:
+                    session.post(f"{self.base_url}/boms/{bom_id}/layout", params={"layout": layout}, timeout=120).raise_for_status()
+                entry = {"move_seconds": round(time.perf_counter() - start, 3)}
+                entry["get_bom"] = self.summarize(self.time_requests("GET", f"boms/{ids[0]}", count, headers=self.headers()))
+
+                bom = session.get(f"{self.base_url}/boms/{ids[0]}", timeout=60).json()
+                table_id = bom["fabricTables"][0]["id"]
+                row = bom["fabricTables"][0]["items"][rows // 2]
+                version = bom["version"]
+                samples = []
+                for n in range(count):
+                    body = {"version": version, "operations": [{
+                        "op": "set", "section": "fabric", "table_id": table_id, "row_id": row["rowId"],
+                        "field": "planRat", "value": f"{0.2 + n / 10000:.4f}"
+                    }]}
+                    start = time.perf_counter()
+                    response = session.patch(f"{self.base_url}/boms/{ids[0]}", json=body, timeout=60)
+                    samples.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    version = response.json()["version"]
+                entry["patch_cell"] = {**self.summarize(samples), "request_bytes": len(json.dumps(body))}
+
+                # Whole-BOM save, as the form did before patches
+                payload = {key: bom[key] for key in ("header", "fabricTables", "trimsTables", "operations")}
+                samples = []
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = session.put(f"{self.base_url}/boms/{ids[0]}", json={**payload, "version": version}, timeout=60)
+                    samples.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    version = response.json()["version"]
+                entry["put_bom"] = {**self.summarize(samples), "request_bytes": len(json.dumps(payload))}
+
+                entry["line_query"] = self.summarize(self.time_requests(
+                    "GET", "bom-lines", count, headers=self.headers(),
+                    params={"fabricQuality": row["fabricQuality"], "colourId": row["colourId"]}))
+                entry["list_full"] = self.summarize(self.time_requests(
+                    "GET", "boms", max(1, count // 10), headers=self.headers(), params={"view": "full", "limit": boms}))
+                storage = self.mongo_storage(["comprehensive_boms", "bom_lines"])
+                if storage is not None:
+                    entry["storage"] = storage
+                result[layout] = entry
+        finally:
+            for bom_id in ids:
+                session.delete(f"{self.base_url}/boms/{bom_id}", timeout=60)
+        self.record("bom_layouts", result)
+
+    def run_all(self, scenarios=None):
+        available = {
+            "auth": self.bench_auth_overhead,
+            "login_storm": self.bench_login_storm,
+            "coalescing": self.bench_coalescing,
+            "upload_excel": self.bench_upload_excel,
+            "excel_memory": self.bench_excel_memory,
+            "ingest_formats": self.bench_ingest_formats,
+            "upload_formats": self.bench_upload_formats,
+            "import_suite": self.bench_import_suite,
+            "bom_layouts": self.bench_bom_layouts,
+        }
+        scenarios = scenarios or list(available)
+        if set(scenarios) - LOCAL_SCENARIOS and not self.authenticate():
+            return False
+        for name in scenarios:
+            available[name]()
+        return True
+
+def main():
+    bench = GarmentERPBenchmark()
+    success = bench.run_all(sys.argv[1:] or None)
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "base_url": bench.base_url,
+        "results": bench.results
+    }
+
+    with open(os.environ.get("BENCH_OUTPUT", "backend_benchmark_results.json"), 'w') as f:
+        json.dump(results, f, indent=2)
+
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
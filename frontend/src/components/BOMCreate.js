@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
@@ -16,6 +17,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
   const [articles, setArticles] = useState([]);
   const [colors, setColors] = useState([]);
   const [fabrics, setFabrics] = useState([]);
+  const [processLoss, setProcessLoss] = useState({ factors: {}, default: 1 });
   const [buyers, setBuyers] = useState([]);
   const [suppliers, setSuppliers] = useState([]);
   const [isEditMode, setIsEditMode] = useState(mode === "edit");
@@ -117,7 +119,14 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
     setIsEditMode(mode === "edit");
   }, [mode]);
 
-  const loadInitialData = (data) => {
+  // Work on a copy: BOMManagement diffs the edits against the loaded BOM.
+  // Rows are numbered by position; patched BOMs may store stale numbers.
+  const loadInitialData = (loaded) => {
+    const data = structuredClone(loaded);
+    const renumber = (items) => items.forEach((item, i) => { item.srNo = i + 1; });
+    (data.fabricTables || []).forEach((table) => renumber(table.items || []));
+    (data.trimsTables || []).forEach((table) => renumber(table.items || []));
+    renumber(data.operations || []);
     if (data.header) {
       setHeaderData(data.header);
     }
@@ -134,18 +143,20 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
 
   const fetchMasterData = async () => {
     try {
-      const [articlesRes, colorsRes, fabricsRes, buyersRes, suppliersRes] = await Promise.all([
-        axios.get(`${API}/articles`),
-        axios.get(`${API}/colors`),
-        axios.get(`${API}/fabrics`),
-        axios.get(`${API}/buyers`),
-        axios.get(`${API}/suppliers`)
+      const [articlesRes, colorsRes, fabricsRes, buyersRes, suppliersRes, processLossRes] = await Promise.all([
+        getAllPages(`${API}/articles`, { params: { fields: "code,name" } }),
+        getAllPages(`${API}/colors`, { params: { fields: "code,name" } }),
+        getAllPages(`${API}/fabrics`, { params: { fields: "fabric_name,final_item,gsm,item_type" } }),
+        getAllPages(`${API}/buyers`, { params: { fields: "name" } }),
+        getAllPages(`${API}/suppliers`, { params: { fields: "name" } }),
+        axios.get(`${API}/fabrics/process-loss`)
       ]);
       setArticles(articlesRes.data);
       setColors(colorsRes.data);
       setFabrics(fabricsRes.data);
       setBuyers(buyersRes.data);
       setSuppliers(suppliersRes.data);
+      setProcessLoss(processLossRes.data);
     } catch (error) {
       toast.error("Error fetching master data");
     }
@@ -192,7 +203,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
       const copiedTable = {
         id: newId,
         name: `${tableToCopy.name} (Copy)`,
-        items: tableToCopy.items.map(item => ({ ...item }))
+        items: tableToCopy.items.map(({ rowId, ...item }) => ({ ...item }))
       };
       setBomTables([...bomTables, copiedTable]);
       
@@ -202,7 +213,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
         const copiedTrimsTable = {
           id: newId,
           name: `Trims for ${tableToCopy.name} (Copy)`,
-          items: trimsToCopy.items.map(item => ({ ...item }))
+          items: trimsToCopy.items.map(({ rowId, ...item }) => ({ ...item }))
         };
         setTrimsTables([...trimsTables, copiedTrimsTable]);
       }
@@ -250,7 +261,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
   const copyRow = (tableId, rowIndex) => {
     setBomTables(bomTables.map(table => {
       if (table.id === tableId) {
-        const itemToCopy = { ...table.items[rowIndex] };
+        const { rowId, ...itemToCopy } = table.items[rowIndex];
         const newItem = { ...itemToCopy, srNo: table.items.length + 1 };
         return { ...table, items: [...table.items, newItem] };
       }
@@ -265,7 +276,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
         const newItems = [...table.items];
         newItems[rowIndex][field] = value;
 
-        if (["orderPcs", "extraPcs", "wastagePcs", "planRat"].includes(field)) {
+        if (["orderPcs", "extraPcs", "wastagePcs", "planRat", "fabricId", "fabricQuality"].includes(field)) {
           const item = newItems[rowIndex];
           const order = parseFloat(item.orderPcs) || 0;
           const extra = parseFloat(item.extraPcs) || 0;
@@ -274,7 +285,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
           const totalPcs = order + extra + wastage;
           const readyFabric = (totalPcs * planRat).toFixed(2);
           item.readyFabricNeed = readyFabric;
-          item.greigeFabricNeed = (parseFloat(readyFabric) * 1.05).toFixed(2);
+          item.greigeFabricNeed = (parseFloat(readyFabric) * processLossFactor(item)).toFixed(2);
           item.shortage = (parseFloat(item.greigeFabricNeed) - parseFloat(item.readyFabricNeed)).toFixed(2);
         }
 
@@ -284,6 +295,14 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
     }));
   };
 
+  // Same lookup as the server: the row's fabric by id, else by quality name
+  const processLossFactor = (item) => {
+    const fabric = fabrics.find(f => item.fabricId && f.id === item.fabricId)
+      || fabrics.find(f => !item.fabricId && item.fabricQuality && (f.final_item === item.fabricQuality || f.fabric_name === item.fabricQuality));
+    const itemType = (fabric?.item_type || "").trim().toUpperCase();
+    return processLoss.factors[itemType] ?? processLoss.default;
+  };
+
   const handleColorSelect = (tableId, rowIndex, colorId) => {
     const color = colors.find(c => c.id === colorId);
     if (color) {
@@ -296,6 +315,8 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
   const handleFabricSelect = (tableId, rowIndex, fabricId) => {
     const fabric = fabrics.find(f => f.id === fabricId);
     if (fabric) {
+      // The server looks up the fabric's process-loss factor by id
+      updateItem(tableId, rowIndex, "fabricId", fabric.id);
       updateItem(tableId, rowIndex, "fabricQuality", fabric.final_item || fabric.fabric_name);
       updateItem(tableId, rowIndex, "gsm", fabric.gsm || "");
     }
@@ -328,7 +349,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
   const copyTrimsRow = (tableId, rowIndex) => {
     setTrimsTables(trimsTables.map(table => {
       if (table.id === tableId) {
-        const itemToCopy = { ...table.items[rowIndex] };
+        const { rowId, ...itemToCopy } = table.items[rowIndex];
         const newItem = { ...itemToCopy, srNo: table.items.length + 1 };
         return { ...table, items: [...table.items, newItem] };
       }
@@ -378,7 +399,7 @@ export default function BOMCreate({ onCancel, onSave, onEdit, mode = "create", i
   };
 
   const copyOperationsRow = (index) => {
-    const itemToCopy = { ...operationsItems[index] };
+    const { rowId, ...itemToCopy } = operationsItems[index];
     const newItem = { ...itemToCopy, srNo: operationsItems.length + 1 };
     setOperationsItems([...operationsItems, newItem]);
     toast.success("Operation row copied");
@@ -1,7 +1,9 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
 import Layout from "@/components/Layout";
 import BOMCreate from "@/components/BOMCreate";
+import { bomPatchOperations } from "@/lib/bomPatch";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
@@ -26,7 +28,7 @@ export default function BOMManagement({ user, onLogout }) {
   const fetchBOMs = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API}/boms`);
+      const response = await getAllPages(`${API}/boms`);
       setBoms(response.data);
     } catch (error) {
       toast.error("Error fetching BOMs");
@@ -39,7 +41,13 @@ export default function BOMManagement({ user, onLogout }) {
     try {
       if (selectedBOM) {
         // Update existing BOM
-        await axios.put(`${API}/boms/${selectedBOM.id}`, bomData);
+        // Send only the edits when a patch can express them
+        const operations = bomPatchOperations(selectedBOM, bomData);
+        if (operations?.length) {
+          await axios.patch(`${API}/boms/${selectedBOM.id}`, { version: selectedBOM.version ?? 0, operations });
+        } else if (!operations) {
+          await axios.put(`${API}/boms/${selectedBOM.id}`, { ...bomData, version: selectedBOM.version ?? 0 });
+        }
         toast.success("BOM updated successfully");
       } else {
         // Create new BOM
@@ -51,7 +59,8 @@ export default function BOMManagement({ user, onLogout }) {
       setViewMode("list");
       fetchBOMs();
     } catch (error) {
-      toast.error(error.response?.data?.detail || "Error saving BOM");
+      const detail = error.response?.data?.detail;
+      toast.error(detail?.message || detail || "Error saving BOM");
     }
   };
 
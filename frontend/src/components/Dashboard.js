@@ -1,5 +1,5 @@
 import { useState, useEffect } from "react";
-import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
 import Layout from "@/components/Layout";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Users, Package, FileText, ClipboardList } from "lucide-react";
@@ -27,14 +27,14 @@ export default function Dashboard({ user, onLogout }) {
   const fetchStats = async () => {
     try {
       const [buyers, suppliers, materials, colors, sizes, articles, boms, mrps] = await Promise.all([
-        axios.get(`${API}/buyers`),
-        axios.get(`${API}/suppliers`),
-        axios.get(`${API}/raw-materials`),
-        axios.get(`${API}/colors`),
-        axios.get(`${API}/sizes`),
-        axios.get(`${API}/articles`),
-        axios.get(`${API}/boms`),
-        axios.get(`${API}/mrps`)
+        getAllPages(`${API}/buyers`),
+        getAllPages(`${API}/suppliers`),
+        getAllPages(`${API}/raw-materials`),
+        getAllPages(`${API}/colors`),
+        getAllPages(`${API}/sizes`),
+        getAllPages(`${API}/articles`),
+        getAllPages(`${API}/boms`),
+        getAllPages(`${API}/mrps`)
       ]);
 
       const unassigned = boms.data.filter(b => b.status === "unassigned").length;
@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
+import { startImport, waitForImportJob } from "@/lib/importJobs";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
@@ -38,7 +40,7 @@ export default function DynamicMasterManager({ config, onBack }) {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API}/dynamic-masters/${config.id}/data`);
+      const response = await getAllPages(`${API}/dynamic-masters/${config.id}/data`);
       setData(response.data);
     } catch (error) {
       toast.error("Error fetching data");
@@ -108,16 +110,25 @@ export default function DynamicMasterManager({ config, onBack }) {
     const file = event.target.files[0];
     if (!file) return;
 
-    const formData = new FormData();
-    formData.append("file", file);
-
     try {
-      const response = await axios.post(
-        `${API}/dynamic-masters/${config.id}/bulk-upload`,
-        formData,
-        { headers: { "Content-Type": "multipart/form-data" } }
-      );
-      toast.success(response.data.message);
+      const started = await startImport(file, {
+        url: `${API}/dynamic-masters/${config.id}/bulk-upload`,
+        // With a unique key configured, re-uploads update rows instead of duplicating them
+        params: { mode: config.fields.some((field) => field.unique) ? "upsert" : "insert" },
+        session: { kind: "dynamic_master", config_id: config.id }
+      });
+      const job = await waitForImportJob(started.job_id);
+      if (job.status !== "completed") {
+        toast.error(job.error || `Import ${job.status}`);
+        return;
+      }
+      toast.success(`Successfully uploaded ${job.results.added_count} records`);
+      if (job.results.updated_count > 0) {
+        toast.info(`Updated ${job.results.updated_count} existing records`);
+      }
+      if (job.progress.rows_failed > 0) {
+        toast.warning(`${job.progress.rows_failed} rows could not be imported`);
+      }
       fetchData();
     } catch (error) {
       toast.error(error.response?.data?.detail || "Error uploading file");
@@ -358,7 +369,7 @@ export default function DynamicMasterManager({ config, onBack }) {
             <>
               <input
                 type="file"
-                accept=".xlsx,.xls"
+                accept=".xlsx,.xls,.csv,.parquet"
                 onChange={handleExcelUpload}
                 className="hidden"
                 id="excel-upload"
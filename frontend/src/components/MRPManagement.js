@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
 import Layout from "@/components/Layout";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
@@ -29,8 +30,8 @@ export default function MRPManagement({ user, onLogout }) {
     setLoading(true);
     try {
       const [mrpsRes, bomsRes] = await Promise.all([
-        axios.get(`${API}/mrps`),
-        axios.get(`${API}/boms?status=unassigned`)
+        getAllPages(`${API}/mrps`),
+        getAllPages(`${API}/boms?status=unassigned`)
       ]);
 
       setMrps(mrpsRes.data);
@@ -63,6 +63,7 @@ export default function MasterConfigBuilder({ initialConfig, onSave, onCancel })
       label: `Field ${fields.length + 1}`,
       type: fieldType,
       required: false,
+      unique: false,
       options: fieldType === "dropdown" || fieldType === "multiselect" ? ["Option 1", "Option 2"] : null,
       validation: {},
       placeholder: "",
@@ -311,6 +312,7 @@ export default function MasterConfigBuilder({ initialConfig, onSave, onCancel })
                             <div className="text-xs text-slate-500">
                               {field.name} • {field.type}
                               {field.required && " • Required"}
+                              {field.unique && " • Unique"}
                             </div>
                           </div>
                           <Button
@@ -411,6 +413,17 @@ export default function MasterConfigBuilder({ initialConfig, onSave, onCancel })
                       <Label htmlFor="required" className="cursor-pointer">Required Field</Label>
                     </div>
 
+                    <div className="flex items-center gap-2">
+                      <input
+                        type="checkbox"
+                        id="unique"
+                        checked={selectedField.unique || false}
+                        onChange={(e) => updateField(selectedField.id, { unique: e.target.checked })}
+                        className="h-4 w-4"
+                      />
+                      <Label htmlFor="unique" className="cursor-pointer">Unique Key (matches rows on Excel re-upload)</Label>
+                    </div>
+
                     {(selectedField.type === "number" || selectedField.type === "decimal") && (
                       <>
                         <div>
@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
+import { getAllPages } from "@/lib/pagedList";
+import { startImport, waitForImportJob } from "@/lib/importJobs";
 import Layout from "@/components/Layout";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
@@ -232,13 +234,13 @@ export default function Masters({ user, onLogout }) {
     setLoading(true);
     try {
       const [buyersRes, suppliersRes, materialsRes, colorsRes, sizesRes, articlesRes, fabricsRes] = await Promise.all([
-        axios.get(`${API}/buyers`),
-        axios.get(`${API}/suppliers`),
-        axios.get(`${API}/raw-materials`),
-        axios.get(`${API}/colors`),
-        axios.get(`${API}/sizes`),
-        axios.get(`${API}/articles`),
-        axios.get(`${API}/fabrics`)
+        getAllPages(`${API}/buyers`),
+        getAllPages(`${API}/suppliers`),
+        getAllPages(`${API}/raw-materials`),
+        getAllPages(`${API}/colors`),
+        getAllPages(`${API}/sizes`),
+        getAllPages(`${API}/articles`),
+        getAllPages(`${API}/fabrics`)
       ]);
 
       setBuyers(buyersRes.data);
@@ -262,24 +264,32 @@ export default function Masters({ user, onLogout }) {
     }
 
     setUploadLoading(true);
-    const formData = new FormData();
-    formData.append("file", selectedFile);
 
     try {
-      const response = await axios.post(`${API}/upload-excel`, formData, {
-        headers: {
-          "Content-Type": "multipart/form-data"
-        }
+      // Upsert so re-importing a sheet updates rows instead of duplicating them
+      const started = await startImport(selectedFile, {
+        url: `${API}/upload-excel`,
+        params: { mode: "upsert" },
+        session: { kind: "masters" }
       });
 
-      toast.success(response.data.message);
+      const job = await waitForImportJob(started.job_id);
+      if (job.status !== "completed") {
+        toast.error(job.error || `Import ${job.status}`);
+        return;
+      }
+
+      toast.success("Excel file processed successfully");
       
-      const results = response.data.results;
+      const results = job.results;
       if (results.errors && results.errors.length > 0) {
         toast.warning(`${results.errors.length} errors occurred during import`);
       }
       
       toast.info(`Added: ${results.colors_added} colors, ${results.articles_added} articles, ${results.sizes_added} units, ${results.raw_materials_added} components, ${results.fabrics_added} fabrics`);
+      if (results.updated_count > 0 || results.unchanged_count > 0) {
+        toast.info(`Updated ${results.updated_count}, unchanged ${results.unchanged_count}`);
+      }
       
       setUploadDialogOpen(false);
       setSelectedFile(null);
@@ -793,6 +803,7 @@ export default function Masters({ user, onLogout }) {
       final_item: "",
       avg_roll_size: "",
       unit: "Pcs",
+      price_per_unit: "",
       image_url: ""
     });
     const [uploading, setUploading] = useState(false);
@@ -812,6 +823,7 @@ export default function Masters({ user, onLogout }) {
           final_item: editItem.final_item || "",
           avg_roll_size: editItem.avg_roll_size || "",
           unit: editItem.unit || "Pcs",
+          price_per_unit: editItem.price_per_unit ?? "",
           image_url: editItem.image_url || ""
         });
       } else {
@@ -827,6 +839,7 @@ export default function Masters({ user, onLogout }) {
           final_item: "",
           avg_roll_size: "",
           unit: "Pcs",
+          price_per_unit: "",
           image_url: ""
         });
       }
@@ -865,6 +878,7 @@ export default function Masters({ user, onLogout }) {
           width: formData.width || null,
           color: formData.color || null,
           avg_roll_size: formData.avg_roll_size || null,
+          price_per_unit: formData.price_per_unit === "" ? null : parseFloat(formData.price_per_unit),
           image_url: formData.image_url || null
         };
         onSubmit(cleanedData);
@@ -958,6 +972,10 @@ export default function Masters({ user, onLogout }) {
             </select>
           </div>
         </div>
+        <div className="space-y-2">
+          <Label>Price per Unit (Optional)</Label>
+          <Input type="number" step="0.01" min="0" value={formData.price_per_unit} onChange={(e) => setFormData({ ...formData, price_per_unit: e.target.value })} />
+        </div>
         <Button type="submit" className="w-full bg-blue-600 hover:bg-blue-700">Save</Button>
       </form>
     );
@@ -982,14 +1000,15 @@ export default function Masters({ user, onLogout }) {
               <DialogHeader>
                 <DialogTitle>Upload Master Data from Excel</DialogTitle>
                 <DialogDescription>
-                  Upload an Excel file with sheets: Color ID, Art No., Units Master, Components
+                  Upload an Excel file with sheets: Color ID, Art No., Units Master, Components, FABRIC MASTER DATA,
+                  or a CSV/Parquet file of fabric master data
                 </DialogDescription>
               </DialogHeader>
               <div className="space-y-4">
                 <div className="border-2 border-dashed border-slate-300 rounded-lg p-6 text-center">
                   <input
                     type="file"
-                    accept=".xlsx,.xls"
+                    accept=".xlsx,.xls,.csv,.parquet"
                     onChange={(e) => setSelectedFile(e.target.files[0])}
                     className="hidden"
                     id="file-upload"
@@ -1194,7 +1213,8 @@ export default function Masters({ user, onLogout }) {
                 { key: "color", label: "Color" },
                 { key: "final_item", label: "Final Item" },
                 { key: "avg_roll_size", label: "Avg Roll Size" },
-                { key: "unit", label: "Unit" }
+                { key: "unit", label: "Unit" },
+                { key: "price_per_unit", label: "Price/Unit" }
               ]}
               data={fabrics}
               onAdd={handleAddFabric}
@@ -0,0 +1,70 @@
+// Turn the edits made to a comprehensive BOM into PATCH /boms/{id} operations,
+// so saving sends the changed cells and rows instead of the whole BOM.
+
+// Recomputed by the server, or positional
+const SKIPPED_FIELDS = new Set(["rowId", "srNo", "readyFabricNeed", "greigeFabricNeed", "shortage"]);
+const TABLE_SECTIONS = { fabric: "fabricTables", trims: "trimsTables" };
+
+const same = (a, b) => JSON.stringify(a ?? null) === JSON.stringify(b ?? null);
+
+function changedFields(before, after) {
+  const fields = new Set([...Object.keys(before || {}), ...Object.keys(after || {})]);
+  return [...fields].filter((field) => !SKIPPED_FIELDS.has(field) && !same(before?.[field], after?.[field]));
+}
+
+// Diff one row list. Rows are matched by rowId; rows without one, or repeating
+// one (copied rows), are new. Returns null when only a full save can express
+// the change: rows the server has no id for, or existing rows moved around.
+function diffRows(target, before, after, ops) {
+  if (before.some((row) => !row.rowId)) return null;
+  const known = new Map(before.map((row) => [row.rowId, row]));
+  const seen = new Set();
+  const kept = [];
+  let inserting = false;
+  for (const row of after) {
+    if (known.has(row.rowId) && !seen.has(row.rowId)) {
+      // Only appending rows keeps the server's order without a reorder
+      if (inserting) return null;
+      seen.add(row.rowId);
+      kept.push(row.rowId);
+      for (const field of changedFields(known.get(row.rowId), row)) {
+        ops.sets.push({ op: "set", ...target, row_id: row.rowId, field, value: row[field] ?? null });
+      }
+    } else {
+      inserting = true;
+      const { rowId, ...fields } = row;
+      ops.inserts.push({ op: "insert_row", ...target, row: fields });
+    }
+  }
+  const remaining = before.map((row) => row.rowId).filter((rowId) => seen.has(rowId));
+  if (!same(remaining, kept)) return null;
+  for (const row of before) {
+    if (!seen.has(row.rowId)) ops.deletes.push({ op: "delete_row", ...target, row_id: row.rowId });
+  }
+  return ops;
+}
+
+// The operations of one patch, which the server applies together or not at
+// all. Returns null when the edits need a full save (PUT), e.g. after adding,
+// removing or copying tables.
+export function bomPatchOperations(original, edited) {
+  if (!Array.isArray(original?.fabricTables)) return null;
+  const ops = { sets: [], deletes: [], inserts: [] };
+  for (const field of changedFields(original.header, edited.header)) {
+    ops.sets.push({ op: "set", section: "header", field, value: edited.header?.[field] ?? null });
+  }
+  for (const [section, key] of Object.entries(TABLE_SECTIONS)) {
+    const before = original[key] || [];
+    const after = edited[key] || [];
+    if (!same(before.map((table) => table.id), after.map((table) => table.id))) return null;
+    for (const [index, table] of after.entries()) {
+      const target = { section, table_id: table.id };
+      for (const field of changedFields(before[index], table).filter((field) => field !== "items" && field !== "id")) {
+        ops.sets.push({ op: "set", ...target, field, value: table[field] ?? null });
+      }
+      if (!diffRows(target, before[index].items || [], table.items || [], ops)) return null;
+    }
+  }
+  if (!diffRows({ section: "operations" }, original.operations || [], edited.operations || [], ops)) return null;
+  return [...ops.sets, ...ops.deletes, ...ops.inserts];
+}
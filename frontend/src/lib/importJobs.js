@@ -0,0 +1,119 @@
+import axios from "axios";
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+const FINISHED = ["completed", "failed", "cancelled"];
+
+// Uploads are processed as background import jobs; poll until one finishes
+export async function waitForImportJob(jobId, interval = 1000) {
+  for (;;) {
+    const response = await axios.get(`${API}/import-jobs/${jobId}`);
+    if (FINISHED.includes(response.data.status)) {
+      return response.data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+}
+
+// Files at least this large go through the resumable upload endpoints
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+const CHUNK_RETRIES = 5;
+// A chunk cut off mid-way keeps its session locked (409) until the server
+// drops it; keep retrying for longer than the server's chunk lock
+const LOCKED_RETRY_MS = 90 * 1000;
+const LOCKED_RETRY_INTERVAL_MS = 5000;
+
+async function sha256Hex(blob) {
+  const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, "0")).join("");
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Upload sessions are remembered per file, so a reload resumes instead of restarting
+function uploadStorageKey(file, session) {
+  return `upload:${JSON.stringify([file.name, file.size, file.lastModified, session])}`;
+}
+
+async function openUploadSession(file, session, storageKey) {
+  const saved = JSON.parse(localStorage.getItem(storageKey) || "null");
+  if (saved) {
+    try {
+      const response = await axios.get(`${API}/uploads/${saved.uploadId}`);
+      return { ...saved, offset: response.data.offset };
+    } catch (error) {
+      if (error.response?.status !== 404) throw error;
+      // Expired or finished; start a new one
+    }
+  }
+  const created = await axios.post(`${API}/uploads`, { filename: file.name, size: file.size, ...session });
+  const opened = { uploadId: created.data.upload_id, chunkSize: created.data.chunk_size };
+  localStorage.setItem(storageKey, JSON.stringify(opened));
+  return { ...opened, offset: 0 };
+}
+
+// Send a file in checksummed chunks. After a failed chunk, ask the server how
+// much it has and carry on from there instead of starting over.
+async function uploadResumable(file, session) {
+  const storageKey = uploadStorageKey(file, session);
+  let { uploadId, chunkSize, offset } = await openUploadSession(file, session, storageKey);
+  let failures = 0;
+  let lockedSince = null;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + chunkSize);
+    try {
+      const response = await axios.put(`${API}/uploads/${uploadId}`, chunk, {
+        params: { offset },
+        headers: { "Content-Type": "application/octet-stream", "X-Chunk-SHA256": await sha256Hex(chunk) }
+      });
+      offset = response.data.offset;
+      failures = 0;
+      lockedSince = null;
+    } catch (error) {
+      const status = error.response?.status;
+      if (status === 404) {
+        localStorage.removeItem(storageKey);
+      }
+      if ([401, 403, 404, 413].includes(status)) {
+        throw error;
+      }
+      if (status === 409) {
+        // An earlier attempt at this chunk still holds the lock
+        lockedSince = lockedSince ?? Date.now();
+        if (Date.now() - lockedSince > LOCKED_RETRY_MS) {
+          throw error;
+        }
+        await sleep(LOCKED_RETRY_INTERVAL_MS);
+      } else {
+        failures += 1;
+        if (failures > CHUNK_RETRIES) {
+          throw error;
+        }
+        await sleep(1000 * 2 ** failures);
+      }
+      try {
+        offset = (await axios.get(`${API}/uploads/${uploadId}`)).data.offset;
+      } catch {
+        // Still offline; retry the same chunk
+      }
+    }
+  }
+  const response = await axios.post(`${API}/uploads/${uploadId}/complete`);
+  localStorage.removeItem(storageKey);
+  return response.data;
+}
+
+// Start an import job from a file; returns the { job_id } response
+export async function startImport(file, { url, params, session }) {
+  if (file.size >= RESUMABLE_THRESHOLD && window.crypto?.subtle) {
+    return uploadResumable(file, { ...session, ...params });
+  }
+  const formData = new FormData();
+  formData.append("file", file);
+  const response = await axios.post(url, formData, {
+    params,
+    headers: { "Content-Type": "multipart/form-data" }
+  });
+  return response.data;
+}
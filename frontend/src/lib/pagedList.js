@@ -0,0 +1,14 @@
+import axios from "axios";
+
+// List endpoints return one page at a time and put the cursor of the next
+// page in X-Next-Cursor. Fetch every page; resolves to { data } like axios.get.
+export async function getAllPages(url, config = {}) {
+  const data = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, { ...config, params: { ...config.params, ...(cursor && { cursor }) } });
+    data.push(...response.data);
+    cursor = response.headers["x-next-cursor"];
+  } while (cursor);
+  return { data };
+}
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+from server import (ALGORITHM, SECRET_KEY, RevocationFilter, User, create_access_token, get_current_user,
+                    user_token_claims)
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for doc in self.docs:
+            yield doc
+
+class FakeUsers:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+
+    async def find_one(self, query, projection=None):
+        self.queries.append(query)
+        return next((dict(doc) for doc in self.docs if all(doc.get(key) == value for key, value in query.items())), None)
+
+class FakeRevocations:
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query, projection=None):
+        after = query.get("revoked_at", {}).get("$gt", float("-inf"))
+        return FakeCursor([doc for doc in self.docs if doc["revoked_at"] > after])
+
+USER = User(id="u1", username="planner", email="planner@example.com", role="production_manager")
+
+@pytest.fixture
+def users(monkeypatch):
+    users = FakeUsers([{**USER.model_dump(), "password": "hash"}])
+    monkeypatch.setattr(server, "db", SimpleNamespace(users=users, token_revocations=FakeRevocations()))
+    monkeypatch.setattr(server, "revocations", RevocationFilter())
+    return users
+
+def authenticate(token):
+    return asyncio.run(get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)))
+
+def claims(token):
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def assert_rejected(token, detail):
+    with pytest.raises(HTTPException) as raised:
+        authenticate(token)
+    assert (raised.value.status_code, raised.value.detail) == (401, detail)
+
+# get_current_user
+def test_claims_token_builds_the_user_without_a_db_read(users):
+    user = authenticate(create_access_token(user_token_claims(USER)))
+    assert user == USER
+    assert users.queries == []
+
+def test_legacy_token_loads_the_user(users):
+    user = authenticate(create_access_token({"sub": USER.email}))
+    assert user == USER
+    assert users.queries == [{"email": USER.email}]
+
+def test_jti_revocation_rejects_only_that_token(users):
+    revoked, other = create_access_token(user_token_claims(USER)), create_access_token(user_token_claims(USER))
+    server.revocations.add(f"jti:{claims(revoked)['jti']}", time.time())
+    assert_rejected(revoked, "Token revoked")
+    assert authenticate(other) == USER
+
+def test_user_revocation_rejects_tokens_issued_up_to_it(users):
+    before = create_access_token(user_token_claims(USER))
+    revoked_at = claims(before)["iat"]
+    server.revocations.add(f"user:{USER.id}", revoked_at)
+    time.sleep(0.001)
+    after = create_access_token(user_token_claims(USER))
+
+    assert_rejected(before, "Token revoked")
+    assert revoked_at < claims(after)["iat"] < revoked_at + 1
+    assert authenticate(after) == USER
+    other_user = USER.model_copy(update={"id": "u2"})
+    assert authenticate(create_access_token(user_token_claims(other_user))).id == "u2"
+
+# RevocationFilter
+def test_growing_keeps_every_earlier_key():
+    revocations = RevocationFilter(capacity=4)
+    for n in range(20):
+        revocations.add(f"jti:{n}", 100.0)
+    assert revocations.capacity == 32
+    assert all(f"jti:{n}" in revocations.bloom for n in range(20))
+    assert all(revocations.is_revoked(str(n), None, 0.0) for n in range(20))
+    assert not revocations.is_revoked("20", None, 0.0)
+
+def test_refresh_reads_back_over_the_overlap(users):
+    revocations = RevocationFilter(overlap=60)
+    log = server.db.token_revocations.docs
+    now = time.time()
+    log.append({"key": "jti:a", "revoked_at": now - 10})
+    asyncio.run(revocations.refresh())
+    assert revocations.is_revoked("a", None, 0.0)
+
+    # Stamped by a clock running behind, or inserted after the previous refresh read past it
+    refreshed_at = revocations.refreshed_at
+    log.append({"key": "jti:late", "revoked_at": refreshed_at - 30})
+    log.append({"key": "jti:old", "revoked_at": refreshed_at - 120})
+    asyncio.run(revocations.refresh())
+    assert revocations.is_revoked("late", None, 0.0)
+    assert not revocations.is_revoked("old", None, 0.0)
+    assert revocations.refreshed_at >= refreshed_at
+
+def test_refresh_forgets_revocations_older_than_the_token_lifetime(users):
+    revocations = RevocationFilter(capacity=4, lifetime=3600)
+    now = time.time()
+    for n in range(10):
+        revocations.add(f"jti:{n}", now - 7200)
+    revocations.add(f"user:{USER.id}", now - 60)
+    assert revocations.capacity == 16
+
+    asyncio.run(revocations.refresh())
+    assert list(revocations.entries) == [f"user:{USER.id}"]
+    assert revocations.capacity == 4
+    assert revocations.is_revoked(None, USER.id, now - 120)
+    assert not revocations.is_revoked("0", None, 0.0)
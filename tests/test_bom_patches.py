@@ -0,0 +1,146 @@
+import copy
+
+import pytest
+from fastapi import HTTPException
+from pymongo import DeleteMany, InsertOne, ReplaceOne
+
+from server import BOMPatchOperation, BOMPatchPlan, assign_row_ids, bom_line_writes
+
+def make_bom():
+    bom = {
+        "id": "bom1",
+        "header": {"styleName": "Tee"},
+        "fabricTables": [{"id": 1, "name": "Body", "items": [{"srNo": 1, "fabricQuality": "Jersey"},
+                                                             {"srNo": 2, "fabricQuality": "Rib"}]}],
+        "trimsTables": [{"id": 1, "name": "Trims", "items": [{"srNo": 1, "trimType": "Label"}]}],
+        "operations": [{"srNo": 1, "operation": "Cutting"}]
+    }
+    assign_row_ids(bom)
+    return bom
+
+def row_id(bom, key, position):
+    return bom[key][0]["items"][position]["rowId"]
+
+def plan_for(bom, *operations):
+    plan = BOMPatchPlan(bom)
+    plan.apply([BOMPatchOperation(**operation) for operation in operations])
+    return plan
+
+# BOMPatchPlan
+def test_cell_sets_use_array_filters():
+    bom = make_bom()
+    first = row_id(bom, "fabricTables", 0)
+    plan = plan_for(bom, {"op": "set", "section": "header", "field": "styleName", "value": "Polo"},
+                    {"op": "set", "section": "trims", "table_id": 1, "field": "name", "value": "Labels"},
+                    {"op": "set", "section": "fabric", "table_id": 1, "row_id": first, "field": "fabricQuality",
+                     "value": "Pique"})
+    update = plan.update(3, "planner")
+
+    assert bom["header"]["styleName"] == "Polo" and bom["fabricTables"][0]["items"][0]["fabricQuality"] == "Pique"
+    assert update["$set"]["header.styleName"] == "Polo"
+    assert update["$set"]["trimsTables.$[t0].name"] == "Labels"
+    assert update["$set"]["fabricTables.$[t1].items.$[r2].fabricQuality"] == "Pique"
+    assert "fabricTables.$[t1].items.$[r2].greigeFabricNeed" in update["$set"]
+    assert update["$set"]["part_versions.header"] == 3 and update["$set"]["updated_by"] == "planner"
+    assert plan.array_filters(update) == [{"t0.id": 1}, {"t1.id": 1}, {"r2.rowId": first}]
+    assert [changed["row"]["rowId"] for changed in plan.changed] == [first]
+
+def test_inserts_and_deletes_of_separate_lists_push_and_pull():
+    bom = make_bom()
+    last = row_id(bom, "fabricTables", 1)
+    plan = plan_for(bom, {"op": "delete_row", "section": "fabric", "table_id": 1, "row_id": last},
+                    {"op": "insert_row", "section": "operations", "row": {"operation": "Sewing"}})
+    update = plan.update(1, "planner")
+
+    assert [row["fabricQuality"] for row in bom["fabricTables"][0]["items"]] == ["Jersey"]
+    assert update["$pull"] == {"fabricTables.$[t0].items": {"rowId": {"$in": [last]}}}
+    (inserted,) = update["$push"]["operations"]["$each"]
+    assert inserted["operation"] == "Sewing" and inserted["srNo"] == 2 and inserted["rowId"]
+    assert "$position" not in update["$push"]["operations"]
+    assert plan.parts == {"fabricTables:1", "operations"}
+
+def test_a_row_list_edited_in_several_ways_is_written_whole():
+    bom = make_bom()
+    first, last = row_id(bom, "fabricTables", 0), row_id(bom, "fabricTables", 1)
+    plan = plan_for(bom, {"op": "set", "section": "fabric", "table_id": 1, "row_id": first, "field": "color",
+                          "value": "Navy"},
+                    {"op": "delete_row", "section": "fabric", "table_id": 1, "row_id": last},
+                    {"op": "insert_row", "section": "fabric", "table_id": 1, "row": {"fabricQuality": "Fleece"}})
+    update = plan.update(1, "planner")
+
+    assert "$push" not in update and "$pull" not in update
+    rows = update["$set"]["fabricTables.$[t0].items"]
+    assert [row["fabricQuality"] for row in rows] == ["Jersey", "Fleece"] and rows[0]["color"] == "Navy"
+    assert not any(path.startswith("fabricTables.$[t0].items.") for path in update["$set"])
+    # The row filter is no longer used; Mongo refuses unused identifiers
+    assert plan.array_filters(update) == [{"t0.id": 1}]
+
+def test_positioned_insert_with_other_inserts_rewrites_the_list():
+    bom = make_bom()
+    plan = plan_for(bom, {"op": "insert_row", "section": "operations", "row": {"operation": "Sewing"}},
+                    {"op": "insert_row", "section": "operations", "row": {"operation": "Washing"}, "position": 0})
+    update = plan.update(1, "planner")
+    assert "$push" not in update
+    assert [row["operation"] for row in update["$set"]["operations"]] == ["Washing", "Cutting", "Sewing"]
+    assert plan.array_filters(update) is None
+
+def test_deleted_rows_are_not_reported_as_changed():
+    bom = make_bom()
+    first = row_id(bom, "fabricTables", 0)
+    plan = plan_for(bom, {"op": "set", "section": "fabric", "table_id": 1, "row_id": first, "field": "color",
+                          "value": "Navy"},
+                    {"op": "delete_row", "section": "fabric", "table_id": 1, "row_id": first})
+    assert plan.changed == []
+
+def test_reorder_renumbers_rows():
+    bom = make_bom()
+    first, last = row_id(bom, "fabricTables", 0), row_id(bom, "fabricTables", 1)
+    plan = plan_for(bom, {"op": "reorder_rows", "section": "fabric", "table_id": 1, "row_ids": [last, first]})
+    rows = plan.update(1, "planner")["$set"]["fabricTables.$[t0].items"]
+    assert [(row["rowId"], row["srNo"]) for row in rows] == [(last, 1), (first, 2)]
+
+@pytest.mark.parametrize("operation, status_code", [
+    ({"op": "set", "section": "fabric", "table_id": 9, "field": "name", "value": "x"}, 404),
+    ({"op": "delete_row", "section": "operations", "row_id": "missing"}, 404),
+    ({"op": "set", "section": "header", "field": "id", "value": "x"}, 400),
+    ({"op": "set", "section": "header", "field": "a.b", "value": "x"}, 400),
+    ({"op": "set", "section": "operations", "field": "operation", "value": "x"}, 400),
+    ({"op": "insert_row", "section": "header", "row": {}}, 400),
+    ({"op": "insert_row", "section": "operations", "row": {"$where": 1}}, 400),
+    ({"op": "reorder_rows", "section": "operations", "row_ids": ["missing"]}, 400)
+])
+def test_bad_operations_are_rejected(operation, status_code):
+    with pytest.raises(HTTPException) as raised:
+        plan_for(make_bom(), {"op": "set", "section": "header", "field": "styleName", "value": "Polo"}, operation)
+    assert raised.value.status_code == status_code
+    assert raised.value.detail.startswith("Operation 1:")
+
+# bom_line_writes
+def test_line_writes_cover_changed_new_and_removed_rows():
+    before = make_bom()
+    after = copy.deepcopy(before)
+    kept, removed = after["fabricTables"][0]["items"]
+    kept["fabricQuality"] = "Pique"
+    after["fabricTables"][0]["items"] = [kept]
+    after["operations"].append({"srNo": 2, "operation": "Sewing"})
+    assign_row_ids(after)
+
+    replace, insert, delete = bom_line_writes(before, after)
+    assert isinstance(replace, ReplaceOne)
+    assert replace._filter == {"bom_id": "bom1", "rowId": kept["rowId"], "section": "fabric", "table_id": 1}
+    assert replace._doc["fabricQuality"] == "Pique" and replace._doc["position"] == 0
+    assert isinstance(insert, InsertOne)
+    assert insert._doc["operation"] == "Sewing" and insert._doc["section"] == "operations"
+    assert insert._doc["table_id"] is None and insert._doc["position"] == 1
+    assert isinstance(delete, DeleteMany)
+    assert delete._filter == {"bom_id": "bom1", "rowId": {"$in": [removed["rowId"]]}, "section": "fabric",
+                              "table_id": 1}
+
+def test_line_writes_rewrite_rows_whose_position_moved():
+    before = make_bom()
+    after = copy.deepcopy(before)
+    after["fabricTables"][0]["items"].reverse()
+    writes = bom_line_writes(before, after)
+    assert all(isinstance(write, ReplaceOne) for write in writes)
+    assert sorted(write._doc["position"] for write in writes) == [0, 1]
+    assert bom_line_writes(before, copy.deepcopy(before)) == []
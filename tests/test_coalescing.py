@@ -0,0 +1,72 @@
+import asyncio
+
+from fastapi import FastAPI, Response
+
+from server import RequestCoalescer, User, create_access_token, user_token_claims
+
+def token_for(user_id):
+    user = User(id=user_id, username=user_id, email=f"{user_id}@example.com", role="user")
+    return create_access_token(user_token_claims(user))
+
+def coalesced_app():
+    app, coalescer, calls = FastAPI(), RequestCoalescer(), []
+    app.middleware("http")(coalescer.dispatch)
+
+    @app.get("/api/colors")
+    async def colors(response: Response):
+        calls.append(1)
+        # Long enough for every request of a burst to arrive while this one runs
+        await asyncio.sleep(0.05)
+        response.headers.append("set-cookie", "a=1")
+        response.headers.append("set-cookie", "b=2")
+        return [{"id": "c1"}]
+
+    return app, coalescer, calls
+
+async def get(app, path, query="", headers=()):
+    """Status, raw headers and body of a GET sent straight to the ASGI app"""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": [(name.encode(), value.encode()) for name, value in headers],
+             "client": ("testclient", 1), "server": ("testserver", 80)}
+    received, messages = [], []
+
+    async def receive():
+        if received:
+            await asyncio.Event().wait()
+        received.append(1)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    return start["status"], start["headers"], b"".join(message.get("body", b"") for message in messages[1:])
+
+def burst(app, *requests):
+    async def run():
+        return await asyncio.gather(*(get(app, "/api/colors", **request) for request in requests))
+    return asyncio.run(run())
+
+def test_identical_gets_of_one_user_run_the_route_once():
+    app, coalescer, calls = coalesced_app()
+    auth = ("authorization", f"Bearer {token_for('u1')}")
+    leader, follower = burst(app, {"headers": [auth]}, {"headers": [auth]})
+
+    assert len(calls) == 1 and coalescer.stats["coalesced"] == 1
+    assert leader == follower
+    status, headers, body = follower
+    assert status == 200 and body == b'[{"id":"c1"}]'
+    assert [value for name, value in headers if name == b"set-cookie"] == [b"a=1", b"b=2"]
+    assert (b"content-length", str(len(body)).encode()) in headers
+    assert coalescer.in_flight == {}
+
+def test_requests_that_must_not_share_a_response_run_separately():
+    app, coalescer, calls = coalesced_app()
+    first, second = ("authorization", f"Bearer {token_for('u1')}"), ("authorization", f"Bearer {token_for('u2')}")
+    burst(app, {"headers": [first]}, {"headers": [second]},
+          {"headers": [first, ("cache-control", "no-cache")]}, {"headers": [first], "query": "stream=true"})
+
+    assert len(calls) == 4
+    assert coalescer.stats["coalesced"] == 0 and coalescer.stats["bypassed"] == 2
@@ -0,0 +1,225 @@
+import asyncio
+import uuid
+
+import pandas as pd
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from server import (FieldValidator, SheetImporter, content_hash, csv_chunks, import_results, parquet_chunks,
+                    parse_article_row)
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for doc in self.docs:
+            yield doc
+
+class FakeBulkResult:
+    def __init__(self, details):
+        self.bulk_api_result = details
+
+class FakeInsertResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+class FakeCollection:
+    """Just enough of a Motor collection for SheetImporter: lookups by code, inserts and upserts"""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+        self.operations = []
+
+    def find(self, query, projection=None):
+        codes = query.get("code", {}).get("$in", [])
+        return FakeCursor([doc for doc in self.docs if doc.get("code") in codes])
+
+    async def insert_many(self, docs, ordered=True):
+        ids = {doc["id"] for doc in self.docs}
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc["id"] in ids:
+                errors.append({"index": index, "code": 11000, "keyPattern": {"id": 1}, "errmsg": "duplicate id"})
+            else:
+                ids.add(doc["id"])
+                self.docs.append(doc)
+        if errors:
+            raise BulkWriteError({"nInserted": len(docs) - len(errors), "writeErrors": errors})
+        return FakeInsertResult([doc["id"] for doc in docs])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations += operations
+        existing = {doc["code"] for doc in self.docs}
+        upserted = sum(1 for operation in operations if operation._filter["code"] not in existing)
+        matched = len(operations) - upserted
+        return FakeBulkResult({"nUpserted": upserted, "nMatched": matched, "nModified": matched})
+
+def article(code, description="From the app"):
+    doc = parse_article_row((code,))[1]
+    doc["description"] = description
+    doc["content_hash"] = content_hash(doc, {"name", "description", "buyer_id"})
+    return doc
+
+def importer_for(collection, mode="upsert", dry_run=False, **options):
+    results = import_results("masters", mode, dry_run)
+    importer = SheetImporter("articles", "articles_added", "Article sheet", results,
+                             natural_key=["code"] if mode == "upsert" else None, actor="tester", dry_run=dry_run,
+                             **options)
+    importer.collection = collection
+    return importer, results
+
+def run_rows(importer, rows):
+    async def run():
+        for row_idx, (code, doc) in enumerate(rows, start=2):
+            await importer.add(row_idx, code, doc)
+        await importer.flush()
+    asyncio.run(run())
+
+def sheet_row(code):
+    parsed = parse_article_row((code,))
+    parsed[1]["content_hash"] = content_hash(parsed[1], {"name", "description", "buyer_id"})
+    return parsed
+
+# Insert mode
+def test_insert_mode_skips_existing_and_repeated_codes():
+    collection = FakeCollection([article("A1")])
+    importer, results = importer_for(collection, mode="insert")
+    run_rows(importer, [sheet_row("A1"), sheet_row("B2"), sheet_row("B2")])
+    assert [doc["code"] for doc in collection.docs] == ["A1", "B2"]
+    assert results["articles_added"] == 1
+
+# Resuming
+def test_resumed_rows_count_as_inserted_instead_of_duplicating():
+    row_ids = uuid.uuid4()
+    collection = FakeCollection()
+    rows = [(None, {"name": f"Row {n}", "id": str(uuid.uuid4())}) for n in range(3)]
+    run_rows(importer_for(collection, mode="insert", row_ids=row_ids)[0], rows[:2])
+
+    # A takeover re-reads the rows after the last checkpoint, with fresh random ids
+    resumed = [(None, {**doc, "id": str(uuid.uuid4())}) for _, doc in rows]
+    importer, results = importer_for(collection, mode="insert", row_ids=row_ids)
+    run_rows(importer, resumed)
+    assert len(collection.docs) == 3
+    assert results["articles_added"] == 3 and results["errors"] == []
+
+# FieldValidator
+FIELDS = [
+    {"name": "code", "label": "Code", "type": "text", "required": True, "order": 0},
+    {"name": "qty", "type": "number", "validation": {"min": 0}, "order": 1},
+    {"name": "kind", "type": "dropdown", "options": ["A", "B"], "order": 2},
+    {"name": "active", "type": "checkbox", "order": 3},
+    {"name": "due", "label": "Due date", "type": "date", "order": 4}
+]
+
+def test_headers_match_field_names_and_labels_ignoring_case():
+    validator = FieldValidator(FIELDS)
+    assert validator.column_names(["Code", "QTY", "kind", "active", "Due Date", "Extra", "Extra", None]) == \
+        ["code", "qty", "kind", "active", "due", "Extra", None, None]
+
+def test_validator_coerces_valid_rows_and_reports_rejects():
+    validator = FieldValidator(FIELDS)
+    names = validator.column_names(["Code", "QTY", "kind", "active", "Due Date", "Extra"])
+    frame = pd.DataFrame([
+        ["C1", "5", " a ", "yes", "2025-01-02", "x"],
+        ["", "1.5", "c", "maybe", "soon", None],
+        [None] * 6,
+        ["C2", "-1", None, None, None, None]
+    ], columns=range(6), dtype=object)
+    valid, rejected, below_min = validator.validate(names, {"created_by": "tester"}, [2, 3, 4, 5], frame)
+
+    row_idx, _, doc, error = valid
+    assert (row_idx, error) == (2, None)
+    assert {key: doc[key] for key in ("code", "qty", "kind", "active", "Extra", "created_by")} == \
+        {"code": "C1", "qty": 5, "kind": "A", "active": True, "Extra": "x", "created_by": "tester"}
+    assert doc["due"] == pd.Timestamp("2025-01-02", tz="UTC")
+    assert rejected == (3, None, None, "Code is required; qty must be a whole number; kind must be one of A, B; "
+                                       "active must be yes or no; Due date must be a date")
+    assert below_min == (5, None, None, "qty must be at least 0")
+
+# Upserts
+def test_content_hash_ignores_history_and_excluded_fields():
+    doc = {"code": "A1", "name": "Tee", "id": "1", "created_at": "x", "updated_by": "u"}
+    same = {"name": "Tee", "code": "A1", "id": "2", "created_at": "y"}
+    assert content_hash(doc) == content_hash(same)
+    assert content_hash(doc) != content_hash({**doc, "name": "Polo"})
+    assert content_hash(doc, {"name"}) == content_hash({**doc, "name": "Polo"}, {"name"})
+
+def test_upsert_skips_rows_whose_hash_is_unchanged():
+    collection = FakeCollection([article("A1")])
+    importer, results = importer_for(collection, defaults=frozenset({"name", "description", "buyer_id"}))
+    run_rows(importer, [sheet_row("A1")])
+    assert collection.operations == []
+    assert results["unchanged_count"] == 1
+
+def test_upsert_sets_parser_defaults_only_on_insert():
+    stored = article("A1")
+    stored["content_hash"] = "stale"
+    collection = FakeCollection([stored])
+    importer, results = importer_for(collection, defaults=frozenset({"name", "description", "buyer_id"}))
+    run_rows(importer, [sheet_row("A1"), sheet_row("B2")])
+
+    update, insert = collection.operations
+    assert isinstance(update, UpdateOne) and update._filter == {"code": "A1"}
+    assert "description" not in update._doc["$set"] and "buyer_id" not in update._doc["$set"]
+    assert update._doc["$setOnInsert"]["description"] == "Article A1"
+    assert update._doc["$set"]["updated_by"] == "tester"
+    assert insert._filter == {"code": "B2"} and "updated_at" not in insert._doc["$set"]
+    assert results["articles_added"] == 1 and results["updated_count"] == 1
+
+def test_upsert_keeps_the_last_row_of_a_repeated_key():
+    collection = FakeCollection()
+    importer, _ = importer_for(collection)
+    first, last = sheet_row("A1"), sheet_row("A1")
+    last[1]["description"] = "Second"
+    run_rows(importer, [first, last])
+    (operation,) = collection.operations
+    assert operation._doc["$set"]["description"] == "Second"
+
+# Chunk readers
+def read_all(chunks):
+    return [(headers, rows, frame.values.tolist()) for headers, rows, frame in chunks]
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({"Item Type": [f"T{n}" for n in range(5)], "GSM": [str(n) for n in range(5)]})
+
+def test_csv_chunks_number_rows_like_a_spreadsheet(tmp_path, table):
+    path = tmp_path / "fabrics.csv"
+    table.to_csv(path, index=False)
+    chunks = read_all(csv_chunks(str(path), {"resume_after": 1}, 2))
+    assert [rows for _, rows, _ in chunks] == [[2, 3], [4, 5], [6]]
+    assert chunks[0][0] == ["Item Type", "GSM"]
+    assert chunks[2][2] == [["T4", "4"]]
+
+def test_csv_chunks_resume_after_a_row(tmp_path, table):
+    path = tmp_path / "fabrics.csv"
+    table.to_csv(path, index=False)
+    chunks = read_all(csv_chunks(str(path), {"resume_after": 3}, 2))
+    assert [rows for _, rows, _ in chunks] == [[4, 5], [6]]
+    assert chunks[0][2][0] == ["T2", "2"]
+
+def test_parquet_chunks_resume_inside_a_batch(tmp_path, table):
+    path = tmp_path / "fabrics.parquet"
+    table.to_parquet(path, index=False, row_group_size=2)
+    chunks = read_all(parquet_chunks(str(path), {"resume_after": 4}, 2))
+    assert [rows for _, rows, _ in chunks] == [[5], [6]]
+    assert chunks[0][0] == ["Item Type", "GSM"]
+    assert [values for _, _, values in chunks] == [[["T3", "3"]], [["T4", "4"]]]
+
+# Dry runs
+def test_dry_run_counts_without_writing():
+    stored = article("A1")
+    stored["content_hash"] = "stale"
+    collection = FakeCollection([stored, article("C3")])
+    importer, results = importer_for(collection, dry_run=True, defaults=frozenset({"name", "description", "buyer_id"}))
+    run_rows(importer, [sheet_row("A1"), sheet_row("B2"), sheet_row("B2")])
+    assert collection.operations == []
+    assert (results["articles_added"], results["updated_count"], results["unchanged_count"]) == (1, 1, 0)
+    # A repeated key is previewed from its last row; defaults aren't changes
+    assert [sample["row"] for sample in results["preview"]["insert"]] == [4]
+    assert results["preview"]["update"][0]["changes"] == {}
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from server import decode_cursor, encode_cursor, keyset_query
+
+def test_cursor_round_trips_dates_and_strings():
+    created = datetime(2025, 3, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor({"created_at": created, "id": "a1"}, "created_at")) == (created, "a1")
+    assert decode_cursor(encode_cursor({"name": "Navy", "id": "b2"}, "name")) == ("Navy", "b2")
+    assert decode_cursor(encode_cursor({"id": "c3"}, "sort_order")) == (None, "c3")
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor({"name": "??>>", "id": "x"}, "name")
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", "!"])
+def test_bad_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+def test_keyset_query_without_cursor_is_the_query():
+    assert keyset_query({"status": "open"}, None, "created_at") == {"status": "open"}
+
+def test_keyset_query_continues_after_the_last_row():
+    created = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    cursor = encode_cursor({"created_at": created, "id": "a1"}, "created_at")
+    assert keyset_query({}, cursor, "created_at") == {"$or": [
+        {"created_at": {"$gt": created}},
+        {"created_at": created, "id": {"$gt": "a1"}}
+    ]}
+    assert keyset_query({"status": "open"}, cursor, "created_at")["$and"][0] == {"status": "open"}
+
+def test_keyset_query_after_a_row_without_the_sort_field():
+    cursor = encode_cursor({"id": "a1"}, "sort_order")
+    assert keyset_query({}, cursor, "sort_order") == {"$or": [
+        {"sort_order": {"$ne": None}},
+        {"sort_order": None, "id": {"$gt": "a1"}}
+    ]}
+
+def test_keyset_query_after_a_legacy_string_date_includes_bson_dates():
+    cursor = encode_cursor({"created_at": "2024-01-01T00:00:00", "id": "a1"}, "created_at")
+    assert {"created_at": {"$type": "date"}} in keyset_query({}, cursor, "created_at")["$or"]